@@ -0,0 +1,88 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from heating_emissions.components.census_grid import CELL_KEY_FACTOR, CELL_SIZE, format_raster_ids, index_by_raster_id
+
+log = logging.getLogger(__name__)
+
+# Upper limit of the cells per layer in the aggregated gridded output mode, larger AOIs are aggregated to 200 m,
+# 400 m, ... cells until they stay below it
+AGGREGATED_MAX_CELLS = 100_000
+# Absolute quantities are summed over the aggregated cells, intensive quantities are averaged weighted by population
+# and class columns get their most common class
+ABSOLUTE_COLUMNS = ['population', 'direct_co2_emissions', 'life_cycle_co2_emissions', 'yearly_emissions']
+INTENSIVE_COLUMNS = [
+    'direct_co2_emissions_per_capita',
+    'life_cycle_co2_emissions_per_capita',
+    'heat_consumption',
+    'average_sqm_per_person',
+    'direct_emission_factor',
+    'life_cycle_emission_factor',
+]
+CLASS_COLUMNS = ['dominant_age', 'dominant_energy']
+
+
+def get_aggregation_level(cells: pd.DataFrame, max_cells: int = AGGREGATED_MAX_CELLS) -> int:
+    """Get the lowest level at which the cells aggregate to at most `max_cells` cells, see `aggregate_cells`."""
+    level = 0
+    while len(np.unique(get_aggregated_cell_keys(cells, level))) > max_cells:
+        level += 1
+    log.debug(f'Aggregating {len(cells)} cells to {CELL_SIZE * 2**level} m cells')
+    return level
+
+
+def get_aggregated_cell_keys(cells: pd.DataFrame, level: int) -> np.ndarray:
+    """Get the keys of the aggregated cells the census cells lie in, like the cell keys of a grid of coarser cells."""
+    aggregated_size = CELL_SIZE * 2**level
+    columns = cells['x_mp_100m'].to_numpy(dtype=np.int64) // aggregated_size
+    rows = cells['y_mp_100m'].to_numpy(dtype=np.int64) // aggregated_size
+    return rows * CELL_KEY_FACTOR + columns
+
+
+def aggregate_cells(cells: pd.DataFrame, level: int) -> pd.DataFrame:
+    """Aggregate the 100-m cells into square cells of 2**level x 2**level census cells for the gridded artifacts.
+
+    Absolute quantities are given per 100-m cell: they are summed over the aggregated cell and divided by the number of
+    census cells it covers, so the layers keep their legends. Intensive quantities are averaged weighted by population,
+    or by cell if an aggregated cell has no population, and classes are replaced by the most common class.
+
+    :return: the aggregated cells with their centres as `x_mp_100m` and `y_mp_100m`, indexed by their raster ids.
+        Cells at level 0 are kept as they are.
+    """
+    if level == 0:
+        return index_by_raster_id(cells, name='index')
+
+    aggregated_size = CELL_SIZE * 2**level
+    aggregated_keys = pd.Index(get_aggregated_cell_keys(cells, level), name='aggregated_key')
+    absolute_columns = [column for column in ABSOLUTE_COLUMNS if column in cells]
+    intensive_columns = [column for column in INTENSIVE_COLUMNS if column in cells]
+    class_columns = [column for column in CLASS_COLUMNS if column in cells]
+
+    absolute = cells[absolute_columns].set_axis(aggregated_keys, axis='index').groupby(level=0).sum() / 4**level
+    aggregated = [absolute]
+
+    if intensive_columns:
+        intensive = cells[intensive_columns].set_axis(aggregated_keys, axis='index')
+        population = cells['population'].fillna(0).set_axis(aggregated_keys)
+        population_sums = population.groupby(level=0).sum()
+        weighted_means = intensive.mul(population, axis='index').groupby(level=0).sum()
+        weighted_means = weighted_means.div(population_sums.where(population_sums > 0), axis='index')
+        aggregated.append(weighted_means.fillna(intensive.groupby(level=0).mean()))
+
+    for column in class_columns:
+        class_counts = pd.DataFrame(
+            {'aggregated_key': aggregated_keys, column: cells[column].to_numpy()}
+        ).value_counts()
+        # The counts are sorted in descending order, so the first class of each aggregated cell is its most common
+        most_common = class_counts.reset_index().drop_duplicates('aggregated_key').set_index('aggregated_key')
+        aggregated.append(most_common[column])
+
+    aggregated = pd.concat(aggregated, axis='columns').sort_index()
+    columns = aggregated.index.to_numpy() % CELL_KEY_FACTOR
+    rows = aggregated.index.to_numpy() // CELL_KEY_FACTOR
+    aggregated.insert(0, 'x_mp_100m', columns * aggregated_size + aggregated_size // 2)
+    aggregated.insert(1, 'y_mp_100m', rows * aggregated_size + aggregated_size // 2)
+    raster_ids = format_raster_ids(rows * aggregated_size, columns * aggregated_size, cell_size=aggregated_size)
+    return aggregated.set_axis(pd.Index(raster_ids, name='index'), axis='index')
@@ -1,13 +1,55 @@
+import io
+import json
+import os
+import uuid
 from dataclasses import dataclass
+from datetime import datetime, timezone
+from enum import StrEnum
+from functools import cached_property
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import shapely
 from climatoology.base.exception import ClimatoologyUserError
 from climatoology.base.logging import get_climatoology_logger
-from geoalchemy2 import WKTElement
-from sqlalchemy import Engine, MetaData, select
-
+from geoalchemy2 import Geometry
+from pyarrow import csv as arrow_csv
+from sqlalchemy import (
+    Column,
+    ColumnElement,
+    Engine,
+    Float,
+    Integer,
+    MetaData,
+    Select,
+    String,
+    Table,
+    func,
+    inspect,
+    literal,
+    select,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from heating_emissions.components.census_grid import (
+    CELL_KEY_FACTOR,
+    CELL_SIZE,
+    CENSUS_TILE_SIZE,
+    cell_keys_from_coordinates,
+    cell_keys_to_tiles,
+    get_cell_id_ranges,
+    get_cell_tiles,
+    get_tile_cell_id_ranges,
+    get_tiles_intersecting,
+    index_by_cell_key,
+    rasterize_aoi,
+)
+from heating_emissions.components.profiling import profile_stage
 from heating_emissions.components.utils import (
     BUILDING_AGES,
     EMISSION_FACTORS_DIRECT,
@@ -17,59 +59,569 @@ from heating_emissions.components.utils import (
     postprocess_uncalculated_census_data,
 )
 
+if TYPE_CHECKING:
+    from psycopg import Copy
+
 log = get_climatoology_logger(__name__)
 
 
+CENSUS_SCHEMA = 'census_de'
+
+# The census columns used from each table, excluding the raster id they are keyed by
+CENSUS_TABLE_COLUMNS = {
+    'census_de.population': ['population'],
+    'census_de.residential_living_space': ['average_sqm_per_person'],
+    'census_de.residential_buildings_by_year': [age for age in BUILDING_AGES if age != 'unknown'],
+    'census_de.residential_heating_sources': [carrier for carrier in ENERGY_SOURCES if carrier != 'unknown'],
+}
+CENSUS_COLUMNS = [column for table_columns in CENSUS_TABLE_COLUMNS.values() for column in table_columns]
+# Types of the columns of bulk transferred census query results, which pyarrow would otherwise infer from the first
+# block of the stream
+BULK_TRANSFER_COLUMN_TYPES = {
+    'raster_id_100m': pa.string(),
+    'x_mp_100m': pa.int64(),
+    'y_mp_100m': pa.int64(),
+    'longitude': pa.float64(),
+    'latitude': pa.float64(),
+    **dict.fromkeys(CENSUS_COLUMNS, pa.float64()),
+}
+
+# Census snapshots are partitioned in 50 km tiles of the census grid
+SNAPSHOT_PARTITION_SIZE = 500
+SNAPSHOT_MANIFEST = 'manifest.json'
+
+
+def declare_census_tables() -> MetaData:
+    """Declare the census tables with the columns used from them.
+
+    This replaces reflecting the `census_de` schema from the database, which becomes slower the more tables the schema
+    holds. Use `verify_census_tables` to check the declaration against the database.
+    """
+    metadata = MetaData(schema=CENSUS_SCHEMA)
+    Table(
+        'raster_grid_100m',
+        metadata,
+        Column('raster_id_100m', String, primary_key=True),
+        Column('x_mp_100m', Integer),
+        Column('y_mp_100m', Integer),
+        Column('geometry', Geometry('POINT', srid=4326)),
+    )
+    for table, table_columns in CENSUS_TABLE_COLUMNS.items():
+        Table(
+            table.split('.')[-1],
+            metadata,
+            Column('raster_id_100m', String, primary_key=True),
+            *[Column(column, Float) for column in table_columns],
+        )
+    return metadata
+
+
+def verify_census_tables(engine: Engine, metadata: MetaData) -> None:
+    """Check that all declared census tables and columns exist in the database."""
+    inspector = inspect(engine)
+    for table in metadata.tables.values():
+        if not inspector.has_table(table.name, schema=table.schema):
+            raise ValueError(f'Census table {table.fullname} does not exist in the database')
+
+        db_columns = {column['name'] for column in inspector.get_columns(table.name, schema=table.schema)}
+        missing_columns = set(table.c.keys()) - db_columns
+        if missing_columns:
+            raise ValueError(f'Census table {table.fullname} is missing the columns {sorted(missing_columns)}')
+    log.debug('Census tables verified')
+
+
 @dataclass
 class DatabaseConnection:
     engine: Engine
     metadata: MetaData
+    bulk_transfer: bool = False
+
+
+class CensusFetchMode(StrEnum):
+    per_table = 'per_table'
+    joined = 'joined'
+    grid = 'grid'
+    cached = 'cached'
+    snapshot = 'snapshot'
+
+
+class CensusTileCache:
+    """A local cache of the census data in fixed square tiles of the EPSG:3035 census grid.
+
+    Each tile is stored as a Feather file holding the joined census columns of all grid cells within it, so AOIs that
+    overlap or neighbour previous ones only query the tiles that are not cached yet. The data is cached before it is
+    cleaned, because the cleaning fills gaps with means over the whole AOI. Tiles are stored per census version and
+    the least recently used tiles are evicted once the cache grows beyond `max_size` bytes.
+    """
+
+    def __init__(self, cache_dir: Path, census_version: str, max_size: int, tile_size: int = CENSUS_TILE_SIZE):
+        self.cache_dir = cache_dir
+        self.tile_dir = cache_dir / census_version
+        self.max_size = max_size
+        self.tile_size = tile_size
+        self.tile_dir.mkdir(parents=True, exist_ok=True)
+
+    def load(
+        self, db_connection: DatabaseConnection, aoi: shapely.MultiPolygon
+    ) -> tuple[gpd.GeoDataFrame, dict[str, pd.DataFrame]]:
+        """Assemble the census data within the AOI from the cached tiles, querying the missing tiles first."""
+        cell_keys = cell_keys_from_coordinates(*rasterize_aoi(aoi))
+        tiles = get_cell_tiles(cell_keys, self.tile_size)
+
+        tile_data = {tile: self.read_tile(tile) for tile in tiles}
+        missing_tiles = [tile for tile, data in tile_data.items() if data is None]
+        log.debug(f'Found {len(tiles) - len(missing_tiles)} of {len(tiles)} census tiles within the AOI in the cache')
+        if missing_tiles:
+            for tile, data in query_census_tiles(db_connection, missing_tiles, self.tile_size).items():
+                self.write_tile(tile, data)
+                tile_data[tile] = data
+            self.evict()
+
+        return assemble_census_tiles(list(tile_data.values()), cell_keys)
+
+    def tile_path(self, tile: tuple[int, int]) -> Path:
+        return self.tile_dir / f'{tile[0]}_{tile[1]}.feather'
+
+    def read_tile(self, tile: tuple[int, int]) -> Optional[pd.DataFrame]:
+        """Read a tile from the cache and mark it as recently used, return None if it is not cached."""
+        path = self.tile_path(tile)
+        try:
+            data = pd.read_feather(path)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def write_tile(self, tile: tuple[int, int], data: pd.DataFrame) -> None:
+        """Write a tile to the cache, atomically so concurrent computations never read a partial file."""
+        path = self.tile_path(tile)
+        tmp_path = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+        data.reset_index(drop=True).to_feather(tmp_path)
+        os.replace(tmp_path, path)
+
+    def evict(self) -> None:
+        """Delete the tiles of other census versions and the least recently used tiles beyond `max_size`."""
+        cached_files = []
+        for path in self.cache_dir.rglob('*.feather'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            cached_files.append((path.parent == self.tile_dir, stat.st_mtime, stat.st_size, path))
+
+        cache_size = sum(size for _, _, size, _ in cached_files)
+        for is_current_version, _, size, path in sorted(cached_files):
+            if is_current_version and cache_size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            cache_size -= size
+        log.debug(f'Census tile cache holds {cache_size} bytes')
+
+
+class CensusSnapshot:
+    """An offline snapshot of the census data, exported from the database with `export_census_snapshot`.
+
+    The snapshot is split into square partitions of the census grid, each stored as an uncompressed Arrow IPC file of
+    the joined census columns. Partitions are memory-mapped, so an AOI only reads the rows of the partitions it
+    touches. A `manifest.json` lists the partitions that hold any census cells.
+    """
+
+    def __init__(self, snapshot_dir: Path):
+        self.snapshot_dir = snapshot_dir
+
+    @cached_property
+    def manifest(self) -> dict:
+        manifest = json.loads((self.snapshot_dir / SNAPSHOT_MANIFEST).read_text())
+        log.info(f'Using census snapshot of census version {manifest["census_version"]} from {manifest["created"]}')
+        return manifest
+
+    def load(self, aoi: shapely.MultiPolygon) -> tuple[gpd.GeoDataFrame, dict[str, pd.DataFrame]]:
+        """Read the census data within the AOI from the snapshot partitions."""
+        cell_keys = cell_keys_from_coordinates(*rasterize_aoi(aoi))
+        partitions = {tuple(partition) for partition in self.manifest['partitions']}
+        aoi_partitions = [
+            partition
+            for partition in get_cell_tiles(cell_keys, self.manifest['partition_size'])
+            if partition in partitions
+        ]
+        log.debug(f'Reading {len(aoi_partitions)} census snapshot partitions')
+
+        partition_data = [self.read_partition(partition, cell_keys) for partition in aoi_partitions]
+        return assemble_census_tiles(partition_data, cell_keys)
+
+    def read_partition(self, partition: tuple[int, int], cell_keys: np.ndarray) -> pd.DataFrame:
+        """Read the rows of the given cells from a memory-mapped partition."""
+        with pa.memory_map(str(self.snapshot_dir / partition_file_name(partition))) as source:
+            partition_table = pa.ipc.open_file(source).read_all()
+            partition_cell_keys = pc.add(
+                pc.multiply(pc.divide(partition_table['y_mp_100m'], CELL_SIZE), CELL_KEY_FACTOR),
+                pc.divide(partition_table['x_mp_100m'], CELL_SIZE),
+            )
+            in_aoi = pc.is_in(partition_cell_keys, value_set=pa.array(cell_keys, type=pa.int64()))
+            return partition_table.filter(in_aoi).to_pandas()
+
+
+def export_census_snapshot(
+    db_connection: DatabaseConnection,
+    area: shapely.Geometry,
+    snapshot_dir: Path,
+    census_version: str,
+    partition_size: int = SNAPSHOT_PARTITION_SIZE,
+) -> None:
+    """Export the census data of all partitions intersecting the area, given in EPSG:3035, to a `CensusSnapshot`."""
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    partitions = get_tiles_intersecting(area, partition_size)
+    log.info(f'Exporting {len(partitions)} census snapshot partitions to {snapshot_dir}')
+
+    exported_partitions = []
+    for partition in partitions:
+        partition_data = query_census_tiles(db_connection, [partition], partition_size)[partition]
+        if partition_data.empty:
+            continue
+        partition_table = pa.Table.from_pandas(partition_data, preserve_index=False)
+        with pa.OSFile(str(snapshot_dir / partition_file_name(partition)), 'wb') as sink:
+            with pa.ipc.new_file(sink, partition_table.schema) as writer:
+                writer.write_table(partition_table)
+        exported_partitions.append(partition)
+        log.debug(f'Exported {len(partition_data)} cells of census snapshot partition {partition}')
+
+    manifest = {
+        'census_version': census_version,
+        'created': datetime.now(tz=timezone.utc).isoformat(),
+        'partition_size': partition_size,
+        'partitions': exported_partitions,
+    }
+    (snapshot_dir / SNAPSHOT_MANIFEST).write_text(json.dumps(manifest, indent=2))
+
+
+def partition_file_name(partition: tuple[int, int]) -> str:
+    return f'{partition[0]}_{partition[1]}.arrow'
+
+
+def assemble_census_tiles(
+    tile_data: list[pd.DataFrame], cell_keys: np.ndarray
+) -> tuple[gpd.GeoDataFrame, dict[str, pd.DataFrame]]:
+    """Combine the rows of census tiles to the census data of the given cells, see `query_census_tiles`."""
+    tile_data = [data for data in tile_data if not data.empty]
+    if not tile_data:
+        raise_no_census_data_error()
+    census_rows = index_by_cell_key(pd.concat(tile_data, ignore_index=True))
+    census_rows = census_rows[census_rows.index.isin(cell_keys)].sort_index()
+    if census_rows.empty:
+        raise_no_census_data_error()
+    log.debug(f'Found {len(census_rows)} points within the AOI')
+
+    census_rows['geometry'] = gpd.points_from_xy(x=census_rows.pop('longitude'), y=census_rows.pop('latitude'))
+    return split_joined_census_tables(census_rows, grid_columns=['x_mp_100m', 'y_mp_100m', 'geometry'])
 
 
 def collect_census_data(
-    db_connection: DatabaseConnection, aoi: shapely.MultiPolygon
+    db_connection: DatabaseConnection,
+    aoi: shapely.MultiPolygon,
+    fetch_mode: CensusFetchMode = CensusFetchMode.per_table,
+    tile_cache: Optional[CensusTileCache] = None,
+    snapshot: Optional[CensusSnapshot] = None,
 ) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
-    """Read all required census data and return it as a single geodataframe."""
-    raster_grid = get_clipped_census_grid(db_connection=db_connection, aoi=aoi)
-    census_data, uncalculated_census_data = get_census_tables_from_db(db_connection, raster_grid)
-    uncalculated_census_data = postprocess_uncalculated_census_data(uncalculated_census_data)
+    """Read all required census data and return it as a single geodataframe.
+
+    See `collect_census_tables` for the fetch modes.
+    """
+    with profile_stage('census_query') as stage:
+        raster_grid, census_tables = collect_census_tables(
+            db_connection=db_connection, aoi=aoi, fetch_mode=fetch_mode, tile_cache=tile_cache, snapshot=snapshot
+        )
+        stage.rows = len(raster_grid)
+    with profile_stage('census_cleaning') as stage:
+        census_data, uncalculated_census_data = clean_census_tables(raster_grid, census_tables)
+        uncalculated_census_data = postprocess_uncalculated_census_data(uncalculated_census_data)
+        stage.rows = len(census_data)
     return census_data, uncalculated_census_data
 
 
+def collect_census_tables(
+    db_connection: DatabaseConnection,
+    aoi: shapely.MultiPolygon,
+    fetch_mode: CensusFetchMode = CensusFetchMode.per_table,
+    tile_cache: Optional[CensusTileCache] = None,
+    snapshot: Optional[CensusSnapshot] = None,
+) -> tuple[gpd.GeoDataFrame, dict[str, pd.DataFrame]]:
+    """Read the census grid within the AOI and the raw census tables, keyed by the integer cell keys.
+
+    With `CensusFetchMode.per_table` the grid cells within the AOI are queried first and each census table is then
+    queried for these cells. `CensusFetchMode.joined` joins all tables within the database in a single query.
+    `CensusFetchMode.grid` does the same but selects the cells within the AOI by grid arithmetic instead of a spatial
+    query. `CensusFetchMode.cached` assembles the data from the `tile_cache`, which only queries missing tiles.
+    `CensusFetchMode.snapshot` reads the data from an offline `snapshot` without querying the database.
+    """
+    match fetch_mode:
+        case CensusFetchMode.per_table:
+            raster_grid = get_clipped_census_grid(db_connection=db_connection, aoi=aoi)
+            raster_ids = raster_grid.index
+            raster_grid = index_by_cell_key(raster_grid)
+            census_tables = query_census_tables_from_db(db_connection, raster_ids, raster_grid.index)
+            return raster_grid, census_tables
+        case CensusFetchMode.joined:
+            return query_joined_census_tables(db_connection=db_connection, aoi=aoi)
+        case CensusFetchMode.grid:
+            return query_census_tables_by_cells(db_connection=db_connection, aoi=aoi)
+        case CensusFetchMode.cached:
+            if tile_cache is None:
+                raise ValueError('The cached census fetch mode requires a tile cache')
+            return tile_cache.load(db_connection=db_connection, aoi=aoi)
+        case CensusFetchMode.snapshot:
+            if snapshot is None:
+                raise ValueError('The snapshot census fetch mode requires a census snapshot')
+            return snapshot.load(aoi=aoi)
+        case _:
+            raise ValueError(f'Unknown census fetch mode: {fetch_mode}')
+
+
 def get_clipped_census_grid(db_connection: DatabaseConnection, aoi: shapely.MultiPolygon) -> gpd.GeoDataFrame:
     """Query the census grid cells within the AOI from the database."""
     log.info('Querying database for census grid points within the AOI')
 
     db_table = db_connection.metadata.tables['census_de.raster_grid_100m']
-    aoi_geom = WKTElement(aoi.wkt, srid=4326)
-    query = select(db_table).where(db_table.c.geometry.op('&&')(aoi_geom) & db_table.c.geometry.ST_Within(aoi_geom))
-    with db_connection.engine.connect() as conn:
-        result = conn.execute(query).mappings().all()
-
-    if not result:
-        raise ClimatoologyUserError(
-            'There are no data for residential buildings in the area you selected. Please select an area '
-            'with residential buildings'
-        )
-
-    result_gdf = pd.DataFrame(result)
-    result_gdf['geometry'] = gpd.GeoSeries.from_wkb(result_gdf['geometry'].astype(str))
+    aoi_geom = func.ST_GeomFromText(aoi.wkt, 4326)
+    query = select(*census_grid_columns(db_table, as_coordinates=db_connection.bulk_transfer)).where(
+        db_table.c.geometry.op('&&')(aoi_geom) & db_table.c.geometry.ST_Within(aoi_geom)
+    )
+    result_gdf = read_census_query(db_connection, query)
     result_gdf = gpd.GeoDataFrame(result_gdf, crs='4326').set_index('raster_id_100m')
 
     log.debug(f'Found {len(result_gdf)} points within the AOI')
     return result_gdf
 
 
-def get_census_tables_from_db(
-    db_connection: DatabaseConnection, raster_grid: gpd.GeoDataFrame
+def query_joined_census_tables(
+    db_connection: DatabaseConnection, aoi: shapely.MultiPolygon
+) -> tuple[gpd.GeoDataFrame, dict[str, pd.DataFrame]]:
+    """Query the census grid cells within the AOI together with all census tables in a single database query.
+
+    The tables are left-joined to the grid inside the database so no raster ids have to be sent back and forth.
+    Return the grid and one data frame per census table holding only the cells that table has a row for.
+    """
+    log.info('Querying database for census data within the AOI')
+
+    query, grid_table = build_joined_census_query(db_connection, as_coordinates=db_connection.bulk_transfer)
+    aoi_geom = func.ST_GeomFromText(aoi.wkt, 4326)
+    query = query.where(grid_table.c.geometry.op('&&')(aoi_geom) & grid_table.c.geometry.ST_Within(aoi_geom))
+    return read_joined_census_query(db_connection, query, grid_table)
+
+
+def query_census_tables_by_cells(
+    db_connection: DatabaseConnection, aoi: shapely.MultiPolygon
+) -> tuple[gpd.GeoDataFrame, dict[str, pd.DataFrame]]:
+    """Like `query_joined_census_tables` but select the cells within the AOI by grid arithmetic.
+
+    The AOI is rasterized to the census grid locally and the cells are fetched by ranges of their raster ids, so the
+    database does not have to test each grid point against the AOI.
+    """
+    log.info('Querying database for census data of the grid cells within the AOI')
+
+    x_mp_100m, y_mp_100m = rasterize_aoi(aoi)
+    if len(x_mp_100m) == 0:
+        raise_no_census_data_error()
+    cell_id_ranges = get_cell_id_ranges(x_mp_100m, y_mp_100m)
+    log.debug(f'Selected {len(x_mp_100m)} grid cells in {len(cell_id_ranges)} raster id ranges')
+
+    query, grid_table = build_joined_census_query(db_connection, as_coordinates=db_connection.bulk_transfer)
+    query = select_cell_id_ranges(query, grid_table, cell_id_ranges)
+    return read_joined_census_query(db_connection, query, grid_table)
+
+
+def query_census_tiles(
+    db_connection: DatabaseConnection, tiles: list[tuple[int, int]], tile_size: int
+) -> dict[tuple[int, int], pd.DataFrame]:
+    """Query the joined census data of all cells within the given tiles.
+
+    Return the rows of each tile, with the grid points as `longitude` and `latitude` and typed census columns, so
+    they can be stored as they are. Tiles without any census cells are returned as empty data frames.
+    """
+    log.info(f'Querying database for census data of {len(tiles)} tiles')
+
+    query, grid_table = build_joined_census_query(db_connection, as_coordinates=True)
+    query = select_cell_id_ranges(query, grid_table, get_tile_cell_id_ranges(tiles, tile_size))
+    census_rows = fetch_census_rows(db_connection, query).drop(columns='raster_id_100m')
+
+    presence_flags = [f'in_{table.split(".")[-1]}' for table in CENSUS_TABLE_COLUMNS]
+    census_rows = census_rows.astype(
+        {
+            'x_mp_100m': 'int64',
+            'y_mp_100m': 'int64',
+            'longitude': 'float64',
+            'latitude': 'float64',
+            **dict.fromkeys(presence_flags, 'bool'),
+            **dict.fromkeys(CENSUS_COLUMNS, 'float64'),
+        }
+    )
+
+    cell_keys = cell_keys_from_coordinates(census_rows['x_mp_100m'], census_rows['y_mp_100m'])
+    tile_rows, tile_columns = cell_keys_to_tiles(cell_keys, tile_size)
+    rows_by_tile = dict(list(census_rows.groupby([tile_rows, tile_columns])))
+    return {tile: rows_by_tile.get(tile, census_rows.iloc[:0]) for tile in tiles}
+
+
+def select_cell_id_ranges(query: Select, grid_table: Table, cell_id_ranges: pd.DataFrame) -> Select:
+    """Restrict a query on the census grid to the cells within the given raster id ranges."""
+    id_ranges = (
+        func.unnest(
+            literal(cell_id_ranges['first_id'].to_list(), ARRAY(String)),
+            literal(cell_id_ranges['last_id'].to_list(), ARRAY(String)),
+        )
+        .table_valued('first_id', 'last_id')
+        .render_derived(name='cell_id_ranges')
+    )
+    return query.join(id_ranges, grid_table.c.raster_id_100m.between(id_ranges.c.first_id, id_ranges.c.last_id))
+
+
+def build_joined_census_query(db_connection: DatabaseConnection, as_coordinates: bool) -> tuple[Select, Table]:
+    """Build the query selecting the census grid with all census tables left-joined to it."""
+    grid_table = db_connection.metadata.tables['census_de.raster_grid_100m']
+    columns = census_grid_columns(grid_table, as_coordinates=as_coordinates)
+    joined_tables = grid_table
+    for table, table_columns in CENSUS_TABLE_COLUMNS.items():
+        db_table = db_connection.metadata.tables[table]
+        columns.append(db_table.c.raster_id_100m.is_not(None).label(f'in_{db_table.name}'))
+        columns.extend(db_table.c[column] for column in table_columns)
+        joined_tables = joined_tables.outerjoin(db_table, db_table.c.raster_id_100m == grid_table.c.raster_id_100m)
+
+    return select(*columns).select_from(joined_tables), grid_table
+
+
+def read_joined_census_query(
+    db_connection: DatabaseConnection, query: Select, grid_table: Table
+) -> tuple[gpd.GeoDataFrame, dict[str, pd.DataFrame]]:
+    """Run a query built by `build_joined_census_query` and split its result into the grid and the tables."""
+    result_df = index_by_cell_key(read_census_query(db_connection, query)).drop(columns='raster_id_100m')
+    log.debug(f'Found {len(result_df)} points within the AOI')
+
+    grid_columns = [column.name for column in grid_table.c if column.name != 'raster_id_100m']
+    return split_joined_census_tables(result_df, grid_columns=grid_columns)
+
+
+def split_joined_census_tables(
+    joined_census_data: pd.DataFrame, grid_columns: list[str]
+) -> tuple[gpd.GeoDataFrame, dict[str, pd.DataFrame]]:
+    """Split a wide joined census result back into the grid and the individual census tables."""
+    raster_grid = gpd.GeoDataFrame(joined_census_data[grid_columns], crs='4326')
+
+    census_tables = {}
+    for table, table_columns in CENSUS_TABLE_COLUMNS.items():
+        in_table = joined_census_data[f'in_{table.split(".")[-1]}'].astype(bool)
+        census_tables[table] = joined_census_data.loc[in_table, table_columns]
+    return raster_grid, census_tables
+
+
+def census_grid_columns(grid_table: Table, as_coordinates: bool) -> list[ColumnElement]:
+    """Select all grid columns, replacing the geometry by its coordinates e.g. if the data is bulk transferred."""
+    if not as_coordinates:
+        return list(grid_table.c)
+
+    columns = [column for column in grid_table.c if column.name != 'geometry']
+    columns.append(func.ST_X(grid_table.c.geometry).label('longitude'))
+    columns.append(func.ST_Y(grid_table.c.geometry).label('latitude'))
+    return columns
+
+
+def read_census_query(db_connection: DatabaseConnection, query: Select) -> pd.DataFrame:
+    """Run a query on the census grid and return the result with the grid points in a `geometry` column."""
+    result = fetch_census_rows(db_connection, query)
+    if result.empty:
+        raise_no_census_data_error()
+
+    if db_connection.bulk_transfer:
+        result['geometry'] = gpd.points_from_xy(x=result.pop('longitude'), y=result.pop('latitude'))
+    else:
+        result['geometry'] = gpd.GeoSeries.from_wkb(result['geometry'].astype(str))
+    return result
+
+
+def fetch_census_rows(db_connection: DatabaseConnection, query: Select) -> pd.DataFrame:
+    """Run a query and return its rows as they are, using a bulk transfer if enabled."""
+    if db_connection.bulk_transfer:
+        return copy_query_result(db_connection, query)
+
+    with db_connection.engine.connect() as conn:
+        result = conn.execute(query)
+        return pd.DataFrame(result.mappings().all(), columns=list(result.keys()))
+
+
+def copy_query_result(db_connection: DatabaseConnection, query: Select) -> pd.DataFrame:
+    """Stream the result of `query` from the database with `COPY ... TO STDOUT` and let pyarrow decode it.
+
+    Compared to fetching rows through the cursor this never creates Python objects per row or value: the CSV stream is
+    parsed column-wise straight into typed arrays while it arrives, so the CSV text is never held as a whole. All census
+    values are read as floats, missing values become NaN.
+    """
+    # COPY does not take bind parameters, so the query is inlined and bypasses `DATA_DB_PREPARE_THRESHOLD`
+    sql = query.compile(dialect=db_connection.engine.dialect, compile_kwargs={'literal_binds': True})
+    copy_sql = f'COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)'
+
+    convert_options = arrow_csv.ConvertOptions(
+        column_types=BULK_TRANSFER_COLUMN_TYPES, true_values=['t'], false_values=['f']
+    )
+    with db_connection.engine.connect() as conn:
+        with conn.connection.cursor() as cursor, cursor.copy(copy_sql) as copy:
+            reader = arrow_csv.open_csv(io.BufferedReader(CopyStream(copy)), convert_options=convert_options)
+            result = reader.read_all()
+    return result.to_pandas()
+
+
+class CopyStream(io.RawIOBase):
+    """A readable file over the data of a psycopg `COPY ... TO STDOUT`, read chunk by chunk as it is consumed."""
+
+    def __init__(self, copy: 'Copy'):
+        self.copy = copy
+        self.pending = memoryview(b'')
+        self.finished = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: memoryview) -> int:
+        if not self.pending and not self.finished:
+            self.pending = memoryview(self.copy.read())
+            self.finished = not self.pending
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def raise_no_census_data_error() -> None:
+    raise ClimatoologyUserError(
+        'There are no data for residential buildings in the area you selected. Please select an area '
+        'with residential buildings'
+    )
+
+
+def query_census_tables_from_db(
+    db_connection: DatabaseConnection, raster_ids: pd.Index, cell_keys: pd.Index
+) -> dict[str, pd.DataFrame]:
+    """Query each census table for the grid cells with the `raster_ids` and key the results by their `cell_keys`.
+
+    The cell keys are those of the grid cells in the same order as their raster ids, e.g. derived from the cell
+    coordinates of the grid with `index_by_cell_key`, so the raster ids of the results only need to be looked up.
+    """
+    cell_keys_by_raster_id = pd.Series(cell_keys.to_numpy(), index=raster_ids)
+    census_tables = {}
+    for table in CENSUS_TABLE_COLUMNS:
+        log.debug(f'Querying database table {table}')
+        result = query_table_from_db(db_connection, raster_ids, table)
+        result_cell_keys = cell_keys_by_raster_id.loc[result.index].to_numpy()
+        census_tables[table] = result.set_axis(pd.Index(result_cell_keys, name='cell_key'), axis='index')
+    return census_tables
+
+
+def clean_census_tables(
+    raster_grid: gpd.GeoDataFrame, census_tables: dict[str, pd.DataFrame]
 ) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
-    """Query all other tables from the database for the grid points in `raster_grid`, clean them, and return a
-    GeoDataFrame with all tables joined.
+    """Clean the raw census tables and join them to the `raster_grid` on their integer cell keys.
+
     Return:
         1. the census data after calculation, e.g., the heat_consumption is already calculated based on building ages.
         2. the census data before calculation, e.g., the dominant/original building ages information.
     """
-
     tables_and_cleaning_fns = {
         'census_de.population': clean_population_data,
         'census_de.residential_living_space': clean_living_space_data,
@@ -79,9 +631,7 @@ def get_census_tables_from_db(
     census_data_raw = []
     uncalculated_census_data_raw = []
     for table, cleaning_fn in tables_and_cleaning_fns.items():
-        log.debug(f'Querying database table {table}')
-        result = query_table_from_db(db_connection, raster_grid.index, table)
-        result, uncalculated_data = cleaning_fn(result)
+        result, uncalculated_data = cleaning_fn(census_tables[table])
         census_data_raw.append(result)
 
         if uncalculated_data is not None:
@@ -92,8 +642,7 @@ def get_census_tables_from_db(
     census_data = raster_grid.join(census_data_raw)
     uncalculated_census_data = raster_grid.join(uncalculated_census_data_raw)
 
-    energy_data_raw = query_table_from_db(db_connection, raster_grid.index, 'census_de.residential_heating_sources')
-    energy_data = clean_energy_source_data_all(energy_data_raw)
+    energy_data = clean_energy_source_data_all(census_tables['census_de.residential_heating_sources'])
 
     census_energy = census_data.join(energy_data)
     uncalculated_census_energy = uncalculated_census_data.join(energy_data)
@@ -104,10 +653,7 @@ def get_census_tables_from_db(
 def query_table_from_db(db_connection: DatabaseConnection, raster_ids: pd.Series, table: str) -> pd.DataFrame:
     db_table = db_connection.metadata.tables[table]
     query = select(db_table).where(db_table.c.raster_id_100m.in_(raster_ids))
-    with db_connection.engine.connect() as conn:
-        raw_data = conn.execute(query).mappings().all()
-    result = pd.DataFrame(raw_data).set_index('raster_id_100m')
-    return result
+    return fetch_census_rows(db_connection, query).set_index('raster_id_100m')
 
 
 def clean_population_data(census_data: pd.DataFrame) -> tuple[pd.Series, None]:
@@ -119,84 +665,74 @@ def clean_living_space_data(census_data: gpd.GeoDataFrame) -> tuple[pd.Series, N
 
 
 def clean_building_age_data(census_data: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
-    building_counts = census_data.fillna(0)
-
-    building_ages_columns = list(BUILDING_AGES.keys())
-    building_ages_columns.remove('unknown')
+    building_ages_columns = [age for age in BUILDING_AGES if age != 'unknown']
     log.debug(f'Current building age columns will be considered: {building_ages_columns}')
-    building_ages = building_counts[building_ages_columns]
+    building_ages = census_data[building_ages_columns].fillna(0)
 
-    building_counts['computed_total_buildings'] = building_ages.sum(axis='columns')
-    no_buildings = building_counts['computed_total_buildings'] < 1
+    building_counts = building_ages.to_numpy(dtype=float)
+    no_buildings = building_counts.sum(axis=1) < 1
     if no_buildings.any():
-        log.debug(f'No building in census areas {building_counts.index[no_buildings]}, ignoring.')
+        log.debug(f'No building in census areas {building_ages.index[no_buildings]}, ignoring.')
+        building_ages = building_ages[~no_buildings]
         building_counts = building_counts[~no_buildings]
 
-    building_counts['heat_consumption'] = 0.0
-    for age, heat_consumption_factor in HEAT_CONSUMPTION.items():
-        building_counts['heat_consumption'] = building_counts['heat_consumption'] + (
-            heat_consumption_factor * (building_counts[age] / (building_counts['computed_total_buildings']))
-        )
-
-    # For grid cells with no building age data, assign average heating consumption in AOI
-    building_counts['heat_consumption'] = building_counts['heat_consumption'].fillna(
-        building_counts['heat_consumption'].mean()
+    heat_consumption_factors = category_factor_matrix(building_ages_columns, HEAT_CONSUMPTION)
+    heat_consumption = pd.Series(
+        weighted_category_factors(building_counts, heat_consumption_factors)[:, 0],
+        index=building_ages.index,
+        name='heat_consumption',
     )
 
-    building_counts['dominant_age'] = extract_dominant_characteristics(building_ages, 'dominant_age')
-
-    return building_counts['heat_consumption'], building_counts['dominant_age']
-
+    # For grid cells with no building age data, assign average heating consumption in AOI
+    heat_consumption = heat_consumption.fillna(heat_consumption.mean())
 
-def clean_energy_source_data_all(census_data: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-    direct, dominant_energy = clean_energy_source_data(census_data, mode='direct')
-    life_cycle, _ = clean_energy_source_data(census_data, mode='life_cycle')
+    dominant_age = extract_dominant_characteristics(building_ages, 'dominant_age').rename('dominant_age')
 
-    return pd.DataFrame(
-        {
-            'direct': direct,
-            'life_cycle': life_cycle,
-            'dominant_energy': dominant_energy,
-        }
-    )
+    return heat_consumption, dominant_age
 
 
-def clean_energy_source_data(census_data: gpd.GeoDataFrame, mode: str) -> tuple[pd.Series, pd.Series]:
-    with pd.option_context('future.no_silent_downcasting', True):
-        cropped_energy_data = census_data.fillna(0).infer_objects()
+def clean_energy_source_data_all(census_data: pd.DataFrame) -> pd.DataFrame:
+    """Compute the average direct and life cycle emission factor and the dominant energy carrier of each grid cell.
 
-    building_energy_columns = list(ENERGY_SOURCES.keys())
-    building_energy_columns.remove('unknown')
+    The building counts per energy carrier are normalized once and multiplied with the emission factors of both modes.
+    """
+    building_energy_columns = [carrier for carrier in ENERGY_SOURCES if carrier != 'unknown']
     log.debug(f'Current building energy carrier columns will be considered: {building_energy_columns}')
-    cropped_energy_data_energysource = cropped_energy_data[building_energy_columns]
-    cropped_energy_data['computed_total_buildings'] = cropped_energy_data_energysource.sum(axis='columns')
+    energy_sources = census_data[building_energy_columns].fillna(0)
 
     # Average emission factor in grid cell given heat mix (in kg of CO2 per kWh)
-    cropped_energy_data['emission_factor'] = 0.0
+    emission_factors = category_factor_matrix(
+        building_energy_columns, EMISSION_FACTORS_DIRECT, EMISSION_FACTORS_LIFE_CYCLE
+    )
+    energy_data = pd.DataFrame(
+        weighted_category_factors(energy_sources.to_numpy(dtype=float), emission_factors),
+        index=energy_sources.index,
+        columns=['direct', 'life_cycle'],
+    )
 
-    if mode == 'direct':
-        emission_factors = EMISSION_FACTORS_DIRECT
-    elif mode == 'life_cycle':
-        emission_factors = EMISSION_FACTORS_LIFE_CYCLE
+    # For grid cells with no Energy Carrier data, assign average emission factor in AOI
+    energy_data = energy_data.fillna(energy_data.mean())
 
-    for energy_carrier, ef in emission_factors.items():
-        cropped_energy_data['emission_factor'] = cropped_energy_data['emission_factor'] + (
-            ef * (cropped_energy_data[energy_carrier] / (cropped_energy_data['computed_total_buildings']))
-        )
+    energy_data['dominant_energy'] = extract_dominant_characteristics(energy_sources, 'dominant_energy')
+    return energy_data
 
-    # For grid cells with no Energy Carrier data, assign average emission factor in AOI
-    cropped_energy_data['emission_factor'] = cropped_energy_data['emission_factor'].fillna(
-        cropped_energy_data['emission_factor'].mean()
-    )
 
-    cropped_energy_data['dominant_energy'] = extract_dominant_characteristics(
-        cropped_energy_data_energysource, 'dominant_energy'
-    )
+def category_factor_matrix(categories: list[str], *factors: dict[str, float]) -> np.ndarray:
+    """Arrange the factors per category as a category x factor matrix, categories without a factor get 0."""
+    return np.array([[category_factors.get(category, 0.0) for category_factors in factors] for category in categories])
+
 
-    return cropped_energy_data['emission_factor'], cropped_energy_data['dominant_energy']
+def weighted_category_factors(counts: np.ndarray, factors: np.ndarray) -> np.ndarray:
+    """Average the factors of each category weighted by the cell x category counts.
+
+    Cells without any counts get NaN.
+    """
+    totals = counts.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (counts / totals) @ factors
 
 
-def extract_dominant_characteristics(census_dominant_data: gpd.GeoDataFrame, dominant_character: str) -> pd.Series:
+def extract_dominant_characteristics(census_dominant_data: pd.DataFrame, dominant_character: str) -> pd.Series:
     ## rename for label
     match dominant_character:
         case 'dominant_age':
@@ -206,8 +742,11 @@ def extract_dominant_characteristics(census_dominant_data: gpd.GeoDataFrame, dom
         case _:
             raise ValueError(f'Unknown dominant_character: {dominant_character}')
 
-    census_dominant_data = census_dominant_data.rename(columns=new_columns_names)
-    census_dominant_data = census_dominant_data.idxmax(axis=1)
-    census_dominant_data = census_dominant_data.fillna('Unknown')
+    labels = np.array([new_columns_names.get(column, column) for column in census_dominant_data.columns], dtype=object)
+    counts = census_dominant_data.to_numpy(dtype=float)
+    missing = np.isnan(counts)
 
-    return census_dominant_data
+    # Like `idxmax`, take the first of equal maxima and skip missing counts
+    dominant = labels[np.where(missing, -np.inf, counts).argmax(axis=1)]
+    dominant[missing.all(axis=1)] = 'Unknown'
+    return pd.Series(dominant, index=census_dominant_data.index, dtype='str')
@@ -0,0 +1,175 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from affine import Affine
+from rasterio.transform import from_origin
+
+# The census grid is the regular 100-m grid in EPSG:3035 (ETRS89-LAEA). A cell is identified by the northing and
+# easting of its lower left corner, e.g. 'CRS3035RES100mN2923000E4224200', while `x_mp_100m`/`y_mp_100m` hold its
+# centre ('Mittelpunkt').
+CELL_SIZE = 100  # m
+RASTER_ID_PREFIX = 'CRS3035RES100m'
+# Cells are keyed in memory by a compact integer: grid row (northing / 100 m) * CELL_KEY_FACTOR + grid column
+CELL_KEY_FACTOR = 100_000
+# Maximum number of candidate cell centres tested against the AOI at once
+RASTERIZE_CHUNK_SIZE = 1_000_000
+# Edge length of the square census tiles in cells, i.e. 10 km tiles
+CENSUS_TILE_SIZE = 100
+
+
+def format_raster_ids(northings: np.ndarray, eastings: np.ndarray, cell_size: int = CELL_SIZE) -> np.ndarray:
+    """Create the census raster ids for cells given by the northing and easting of their lower left corner.
+
+    Cells of coarser grids, e.g. of aggregated census cells, get ids of the same form with their `cell_size`.
+    """
+    prefix = RASTER_ID_PREFIX if cell_size == CELL_SIZE else f'CRS3035RES{cell_size}m'
+    northings = np.char.mod('%d', np.asarray(northings, dtype=np.int64))
+    eastings = np.char.mod('%d', np.asarray(eastings, dtype=np.int64))
+    return np.char.add(np.char.add(np.char.add(f'{prefix}N', northings), 'E'), eastings)
+
+
+def cell_keys_from_coordinates(x_mp_100m: np.ndarray, y_mp_100m: np.ndarray) -> np.ndarray:
+    """Derive the integer cell keys from the cell centre coordinates."""
+    columns = np.asarray(x_mp_100m, dtype=np.int64) // CELL_SIZE
+    rows = np.asarray(y_mp_100m, dtype=np.int64) // CELL_SIZE
+    return rows * CELL_KEY_FACTOR + columns
+
+
+def raster_ids_to_cell_keys(raster_ids: pd.Index | pd.Series) -> np.ndarray:
+    """Derive the integer cell keys from the northing and easting in the census raster ids."""
+    northings_eastings = pd.Series(raster_ids).str.extract(r'N(\d+)E(\d+)$').astype(np.int64).to_numpy()
+    return (northings_eastings[:, 0] // CELL_SIZE) * CELL_KEY_FACTOR + northings_eastings[:, 1] // CELL_SIZE
+
+
+def cell_keys_to_raster_ids(cell_keys: pd.Index | np.ndarray) -> np.ndarray:
+    """Convert integer cell keys back to the census raster ids."""
+    cell_keys = np.asarray(cell_keys, dtype=np.int64)
+    return format_raster_ids(cell_keys // CELL_KEY_FACTOR * CELL_SIZE, cell_keys % CELL_KEY_FACTOR * CELL_SIZE)
+
+
+def index_by_cell_key(census_grid: pd.DataFrame) -> pd.DataFrame:
+    """Replace the index of a frame with census grid coordinates by the integer cell keys."""
+    cell_keys = cell_keys_from_coordinates(census_grid['x_mp_100m'], census_grid['y_mp_100m'])
+    return census_grid.set_axis(pd.Index(cell_keys, name='cell_key'), axis='index')
+
+
+def index_by_raster_id(data: pd.DataFrame, name: str = 'raster_id_100m') -> pd.DataFrame:
+    """Replace the cell key index of `data` by the census raster ids, e.g. before handing it out as artifact."""
+    return data.set_axis(pd.Index(cell_keys_to_raster_ids(data.index), name=name), axis='index')
+
+
+def rasterize_aoi(aoi: shapely.MultiPolygon) -> tuple[np.ndarray, np.ndarray]:
+    """Find the census cells whose centre lies within the AOI by grid arithmetic.
+
+    The AOI (in EPSG:4326) is densified to ~100 m segments before it is projected to EPSG:3035, so that its edges
+    follow the same path as in geographic coordinates. Candidate cell centres are taken from the AOI bounds and
+    tested against the projected AOI in chunks of grid rows.
+
+    :return: the `x_mp_100m` and `y_mp_100m` of the cells within the AOI, sorted by row and then column
+    """
+    densified_aoi = shapely.segmentize(aoi, max_segment_length=0.001)
+    aoi_3035 = gpd.GeoSeries([densified_aoi], crs='EPSG:4326').to_crs('EPSG:3035').iloc[0]
+    shapely.prepare(aoi_3035)
+
+    min_x, min_y, max_x, max_y = aoi_3035.bounds
+    half_cell = CELL_SIZE // 2
+    columns = np.arange(np.floor(min_x / CELL_SIZE), np.ceil(max_x / CELL_SIZE), dtype=np.int64)
+    rows = np.arange(np.floor(min_y / CELL_SIZE), np.ceil(max_y / CELL_SIZE), dtype=np.int64)
+    x_centres = columns * CELL_SIZE + half_cell
+
+    rows_per_chunk = max(1, RASTERIZE_CHUNK_SIZE // max(1, len(columns)))
+    selected_x, selected_y = [], []
+    for chunk_start in range(0, len(rows), rows_per_chunk):
+        y_centres = rows[chunk_start : chunk_start + rows_per_chunk] * CELL_SIZE + half_cell
+        grid_x, grid_y = np.meshgrid(x_centres, y_centres)
+        within = shapely.contains_xy(aoi_3035, grid_x, grid_y)
+        selected_x.append(grid_x[within])
+        selected_y.append(grid_y[within])
+
+    if not selected_x:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(selected_x), np.concatenate(selected_y)
+
+
+def get_cell_id_ranges(x_mp_100m: np.ndarray, y_mp_100m: np.ndarray) -> pd.DataFrame:
+    """Collapse cells, sorted by row and then column, into runs of adjacent cells within the same grid row.
+
+    Raster ids within a row only differ in their fixed-width easting, so each run is exactly the lexicographic range
+    between the ids of its first and last cell.
+
+    :return: a data frame with the `first_id` and `last_id` of each run
+    """
+    run_starts = np.flatnonzero(np.concatenate([[True], (np.diff(y_mp_100m) != 0) | (np.diff(x_mp_100m) != CELL_SIZE)]))
+    run_ends = np.append(run_starts[1:], len(x_mp_100m)) - 1
+
+    half_cell = CELL_SIZE // 2
+    northings = y_mp_100m[run_starts] - half_cell
+    return pd.DataFrame(
+        {
+            'first_id': format_raster_ids(northings, x_mp_100m[run_starts] - half_cell),
+            'last_id': format_raster_ids(northings, x_mp_100m[run_ends] - half_cell),
+        }
+    )
+
+
+def cell_keys_to_tiles(cell_keys: np.ndarray, tile_size: int = CENSUS_TILE_SIZE) -> tuple[np.ndarray, np.ndarray]:
+    """Find the tile of `tile_size` x `tile_size` cells each cell lies in.
+
+    :return: the tile row and tile column of each cell
+    """
+    cell_keys = np.asarray(cell_keys, dtype=np.int64)
+    return cell_keys // CELL_KEY_FACTOR // tile_size, cell_keys % CELL_KEY_FACTOR // tile_size
+
+
+def get_cell_tiles(cell_keys: np.ndarray, tile_size: int = CENSUS_TILE_SIZE) -> list[tuple[int, int]]:
+    """Get the sorted unique tiles, as tile row and tile column, the given cells lie in."""
+    tile_rows, tile_columns = cell_keys_to_tiles(cell_keys, tile_size)
+    return sorted(set(zip(tile_rows.tolist(), tile_columns.tolist())))
+
+
+def get_tiles_intersecting(area: shapely.Geometry, tile_size: int = CENSUS_TILE_SIZE) -> list[tuple[int, int]]:
+    """Get the tiles, as tile row and tile column, that intersect an area given in EPSG:3035."""
+    tile_edge = tile_size * CELL_SIZE
+    min_x, min_y, max_x, max_y = area.bounds
+    tile_columns = np.arange(np.floor(min_x / tile_edge), np.floor(max_x / tile_edge) + 1, dtype=np.int64)
+    tile_rows = np.arange(np.floor(min_y / tile_edge), np.floor(max_y / tile_edge) + 1, dtype=np.int64)
+    grid_columns, grid_rows = np.meshgrid(tile_columns, tile_rows)
+    tile_boxes = shapely.box(
+        grid_columns * tile_edge, grid_rows * tile_edge, (grid_columns + 1) * tile_edge, (grid_rows + 1) * tile_edge
+    )
+    intersecting = shapely.intersects(area, tile_boxes)
+    return list(zip(grid_rows[intersecting].tolist(), grid_columns[intersecting].tolist()))
+
+
+def get_tile_cell_id_ranges(tiles: list[tuple[int, int]], tile_size: int = CENSUS_TILE_SIZE) -> pd.DataFrame:
+    """Get the raster id ranges covering the given tiles, one range per grid row of each tile.
+
+    :return: a data frame with the `first_id` and `last_id` of each range
+    """
+    tile_rows, tile_columns = np.array(tiles, dtype=np.int64).reshape(-1, 2).T
+    rows = (tile_rows[:, np.newaxis] * tile_size + np.arange(tile_size)).ravel()
+    first_columns = np.repeat(tile_columns * tile_size, tile_size)
+    last_columns = first_columns + tile_size - 1
+    return pd.DataFrame(
+        {
+            'first_id': format_raster_ids(rows * CELL_SIZE, first_columns * CELL_SIZE),
+            'last_id': format_raster_ids(rows * CELL_SIZE, last_columns * CELL_SIZE),
+        }
+    )
+
+
+def rasterize_cells(
+    x_mp_100m: pd.Series | np.ndarray, y_mp_100m: pd.Series | np.ndarray, values: np.ndarray, nodata: int | float
+) -> tuple[np.ndarray, Affine]:
+    """Burn the values of the cells into a north-up raster of the census grid covering all cells.
+
+    :return: the raster, with `nodata` where there is no cell, and its EPSG:3035 affine transformation
+    """
+    columns = np.asarray(x_mp_100m, dtype=np.int64) // CELL_SIZE
+    rows = np.asarray(y_mp_100m, dtype=np.int64) // CELL_SIZE
+    min_column, max_row = columns.min(), rows.max()
+
+    raster = np.full((max_row - rows.min() + 1, columns.max() - min_column + 1), nodata, dtype=values.dtype)
+    raster[max_row - rows, columns - min_column] = values
+    return raster, from_origin(min_column * CELL_SIZE, (max_row + 1) * CELL_SIZE, CELL_SIZE, CELL_SIZE)
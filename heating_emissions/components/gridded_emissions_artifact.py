@@ -1,22 +1,32 @@
+import json
 import logging
+import threading
+from dataclasses import dataclass
 from enum import StrEnum
+from functools import cache
+from typing import Optional
 
 import geopandas as gpd
 import matplotlib
 import numpy as np
 import pandas as pd
+import shapely
 from climatoology.base.artifact import (
     Artifact,
     ArtifactMetadata,
     ContinuousLegendData,
     Legend,
+    RasterInfo,
 )
-from climatoology.base.artifact_creators import create_vector_artifact
+from climatoology.base.artifact_creators import create_raster_artifact, create_table_artifact, create_vector_artifact
 from climatoology.base.computation import ComputationResources
 from climatoology.base.i18n import N_, tr, translate_dataframe
-from matplotlib.colors import Normalize, to_hex
+from matplotlib.colors import to_hex
 from pydantic_extra_types.color import Color
+from pyproj import Transformer
+from rasterio.crs import CRS
 
+from heating_emissions.components.census_grid import CELL_SIZE, rasterize_cells
 from heating_emissions.components.utils import BUILDING_AGES, ENERGY_SOURCES, Topics
 
 log = logging.getLogger(__name__)
@@ -31,14 +41,88 @@ class Output(StrEnum):
     heat_consumption = 'heat_consumption'
 
 
+GRIDDED_CMAP = 'YlOrRd'
+UNDER_COLOR = '#808080'
+# File name of the combined gridded layer and of its styling table
+COMBINED_FILE_NAME = 'gridded_outputs'
+# Offsets of the corners of a 100-m census grid cell from its centre, as closed ring
+CELL_CORNER_OFFSETS = np.array([[50, 50], [50, -50], [-50, -50], [-50, 50], [50, 50]], dtype=float)
+
+
 class EmissionType(StrEnum):
     per_capita = N_('Per capita')
     absolute = N_('Absolute')
 
 
-def build_gridded_artifact(
-    result: gpd.GeoDataFrame, resources: ComputationResources, output: Output | str, is_per_capita: bool = True
-) -> Artifact:
+class GriddedOutputMode(StrEnum):
+    vector = 'vector'  # one polygon per grid cell
+    raster = 'raster'  # a raster on the EPSG:3035 census grid
+    combined = 'combined'  # one layer with all per-cell outputs as attributes
+    aggregated = 'aggregated'  # one polygon per cell, aggregated to coarser cells for large AOIs
+
+
+@dataclass
+class GriddedLayer:
+    output_column: str
+    legend_lower_cap: float
+    legend_upper_cap: float
+    low_bound_tick_label: str
+    metadata: ArtifactMetadata
+
+    @property
+    def legend(self) -> Legend:
+        return Legend(
+            legend_data=ContinuousLegendData(
+                cmap_name=GRIDDED_CMAP,
+                ticks={f'> {self.legend_upper_cap}': 1, self.low_bound_tick_label: 0},
+            )
+        )
+
+
+class CellGeometryCache:
+    """Cache of the EPSG:4326 polygons of the census grid cells, shared by all gridded artifacts of a computation.
+
+    The polygons are cached per cell index, so the cells of all layers with the same index are only buffered and
+    reprojected once, also when the layers are built in concurrent threads. The cells are `cell_size` wide, e.g. for
+    cells aggregated by `aggregate_cells`.
+    """
+
+    def __init__(self, cell_size: int = CELL_SIZE):
+        self.cell_size = cell_size
+        self.cell_polygons: list[tuple[pd.Index, gpd.GeoSeries]] = []
+        self.lock = threading.Lock()
+
+    def get_cell_polygons(self, cells: pd.DataFrame) -> gpd.GeoSeries:
+        """Get the square EPSG:4326 polygons of the cells given by their `x_mp_100m` and `y_mp_100m` centres."""
+        with self.lock:
+            for cell_index, cell_polygons in self.cell_polygons:
+                if cell_index.equals(cells.index):
+                    return cell_polygons
+
+            cell_polygons = build_cell_polygons(cells, cell_size=self.cell_size)
+            self.cell_polygons.append((cells.index, cell_polygons))
+            return cell_polygons
+
+
+def build_cell_polygons(cells: pd.DataFrame, cell_size: int = CELL_SIZE) -> gpd.GeoSeries:
+    """Construct the square cell polygons from their EPSG:3035 corners, transformed to EPSG:4326 in a single batch.
+
+    The corners run clockwise from the upper right one, like those of a square buffer around the cell centre.
+    """
+    corner_offsets = CELL_CORNER_OFFSETS * (cell_size / CELL_SIZE)
+    x_corners = cells['x_mp_100m'].to_numpy(dtype=float)[:, np.newaxis] + corner_offsets[:, 0]
+    y_corners = cells['y_mp_100m'].to_numpy(dtype=float)[:, np.newaxis] + corner_offsets[:, 1]
+    lon_corners, lat_corners = get_cell_transformer().transform(x_corners, y_corners)
+    cell_polygons = shapely.polygons(np.stack([lon_corners, lat_corners], axis=-1))
+    return gpd.GeoSeries(cell_polygons, index=cells.index, crs='EPSG:4326')
+
+
+@cache
+def get_cell_transformer() -> Transformer:
+    return Transformer.from_crs('EPSG:3035', 'EPSG:4326', always_xy=True)
+
+
+def describe_gridded_layer(output: Output | str, is_per_capita: bool = True) -> GriddedLayer:
     legend_lower_cap = 0
     low_bound_tick_label = f'{legend_lower_cap}'
 
@@ -147,35 +231,79 @@ def build_gridded_artifact(
                 ).format(output_year=output_year)
                 tags = {tr(Topics.TEMPORAL)}
 
-    # Buffer centroids
-    grid_cell_centroids = gpd.points_from_xy(x=result['x_mp_100m'], y=result['y_mp_100m'], crs='EPSG:3035')
-    artifact_data = gpd.GeoDataFrame(data=result[output_column], geometry=grid_cell_centroids)
-    artifact_data.geometry = artifact_data.buffer(50, cap_style=3)
-    artifact_data_4326 = artifact_data.to_crs('EPSG:4326')
+    return GriddedLayer(
+        output_column=output_column,
+        legend_lower_cap=legend_lower_cap,
+        legend_upper_cap=legend_upper_cap,
+        low_bound_tick_label=low_bound_tick_label,
+        metadata=ArtifactMetadata(
+            name=layer_name,
+            summary=caption,
+            description=description,
+            filename=file_name,
+            tags=tags,
+        ),
+    )
+
+
+def build_gridded_artifact(
+    result: gpd.GeoDataFrame,
+    resources: ComputationResources,
+    output: Output | str,
+    is_per_capita: bool = True,
+    cell_geometries: Optional[CellGeometryCache] = None,
+) -> Artifact:
+    layer = describe_gridded_layer(output, is_per_capita)
+
+    cell_polygons = (cell_geometries or CellGeometryCache()).get_cell_polygons(result)
+    artifact_data_4326 = gpd.GeoDataFrame(data=result[layer.output_column], geometry=cell_polygons.values)
 
     # Define colors and legend
-    norm = Normalize(vmin=legend_lower_cap, vmax=legend_upper_cap)
-    cmap = matplotlib.colormaps.get('YlOrRd')
-    cmap.set_under('#808080')
-    artifact_data_4326['color'] = artifact_data[output_column].apply(lambda v: Color(to_hex(cmap(norm(v)))))
-    legend_data = ContinuousLegendData(
-        cmap_name='YlOrRd',
-        ticks={f'> {legend_upper_cap}': 1, low_bound_tick_label: 0},
-    )
-    gridded_artifact_metadata = ArtifactMetadata(
-        name=layer_name,
-        summary=caption,
-        description=description,
-        filename=file_name,
-        tags=tags,
+    color_lut = get_color_lut(GRIDDED_CMAP, under_color=UNDER_COLOR)
+    artifact_data_4326['color'] = lookup_colors(
+        result[layer.output_column], vmin=layer.legend_lower_cap, vmax=layer.legend_upper_cap, color_lut=color_lut
     )
     return create_vector_artifact(
         data=artifact_data_4326,
-        metadata=gridded_artifact_metadata,
-        label=output_column,
-        legend=Legend(
-            legend_data=legend_data,
+        metadata=layer.metadata,
+        label=layer.output_column,
+        legend=layer.legend,
+        resources=resources,
+    )
+
+
+def build_gridded_raster_artifact(
+    result: gpd.GeoDataFrame, resources: ComputationResources, output: Output | str, is_per_capita: bool = True
+) -> Artifact:
+    """Build the layer of `build_gridded_artifact` as raster on the EPSG:3035 census grid instead of one polygon per
+    cell.
+
+    The raster holds the indices into the colour lookup table together with the matching colormap, cells without a
+    value are left empty.
+    """
+    layer = describe_gridded_layer(output, is_per_capita)
+
+    color_lut = get_color_lut(GRIDDED_CMAP, under_color=UNDER_COLOR)
+    lut_indices = lookup_color_indices(
+        result[layer.output_column],
+        vmin=layer.legend_lower_cap,
+        vmax=layer.legend_upper_cap,
+        n_colors=len(color_lut) - 3,
+    )
+    nodata = len(color_lut) - 1  # the bad colour
+    raster, transform = rasterize_cells(
+        result['x_mp_100m'], result['y_mp_100m'], lut_indices.astype(np.uint16), nodata=nodata
+    )
+    return create_raster_artifact(
+        data=RasterInfo(
+            data=raster,
+            crs=CRS.from_epsg(3035),
+            transformation=transform,
+            colormap=build_raster_colormap(color_lut[:nodata]),
+            nodata=nodata,
         ),
+        metadata=layer.metadata,
+        legend=layer.legend,
         resources=resources,
     )
 
@@ -185,11 +313,22 @@ class ClassdataOutput(StrEnum):
     dominant_energy = 'dominant_energy'
 
 
-def build_gridded_artifact_classdata(
-    uncalculated_census_data: gpd.GeoDataFrame | pd.DataFrame, resources: ComputationResources, output: ClassdataOutput
-) -> Artifact:
+# The continuous gridded layers, as output and whether it is per capita, in the order they are handed out
+GRIDDED_LAYERS = [
+    (Output.direct_co2_emissions, True),
+    (Output.life_cycle_co2_emissions, True),
+    (Output.direct_co2_emissions, False),
+    (Output.life_cycle_co2_emissions, False),
+    (Output.heat_consumption, True),
+    (Output.average_sqm_per_person, True),
+    (Output.direct_emission_factor, True),
+    (Output.life_cycle_emission_factor, True),
+]
+
+
+def describe_classdata_layer(output: ClassdataOutput) -> tuple[ArtifactMetadata, dict[str, Color]]:
+    """Get the metadata of a class data layer and the colour of each class."""
     # maps of building age and dominant energy source
-    output_column = output
     file_name = output
 
     match output:
@@ -207,37 +346,218 @@ def build_gridded_artifact_classdata(
         case _:
             raise NotImplementedError(f'{output} not implemented')
 
-    # Buffer centroids
-    grid_cell_centroids = gpd.points_from_xy(
-        x=uncalculated_census_data['x_mp_100m'], y=uncalculated_census_data['y_mp_100m'], crs='EPSG:3035'
-    )
-    artifact_data = gpd.GeoDataFrame(data=uncalculated_census_data[output_column], geometry=grid_cell_centroids)
-    artifact_data.geometry = artifact_data.buffer(50, cap_style=3)
-    artifact_data_4326 = artifact_data.to_crs('EPSG:4326')
-
-    # Define colors and legend
+    # Define colors
     cmap = matplotlib.colormaps.get('coolwarm_r')
     color_list = cmap(np.linspace(0, 0.9, len(color_categories) - 1))
     color_list = [Color(to_hex(_)) for _ in color_list]
     color_list.append(Color('#808080'))  # the last category: unknown
     color_map = dict(zip(color_categories.values(), color_list))
-    artifact_data_4326['color'] = artifact_data[output_column].map(color_map)
-
-    tr_color_map = {tr(k): v for k, v in color_map.items()}
-    tr_artifact_data = translate_dataframe(artifact_data_4326)
 
-    # pass legend and use the default setting -> read 'create_vector_artifact' explanation.
-    gridded_artifact_classdata_metadata = ArtifactMetadata(
+    metadata = ArtifactMetadata(
         name=layer_name,
         summary=caption,
         description=description,
         filename=file_name,
         tags={tr(Topics.PARAMETERS)},
     )
+    return metadata, color_map
+
+
+def build_gridded_artifact_classdata(
+    uncalculated_census_data: gpd.GeoDataFrame | pd.DataFrame,
+    resources: ComputationResources,
+    output: ClassdataOutput,
+    cell_geometries: Optional[CellGeometryCache] = None,
+) -> Artifact:
+    output_column = output
+    metadata, color_map = describe_classdata_layer(output)
+
+    cell_polygons = (cell_geometries or CellGeometryCache()).get_cell_polygons(uncalculated_census_data)
+    artifact_data_4326 = gpd.GeoDataFrame(data=uncalculated_census_data[output_column], geometry=cell_polygons.values)
+    artifact_data_4326['color'] = lookup_category_colors(uncalculated_census_data[output_column], color_map)
+
+    tr_color_map = {tr(k): v for k, v in color_map.items()}
+    tr_artifact_data = translate_dataframe(artifact_data_4326)
+
+    # pass legend and use the default setting -> read 'create_vector_artifact' explanation.
     return create_vector_artifact(
         data=tr_artifact_data,
-        metadata=gridded_artifact_classdata_metadata,
+        metadata=metadata,
         label=output_column,
         legend=Legend(legend_data=tr_color_map),
         resources=resources,
     )
+
+
+def build_gridded_raster_artifact_classdata(
+    uncalculated_census_data: gpd.GeoDataFrame | pd.DataFrame, resources: ComputationResources, output: ClassdataOutput
+) -> Artifact:
+    """Build the layer of `build_gridded_artifact_classdata` as raster of the class codes with their colormap."""
+    metadata, color_map = describe_classdata_layer(output)
+
+    category_codes = pd.Index(list(color_map)).get_indexer(uncalculated_census_data[output])
+    nodata = np.iinfo(np.uint8).max
+    raster, transform = rasterize_cells(
+        uncalculated_census_data['x_mp_100m'],
+        uncalculated_census_data['y_mp_100m'],
+        np.where(category_codes < 0, nodata, category_codes).astype(np.uint8),
+        nodata=nodata,
+    )
+    return create_raster_artifact(
+        data=RasterInfo(
+            data=raster,
+            crs=CRS.from_epsg(3035),
+            transformation=transform,
+            colormap=build_raster_colormap(np.array(list(color_map.values()), dtype=object)),
+            nodata=nodata,
+        ),
+        metadata=metadata,
+        legend=Legend(legend_data={tr(k): v for k, v in color_map.items()}),
+        resources=resources,
+    )
+
+
+def build_combined_gridded_artifact(
+    result: gpd.GeoDataFrame | pd.DataFrame,
+    uncalculated_census_data: gpd.GeoDataFrame | pd.DataFrame,
+    resources: ComputationResources,
+) -> Artifact:
+    """Build a single layer with the outputs of all gridded layers and class data layers as attributes of each cell.
+
+    The cell polygons are only serialized once. The cells are coloured like the per capita direct emissions layer, the
+    colours of the other layers are listed in the table of `build_combined_styling_artifact`.
+    """
+    layers = [describe_gridded_layer(output, is_per_capita) for output, is_per_capita in GRIDDED_LAYERS]
+
+    cell_polygons = build_cell_polygons(result)
+    combined_data = result[[layer.output_column for layer in layers]].join(
+        uncalculated_census_data[list(ClassdataOutput)], how='left'
+    )
+    combined_data_4326 = translate_dataframe(
+        gpd.GeoDataFrame(data=combined_data, geometry=cell_polygons.values, crs=cell_polygons.crs)
+    )
+
+    default_layer = layers[0]
+    color_lut = get_color_lut(GRIDDED_CMAP, under_color=UNDER_COLOR)
+    combined_data_4326['color'] = lookup_colors(
+        result[default_layer.output_column],
+        vmin=default_layer.legend_lower_cap,
+        vmax=default_layer.legend_upper_cap,
+        color_lut=color_lut,
+    )
+    return create_vector_artifact(
+        data=combined_data_4326,
+        metadata=ArtifactMetadata(
+            name=tr('Heating emissions and parameters (all layers)'),
+            summary=tr('Estimated heating emissions and parameters per 100-m pixel in a single layer'),
+            description=tr(
+                'All **estimated** heating emissions, emission factors, energy consumption, living space, dominant '
+                'building construction year and energy carrier per 100-m pixel. The pixels are coloured by the per '
+                'capita direct CO₂ emissions.'
+            ),
+            filename=COMBINED_FILE_NAME,
+            tags={tr(Topics.DIRECT_EMISSIONS), tr(Topics.LIFE_CYCLE_EMISSIONS), tr(Topics.PARAMETERS)},
+        ),
+        label=default_layer.output_column,
+        legend=default_layer.legend,
+        resources=resources,
+    )
+
+
+def build_combined_styling_artifact(resources: ComputationResources) -> Artifact:
+    """Build a table with the name and colours of each attribute of the combined gridded layer, so clients can style
+    it like the individual gridded layers.
+    """
+    layers = [describe_gridded_layer(output, is_per_capita) for output, is_per_capita in GRIDDED_LAYERS]
+    classdata_layers = {output: describe_classdata_layer(output) for output in ClassdataOutput}
+    return create_table_artifact(
+        data=describe_combined_styling(layers, classdata_layers),
+        metadata=ArtifactMetadata(
+            name=tr('Styling of the heating emissions and parameters (all layers)'),
+            summary=tr('Name and colours of each attribute of the layer with all heating emissions and parameters'),
+            filename=f'{COMBINED_FILE_NAME}_styling',
+            tags={tr(Topics.PARAMETERS)},
+        ),
+        resources=resources,
+    )
+
+
+def describe_combined_styling(
+    layers: list[GriddedLayer],
+    classdata_layers: dict[ClassdataOutput, tuple[ArtifactMetadata, dict[str, Color]]],
+) -> pd.DataFrame:
+    """Describe the styling of each attribute of the combined gridded layer, one row per attribute.
+
+    Continuous attributes are coloured with `cmap` from `vmin` to `vmax` and `under_color` below it, categorical
+    attributes with the JSON mapping of each category to its colour in `colors`.
+    """
+    continuous_styling = pd.DataFrame(
+        {
+            'column': [layer.output_column for layer in layers],
+            'name': [layer.metadata.name for layer in layers],
+            'type': 'continuous',
+            'cmap': GRIDDED_CMAP,
+            'vmin': [layer.legend_lower_cap for layer in layers],
+            'vmax': [layer.legend_upper_cap for layer in layers],
+            'under_color': UNDER_COLOR,
+        }
+    )
+    categorical_styling = pd.DataFrame(
+        {
+            'column': list(classdata_layers),
+            'name': [metadata.name for metadata, _ in classdata_layers.values()],
+            'type': 'categorical',
+            'colors': [
+                json.dumps(
+                    {tr(category): color.as_hex(format='long') for category, color in color_map.items()},
+                    ensure_ascii=False,
+                )
+                for _, color_map in classdata_layers.values()
+            ],
+        }
+    )
+    return pd.concat([continuous_styling, categorical_styling], ignore_index=True).set_index('column')
+
+
+@cache
+def get_color_lut(cmap_name: str, under_color: str) -> np.ndarray:
+    """Get the colours of a matplotlib colormap as lookup table of `Color`s, followed by its under, over and bad
+    colour.
+    """
+    cmap = matplotlib.colormaps.get(cmap_name)
+    cmap.set_under(under_color)
+    rgba = np.vstack([cmap(np.arange(cmap.N)), cmap.get_under(), cmap.get_over(), cmap.get_bad()])
+    return np.array([Color(to_hex(color)) for color in rgba], dtype=object)
+
+
+def lookup_colors(values: pd.Series, vmin: float, vmax: float, color_lut: np.ndarray) -> np.ndarray:
+    """Colour the values like `cmap(Normalize(vmin, vmax)(value))` does, but for all values in one lookup.
+
+    The normalized values are quantized into the colours of the lookup table from `get_color_lut`. Values below `vmin`
+    get the under colour, values above `vmax` the over colour and missing values the bad colour.
+    """
+    return color_lut[lookup_color_indices(values, vmin=vmin, vmax=vmax, n_colors=len(color_lut) - 3)]
+
+
+def lookup_color_indices(values: pd.Series, vmin: float, vmax: float, n_colors: int) -> np.ndarray:
+    """Quantize the values into the indices of a colour lookup table with `n_colors` colours, see `lookup_colors`."""
+    with np.errstate(invalid='ignore'):
+        scaled = (values.to_numpy(dtype=float) - vmin) / (vmax - vmin) * n_colors
+        scaled[scaled == n_colors] = n_colors - 1
+        lut_indices = scaled.astype(int)
+    lut_indices[scaled < 0] = n_colors
+    lut_indices[scaled >= n_colors] = n_colors + 1
+    lut_indices[np.isnan(scaled)] = n_colors + 2
+    return lut_indices
+
+
+def lookup_category_colors(values: pd.Series, color_map: dict[str, Color]) -> np.ndarray:
+    """Colour the values by their category codes, values without a colour in `color_map` get NaN."""
+    category_codes = pd.Index(list(color_map)).get_indexer(values)
+    category_colors = np.array([*color_map.values(), np.nan], dtype=object)
+    return category_colors[category_codes]
+
+
+def build_raster_colormap(colors: np.ndarray) -> dict[int, tuple[int, int, int, int]]:
+    """Convert colours to a raster colormap from pixel value to opaque RGBA colour."""
+    return {index: (*color.as_rgb_tuple(alpha=False), 255) for index, color in enumerate(colors)}
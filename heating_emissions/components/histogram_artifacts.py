@@ -1,5 +1,10 @@
+import warnings
+from dataclasses import dataclass
+from typing import Callable, Optional
+
 import geopandas as gpd
 import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
 from climatoology.base.artifact import Artifact, ArtifactMetadata
 from climatoology.base.artifact_creators import create_plotly_chart_artifact
@@ -9,23 +14,154 @@ from plotly.graph_objs import Figure
 
 from heating_emissions.components.utils import Topics
 
+# Upper limit of the number of histogram bins, the bins are usually coarser
+HISTOGRAM_MAX_BINS = 100
+# The metrics shown in the histograms and the factor converting them to the shown unit
+HISTOGRAM_METRICS = {
+    'direct_co2_emissions_per_capita': 1e-3,  # in tonnes
+    'life_cycle_co2_emissions_per_capita': 1e-3,  # in tonnes
+    'heat_consumption': 1,
+    'direct_emission_factor': 1,
+    'life_cycle_emission_factor': 1,
+}
+HISTOGRAM_QUANTILES = {'q25': 0.25, 'median': 0.5, 'q75': 0.75}
+
+
+@dataclass
+class HistogramBins:
+    """Histogram of the values of all cells, binned on the server so only the bins are sent with the chart."""
+
+    edges: np.ndarray
+    percentages: np.ndarray
+
+
+def summarize_histogram_metrics(census_data: pd.DataFrame, metrics: Optional[list[str]] = None) -> pd.DataFrame:
+    """Compute the statistics of all histogram metrics at once, in the unit shown in the histograms.
+
+    Missing values are ignored, the population-weighted mean weighs each cell by its population if the data has one.
+
+    :return: a data frame with the `count`, `mean`, `min`, `max`, `population_weighted_mean` and the quantiles in
+        `HISTOGRAM_QUANTILES` of each metric
+    """
+    metrics = list(HISTOGRAM_METRICS) if metrics is None else metrics
+    values = census_data[metrics].to_numpy(dtype=float) * np.array([HISTOGRAM_METRICS[metric] for metric in metrics])
+    values[~np.isfinite(values)] = np.nan
+    finite = ~np.isnan(values)
+
+    if 'population' in census_data:
+        population = np.nan_to_num(census_data['population'].to_numpy(dtype=float))[:, np.newaxis]
+        weights = np.where(finite, population, 0).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            population_weighted_mean = np.nansum(values * population, axis=0) / weights
+        population_weighted_mean[weights == 0] = np.nan
+    else:
+        population_weighted_mean = np.full(len(metrics), np.nan)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # metrics without any value
+        statistics = {
+            'count': finite.sum(axis=0),
+            'mean': np.nanmean(values, axis=0),
+            'min': np.nanmin(values, axis=0),
+            'max': np.nanmax(values, axis=0),
+            'population_weighted_mean': population_weighted_mean,
+        }
+        quantiles = np.nanquantile(values, list(HISTOGRAM_QUANTILES.values()), axis=0)
+    statistics.update(zip(HISTOGRAM_QUANTILES, quantiles))
+    return pd.DataFrame(statistics, index=pd.Index(metrics, name='metric'))
+
+
+def bin_metric(census_data: pd.DataFrame, metric: str, statistics: Optional[pd.DataFrame] = None) -> HistogramBins:
+    """Bin a histogram metric of the census data, with the statistics from `summarize_histogram_metrics` if given."""
+    if statistics is None:
+        statistics = summarize_histogram_metrics(census_data, metrics=[metric])
+    values = census_data[metric].to_numpy(dtype=float) * HISTOGRAM_METRICS[metric]
+    return bin_histogram(values, statistics.loc[metric])
+
+
+def bin_histogram(values: np.ndarray, statistics: pd.Series, max_bins: int = HISTOGRAM_MAX_BINS) -> HistogramBins:
+    """Bin the values into equally wide bins starting at a multiple of a round bin width, like Plotly's auto-binning.
+
+    The bin width follows numpy's 'auto' estimator, computed from the precomputed statistics of the values, and is
+    rounded up to 1, 2, 2.5 or 5 times a power of ten.
+    """
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return HistogramBins(edges=np.array([0.0, 1.0]), percentages=np.zeros(1))
+
+    value_range = statistics['max'] - statistics['min']
+    if value_range > 0:
+        sturges_width = value_range / (np.log2(len(values)) + 1)
+        freedman_diaconis_width = 2 * (statistics['q75'] - statistics['q25']) / np.cbrt(len(values))
+        auto_width = min(freedman_diaconis_width, sturges_width) if freedman_diaconis_width > 0 else sturges_width
+        n_bins = min(int(np.ceil(value_range / auto_width)), max_bins)
+        bin_width = nice_bin_width(value_range / n_bins)
+    else:
+        bin_width = nice_bin_width(abs(statistics['max']) / 10 or 1)
 
-def format_summary(summary: str, figure: Figure) -> str:
+    # Rounded before flooring, so values on a bin edge are not pushed into the bin below by floating point errors
+    bin_indices = np.floor(np.round(values / bin_width, 9)).astype(np.int64)
+    first_bin = bin_indices.min()
+    counts = np.bincount(bin_indices - first_bin)
+    return HistogramBins(
+        edges=(first_bin + np.arange(len(counts) + 1)) * bin_width,
+        percentages=counts / len(values) * 100,
+    )
+
+
+def nice_bin_width(width: float) -> float:
+    """Round a bin width up to 1, 2, 2.5 or 5 times a power of ten."""
+    magnitude = 10 ** np.floor(np.log10(width))
+    return next(step * magnitude for step in [1, 2, 2.5, 5, 10] if step * magnitude >= width)
+
+
+def build_histogram_bars(bins: HistogramBins, hovertemplate: str) -> go.Bar:
+    """Draw the bins as adjacent bars, hovering shows the bin range where the template shows `%{x}`."""
+    bin_ranges = [f'{start:.4g} - {end:.4g}' for start, end in zip(bins.edges[:-1], bins.edges[1:])]
+    return go.Bar(
+        x=(bins.edges[:-1] + bins.edges[1:]) / 2,
+        y=bins.percentages,
+        width=np.diff(bins.edges),
+        customdata=bin_ranges,
+        hovertemplate=hovertemplate.replace('%{x}', '%{customdata}'),
+    )
+
+
+def format_summary(summary: str, statistics: pd.Series) -> str:
+    """Fill the summary with the statistics of a metric from `summarize_histogram_metrics`."""
     return summary.format(
-        mean_data=round(np.mean(figure['data'][0].x), 2),
-        min_data=round(np.min(figure['data'][0].x), 2),
-        max_data=round(np.max(figure['data'][0].x), 2),
+        mean_data=round(statistics['mean'], 2),
+        min_data=round(statistics['min'], 2),
+        max_data=round(statistics['max'], 2),
     )
 
 
-def build_per_capita_direct_co2_histogram_artifact(aoi_aggregate: Figure, resources: ComputationResources) -> Artifact:
+def build_histogram_artifact(
+    plot_histogram: Callable[..., Figure],
+    build_artifact: Callable[..., Artifact],
+    metric: str,
+    census_data: pd.DataFrame,
+    statistics: pd.DataFrame,
+    resources: ComputationResources,
+) -> Artifact:
+    """Plot the histogram of a metric with one of the `plot_*_histogram` functions and build its artifact."""
+    return build_artifact(
+        aoi_aggregate=plot_histogram(census_data=census_data, statistics=statistics),
+        statistics=statistics.loc[metric],
+        resources=resources,
+    )
+
+
+def build_per_capita_direct_co2_histogram_artifact(
+    aoi_aggregate: Figure, statistics: pd.Series, resources: ComputationResources
+) -> Artifact:
     summary = tr(
         'Average direct carbon dioxide emissions from heating residential buildings (estimated) '
         'are {mean_data} tonnes per person per year, '
         'but range from {min_data} to '
         ' {max_data} tonnes.'
     )
-    summary = format_summary(summary, aoi_aggregate)
+    summary = format_summary(summary, statistics)
     per_capita_direct_co2_histogram_artifact_metadata = ArtifactMetadata(
         name=tr('Histogram of per capita direct emissions'),
         summary=summary,
@@ -40,7 +176,7 @@ def build_per_capita_direct_co2_histogram_artifact(aoi_aggregate: Figure, resour
 
 
 def build_per_capita_life_cycle_co2_histogram_artifact(
-    aoi_aggregate: Figure, resources: ComputationResources
+    aoi_aggregate: Figure, statistics: pd.Series, resources: ComputationResources
 ) -> Artifact:
     summary = tr(
         'Average life cycle GHG emissions from heating residential buildings (estimated) '
@@ -48,7 +184,7 @@ def build_per_capita_life_cycle_co2_histogram_artifact(
         'but range from {min_data} to '
         ' {max_data} tonnes.'
     )
-    summary = format_summary(summary, aoi_aggregate)
+    summary = format_summary(summary, statistics)
     per_capita_life_cycle_co2_histogram_artifact_metadata = ArtifactMetadata(
         name=tr('Histogram of per capita life cycle emissions'),
         summary=summary,
@@ -62,14 +198,16 @@ def build_per_capita_life_cycle_co2_histogram_artifact(
     )
 
 
-def build_energy_histogram_artifact(aoi_aggregate: Figure, resources: ComputationResources) -> Artifact:
+def build_energy_histogram_artifact(
+    aoi_aggregate: Figure, statistics: pd.Series, resources: ComputationResources
+) -> Artifact:
     summary = tr(
         'Average heating energy consumption in residential buildings (estimated) '
         'is {mean_data} kWh per square meter per year, '
         'but range from {min_data} to '
         ' {max_data} .'
     )
-    summary = format_summary(summary, aoi_aggregate)
+    summary = format_summary(summary, statistics)
     energy_histogram_artifact_metadata = ArtifactMetadata(
         name=tr('Histogram of energy consumption'),
         summary=summary,
@@ -83,14 +221,16 @@ def build_energy_histogram_artifact(aoi_aggregate: Figure, resources: Computatio
     )
 
 
-def build_direct_emission_factor_histogram_artifact(aoi_aggregate: Figure, resources: ComputationResources) -> Artifact:
+def build_direct_emission_factor_histogram_artifact(
+    aoi_aggregate: Figure, statistics: pd.Series, resources: ComputationResources
+) -> Artifact:
     summary = tr(
         'Average direct emission factor from heating residential buildings (estimated) '
         'is {mean_data} kg of carbon dioxide per kWh, '
         'but range from {min_data} to '
         ' {max_data}.'
     )
-    summary = format_summary(summary, aoi_aggregate)
+    summary = format_summary(summary, statistics)
     direct_emission_factor_histogram_artifact_metadata = ArtifactMetadata(
         name=tr('Histogram of direct emission factor'),
         summary=summary,
@@ -105,7 +245,7 @@ def build_direct_emission_factor_histogram_artifact(aoi_aggregate: Figure, resou
 
 
 def build_life_cycle_emission_factor_histogram_artifact(
-    aoi_aggregate: Figure, resources: ComputationResources
+    aoi_aggregate: Figure, statistics: pd.Series, resources: ComputationResources
 ) -> Artifact:
     summary = tr(
         'Average life cycle emission factor from heating residential buildings (estimated) '
@@ -113,7 +253,7 @@ def build_life_cycle_emission_factor_histogram_artifact(
         'but range from {min_data} to '
         ' {max_data}.'
     )
-    summary = format_summary(summary, aoi_aggregate)
+    summary = format_summary(summary, statistics)
     life_cycle_emission_factor_histogram_artifact_metadata = ArtifactMetadata(
         name=tr('Histogram of life cycle emission factor'),
         summary=summary,
@@ -129,14 +269,15 @@ def build_life_cycle_emission_factor_histogram_artifact(
 
 def plot_per_capita_direct_co2_histogram(
     census_data: gpd.GeoDataFrame,
+    statistics: Optional[pd.DataFrame] = None,
 ) -> Figure:
+    bins = bin_metric(census_data, 'direct_co2_emissions_per_capita', statistics)
     hist_plot = Figure(
-        data=go.Histogram(
-            x=census_data['direct_co2_emissions_per_capita'] / 1e3,  # result in tonnes,
+        data=build_histogram_bars(
+            bins,
             hovertemplate=tr(
                 '%{y:.1f} % of cells emit %{x} tonnes of carbon dioxide per person per year <extra></extra>'
             ),
-            histnorm='percent',
         ),
         layout=go.Layout(
             title=dict(
@@ -145,6 +286,7 @@ def plot_per_capita_direct_co2_histogram(
             ),
             font=dict(size=12),
             xaxis=dict(title=dict(text=tr('annual tonnes of carbon dioxide per person'))),
+            bargap=0,
         ),
     )
     hist_plot.add_vline(
@@ -160,12 +302,13 @@ def plot_per_capita_direct_co2_histogram(
 
 def plot_per_capita_life_cycle_co2_histogram(
     census_data: gpd.GeoDataFrame,
+    statistics: Optional[pd.DataFrame] = None,
 ) -> Figure:
+    bins = bin_metric(census_data, 'life_cycle_co2_emissions_per_capita', statistics)
     hist_plot = Figure(
-        data=go.Histogram(
-            x=census_data['life_cycle_co2_emissions_per_capita'] / 1e3,  # result in tonnes,
+        data=build_histogram_bars(
+            bins,
             hovertemplate=tr('%{y:.1f} % of cells emit %{x} tonnes of kg CO₂-eq. per person per year <extra></extra>'),
-            histnorm='percent',
         ),
         layout=go.Layout(
             title=dict(
@@ -174,6 +317,7 @@ def plot_per_capita_life_cycle_co2_histogram(
             ),
             font=dict(size=12),
             xaxis=dict(title=dict(text=tr('annual tonnes of CO₂-eq. per person'))),
+            bargap=0,
         ),
     )
     hist_plot.add_vline(
@@ -189,15 +333,16 @@ def plot_per_capita_life_cycle_co2_histogram(
 
 def plot_energy_consumption_histogram(
     census_data: gpd.GeoDataFrame,
+    statistics: Optional[pd.DataFrame] = None,
 ) -> Figure:
+    bins = bin_metric(census_data, 'heat_consumption', statistics)
     hist_plot = Figure(
-        data=go.Histogram(
-            x=census_data['heat_consumption'],
+        data=build_histogram_bars(
+            bins,
             hovertemplate=tr(
                 'Buildings in %{y:.1f} % of cells consume %{x} kWh of heating energy'
                 ' per square meter per year <extra></extra>'
             ),
-            histnorm='percent',
         ),
         layout=go.Layout(
             title=dict(
@@ -206,6 +351,7 @@ def plot_energy_consumption_histogram(
             ),
             font=dict(size=12),
             xaxis=dict(title=dict(text=tr('kWh per square meter per year'))),
+            bargap=0,
         ),
     )
     hist_plot.add_vline(
@@ -221,15 +367,16 @@ def plot_energy_consumption_histogram(
 
 def plot_direct_emission_factor_histogram(
     census_data: gpd.GeoDataFrame,
+    statistics: Optional[pd.DataFrame] = None,
 ) -> Figure:
+    bins = bin_metric(census_data, 'direct_emission_factor', statistics)
     hist_plot = Figure(
-        data=go.Histogram(
-            x=census_data['direct_emission_factor'],
+        data=build_histogram_bars(
+            bins,
             hovertemplate=tr(
                 'Buildings in %{y:.1f} % of cells emit %{x} kg of carbon dioxide'
                 ' per kWh of heating energy used <extra></extra>'
             ),
-            histnorm='percent',
         ),
         layout=go.Layout(
             title=dict(
@@ -238,6 +385,7 @@ def plot_direct_emission_factor_histogram(
             ),
             font=dict(size=12),
             xaxis=dict(title=dict(text=tr('kg of carbon dioxide per kWh of heating'))),
+            bargap=0,
         ),
     )
     hist_plot.add_vline(
@@ -253,15 +401,16 @@ def plot_direct_emission_factor_histogram(
 
 def plot_life_cycle_emission_factor_histogram(
     census_data: gpd.GeoDataFrame,
+    statistics: Optional[pd.DataFrame] = None,
 ) -> Figure:
+    bins = bin_metric(census_data, 'life_cycle_emission_factor', statistics)
     hist_plot = Figure(
-        data=go.Histogram(
-            x=census_data['life_cycle_emission_factor'],
+        data=build_histogram_bars(
+            bins,
             hovertemplate=tr(
                 'Buildings in %{y:.1f} % of cells emit %{x} kg of carbon dioxide'
                 ' per kWh of heating energy used <extra></extra>'
             ),
-            histnorm='percent',
         ),
         layout=go.Layout(
             title=dict(
@@ -270,6 +419,7 @@ def plot_life_cycle_emission_factor_histogram(
             ),
             font=dict(size=12),
             xaxis=dict(title=dict(text=tr('kg of carbon dioxide per kWh of heating'))),
+            bargap=0,
         ),
     )
     hist_plot.add_vline(
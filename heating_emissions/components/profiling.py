@@ -0,0 +1,125 @@
+import json
+import logging
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+log = logging.getLogger(__name__)
+
+# Name of the file the profile is written to in the computation directory
+PROFILE_FILE_NAME = 'computation_profile.json'
+
+
+@dataclass
+class StageRecord:
+    """Resources used by a stage of a computation.
+
+    The CPU time is that of the thread running the stage. The peak memory is the peak of the memory traced by
+    tracemalloc above the memory traced when the stage started, it is only approximate if stages run concurrently.
+    The process peak RSS is not specific to the stage: it is the peak resident set size of the whole process since it
+    started, as reported by the operating system when the stage ended.
+    """
+
+    stage: str
+    wall_time: float = 0.0  # s
+    cpu_time: float = 0.0  # s
+    rows: Optional[int] = None
+    peak_memory: Optional[int] = None  # bytes, only if memory is traced
+    process_peak_rss: Optional[int] = None  # bytes
+
+
+@dataclass
+class ComputationProfile:
+    """The stages of a computation in the order they finished."""
+
+    stages: list[StageRecord] = field(default_factory=list)
+    trace_memory: bool = False
+    wall_time: float = 0.0  # s, of the whole computation
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, record: StageRecord) -> None:
+        with self.lock:
+            self.stages.append(record)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                'wall_time': self.wall_time,
+                'stages': [asdict(record) for record in self.stages],
+            }
+
+    def write(self, path: Path) -> None:
+        with open(path, 'w') as profile_file:
+            json.dump(self.to_dict(), profile_file, indent=2)
+
+
+# The profile of the running computation, copied into the threads of the artifact executor
+current_profile: ContextVar[Optional[ComputationProfile]] = ContextVar('current_profile', default=None)
+
+
+@contextmanager
+def profile_computation(trace_memory: bool = False) -> Iterator[ComputationProfile]:
+    """Collect the stages recorded by `profile_stage` within the block, and log the profile at its end.
+
+    :param trace_memory: trace the memory allocated by each stage with tracemalloc, which slows down allocations
+    """
+    profile = ComputationProfile(trace_memory=trace_memory)
+    token = current_profile.set(profile)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    start_wall_time = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.wall_time = time.perf_counter() - start_wall_time
+        if started_tracing:
+            tracemalloc.stop()
+        current_profile.reset(token)
+        log.info(f'Computation profile: {json.dumps(profile.to_dict())}')
+
+
+@contextmanager
+def profile_stage(stage: str) -> Iterator[StageRecord]:
+    """Record the wall time, CPU time and memory of a stage in the profile of the running computation.
+
+    Set the `rows` of the yielded record to record the size of the stage's data. Outside a computation profile the
+    stage is not recorded.
+    """
+    record = StageRecord(stage=stage)
+    profile = current_profile.get()
+    if profile is None:
+        yield record
+        return
+
+    trace_memory = profile.trace_memory and tracemalloc.is_tracing()
+    if trace_memory:
+        start_memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+    start_wall_time, start_cpu_time = time.perf_counter(), time.thread_time()
+    try:
+        yield record
+    finally:
+        record.wall_time = time.perf_counter() - start_wall_time
+        record.cpu_time = time.thread_time() - start_cpu_time
+        if trace_memory:
+            record.peak_memory = max(tracemalloc.get_traced_memory()[1] - start_memory, 0)
+        record.process_peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        profile.add(record)
+
+
+def profiled(stage: str, function: Callable) -> Callable:
+    """Wrap a function, e.g. a task of the artifact executor, to record its calls as stage."""
+    return partial(run_profiled, stage, function)
+
+
+def run_profiled(stage: str, function: Callable, *args, **kwargs):
+    with profile_stage(stage):
+        return function(*args, **kwargs)
@@ -0,0 +1,112 @@
+from dataclasses import dataclass, field
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from climatoology.base.logging import get_climatoology_logger
+
+from heating_emissions.components.census_data import category_factor_matrix, weighted_category_factors
+from heating_emissions.components.utils import (
+    BUILDING_AGES,
+    ENERGY_SOURCES,
+    HEAT_CONSUMPTION,
+    calculate_co2_emissions,
+)
+
+log = get_climatoology_logger(__name__)
+
+
+@dataclass
+class EmissionScenario:
+    """A set of emission factors (in kg of CO2 per kWh) per energy carrier and heat consumptions (in kWh/m2) per
+    building age to evaluate the census data with, e.g. `EMISSION_FACTORS_DIRECT` with more heat pumps.
+
+    Energy carriers and building ages missing from the tables are assigned a factor of 0.
+    """
+
+    name: str
+    emission_factors: dict[str, float]
+    heat_consumption: dict[str, float] = field(default_factory=lambda: dict(HEAT_CONSUMPTION))
+
+
+@dataclass
+class ScenarioResults:
+    """The per-cell results of each scenario as data frames with one column per scenario, and their aggregates."""
+
+    heat_consumption: pd.DataFrame
+    emission_factor: pd.DataFrame
+    co2_emissions: pd.DataFrame
+    co2_emissions_per_capita: pd.DataFrame
+    summary: pd.DataFrame
+
+
+def evaluate_scenarios(
+    raster_grid: gpd.GeoDataFrame, census_tables: dict[str, pd.DataFrame], scenarios: list[EmissionScenario]
+) -> ScenarioResults:
+    """Calculate the heating emissions of all scenarios at once from the raw census tables.
+
+    The census data, e.g. from `collect_census_tables`, is only fetched once: the normalized building counts per cell
+    are multiplied with the factors of all scenarios in a single (cells x categories) x (categories x scenarios)
+    product. Gaps are filled as in `clean_census_tables`, and the emissions are calculated by the same
+    `calculate_co2_emissions` as the plugin's, so a scenario with the module's factors reproduces its results.
+    """
+    scenario_names = [scenario.name for scenario in scenarios]
+    if len(set(scenario_names)) != len(scenario_names):
+        raise ValueError(f'Scenario names must be unique: {scenario_names}')
+    log.info(f'Evaluating {len(scenarios)} emission scenarios for {len(raster_grid)} grid cells')
+
+    building_ages_columns = [age for age in BUILDING_AGES if age != 'unknown']
+    building_ages = census_tables['census_de.residential_buildings_by_year'][building_ages_columns].fillna(0)
+    building_ages = building_ages[~(building_ages.sum(axis='columns') < 1)]
+    heat_consumption = pd.DataFrame(
+        weighted_category_factors(
+            building_ages.to_numpy(dtype=float),
+            category_factor_matrix(building_ages_columns, *[scenario.heat_consumption for scenario in scenarios]),
+        ),
+        index=building_ages.index,
+        columns=scenario_names,
+    )
+    heat_consumption = heat_consumption.fillna(heat_consumption.mean()).reindex(raster_grid.index)
+
+    building_energy_columns = [carrier for carrier in ENERGY_SOURCES if carrier != 'unknown']
+    energy_sources = census_tables['census_de.residential_heating_sources'][building_energy_columns].fillna(0)
+    emission_factor = pd.DataFrame(
+        weighted_category_factors(
+            energy_sources.to_numpy(dtype=float),
+            category_factor_matrix(building_energy_columns, *[scenario.emission_factors for scenario in scenarios]),
+        ),
+        index=energy_sources.index,
+        columns=scenario_names,
+    )
+    emission_factor = emission_factor.fillna(emission_factor.mean()).reindex(raster_grid.index)
+
+    population = census_tables['census_de.population']['population'].fillna(0).reindex(raster_grid.index)
+    average_sqm_per_person = census_tables['census_de.residential_living_space']['average_sqm_per_person'].fillna(0)
+    average_sqm_per_person = average_sqm_per_person.reindex(raster_grid.index)
+
+    emissions = calculate_co2_emissions(
+        population=population,
+        average_sqm_per_person=average_sqm_per_person,
+        heat_consumption=heat_consumption,
+        emission_factor=emission_factor,
+    )
+
+    total_population = population.sum()
+    summary = pd.DataFrame(
+        {
+            'co2_emissions': emissions.co2_emissions.sum(),
+            'co2_emissions_per_capita': (
+                emissions.co2_emissions.sum() / total_population if total_population > 0 else np.nan
+            ),
+            'mean_emission_factor': emissions.emission_factor.mean(),
+            'mean_heat_consumption': emissions.heat_consumption.mean(),
+        }
+    ).rename_axis(index='scenario')
+
+    return ScenarioResults(
+        heat_consumption=emissions.heat_consumption,
+        emission_factor=emissions.emission_factor,
+        co2_emissions=emissions.co2_emissions,
+        co2_emissions_per_capita=emissions.co2_emissions_per_capita,
+        summary=summary,
+    )
@@ -1 +1 @@
-from heating_emissions.components.temporal_downscale.demand_ninja.demand_ninja.core import demand
+from heating_emissions.components.temporal_downscale.demand_ninja.demand_ninja.core import demand, demand_grid
@@ -2,6 +2,7 @@ import os
 
 import numpy as np
 import pandas as pd
+from scipy.interpolate import CubicSpline
 
 from heating_emissions.components.temporal_downscale.demand_ninja.demand_ninja.util import (
     get_cdd,
@@ -198,3 +199,117 @@ def demand(
         result = pd.concat((result, hourly_inputs), axis=1)
 
     return result
+
+
+def _energy_demand_from_bait_grid(
+    bait: pd.DataFrame,
+    heating_threshold: float,
+    cooling_threshold: float,
+    base_power: float,
+    heating_power: float,
+    cooling_power: float,
+    use_diurnal_profile: bool,
+) -> dict[str, pd.DataFrame]:
+    """
+    Convert temperatures of many locations, one per column, into energy demand.
+
+    """
+    heating_demand = pd.DataFrame(0.0, index=bait.index, columns=bait.columns)
+    cooling_demand = pd.DataFrame(0.0, index=bait.index, columns=bait.columns)
+
+    # The degree days are computed in the precision of the BAIT and the demand in double precision, like
+    # `_energy_demand_from_bait` does by storing the degree days as lists
+    if heating_power > 0:
+        heating_demand = (heating_threshold - bait).clip(lower=0).astype(np.float64) * heating_power
+
+    if cooling_power > 0:
+        cooling_demand = (bait - cooling_threshold).clip(lower=0).astype(np.float64) * cooling_power
+
+    if use_diurnal_profile:
+        profiles = DIURNAL_PROFILES.loc[bait.index.hour, :]
+        heating_demand = heating_demand.mul(profiles['heating'].to_numpy(), axis='index')
+        cooling_demand = cooling_demand.mul(profiles['cooling'].to_numpy(), axis='index')
+
+    return {
+        'total_demand': base_power + heating_demand + cooling_demand,
+        'heating_demand': heating_demand,
+        'cooling_demand': cooling_demand,
+    }
+
+
+def demand_grid(
+    hourly_inputs: pd.DataFrame,
+    heating_threshold: float = 14,
+    cooling_threshold: float = 20,
+    base_power: float = 0,
+    heating_power: float = 0.3,
+    cooling_power: float = 0.15,
+    smoothing: float = 0.5,
+    solar_gains: float = 0.012,
+    wind_chill: float = -0.20,
+    humidity_discomfort: float = 0.05,
+    use_diurnal_profile: bool = True,
+) -> pd.DataFrame:
+    """
+    Vectorized `demand` for many locations at once, e.g. all points of a weather grid. Returns a pd.DataFrame with
+    (output, location) columns holding the total_demand, heating_demand, and cooling_demand of each location, which
+    are identical to those of `demand` for the single location.
+
+    note: added to the original Demand.ninja
+
+    Params
+    ------
+
+    hourly_inputs : pd.DataFrame
+        Indexed by time, with (variable, location) columns for the humidity,
+        radiation_global_horizontal, temperature and wind_speed_2m of each
+        location. The daily means of all locations must be complete, i.e.
+        locations with missing values have to go through `demand`
+
+    """
+    assert list(sorted(hourly_inputs.columns.unique(level=0))) == [
+        'humidity',
+        'radiation_global_horizontal',
+        'temperature',
+        'wind_speed_2m',
+    ]
+
+    daily_inputs = hourly_inputs.resample('1D').mean()
+    assert not daily_inputs.isna().any(axis=None), 'The daily inputs must not have missing values'
+
+    # Calculate BAIT, each variable is a DataFrame with one column per location
+    daily_bait = _bait(
+        daily_inputs,
+        smoothing,
+        solar_gains,
+        wind_chill,
+        humidity_discomfort,
+    )
+
+    # Upsample BAIT to hourly, fitting the cubic splines of all locations at once the same way
+    # as pd.Series.interpolate(method='cubicspline', limit_direction='both') does for a single one
+    daily_bait.index = pd.date_range(
+        daily_bait.index[0] + pd.Timedelta('12h'),
+        daily_bait.index[-1] + pd.Timedelta('12h'),
+        freq='1D',
+    )
+    hourly_bait = daily_bait.reindex(hourly_inputs.index)
+    valid = hourly_bait.notna().all(axis='columns').to_numpy()
+    if valid.any() and not valid.all():
+        times = np.asarray(hourly_bait.index.asi8)
+        bait_values = hourly_bait.to_numpy(copy=True)
+        bait_values[~valid] = CubicSpline(times[valid], bait_values[valid], axis=0)(times[~valid])
+        hourly_bait = pd.DataFrame(bait_values, index=hourly_bait.index, columns=hourly_bait.columns)
+
+    # Transform to degree days and energy demand
+    result = _energy_demand_from_bait_grid(
+        hourly_bait,
+        heating_threshold,
+        cooling_threshold,
+        base_power,
+        heating_power,
+        cooling_power,
+        use_diurnal_profile,
+    )
+
+    return pd.concat(result, axis='columns', names=['output', hourly_inputs.columns.names[1]], sort=False)
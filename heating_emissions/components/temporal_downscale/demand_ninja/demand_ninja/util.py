@@ -1,27 +1,31 @@
 import pandas as pd
 
 
-def smooth_temperature(temperature: pd.Series, weights: list) -> pd.Series:
+def smooth_temperature(temperature: pd.Series | pd.DataFrame, weights: list) -> pd.Series | pd.DataFrame:
     """
     Smooth a temperature series over time with the given weighting for previous days.
 
     Params
     ------
 
-    temperature : pd.Series
+    temperature : pd.Series or pd.DataFrame
+        A DataFrame holds one temperature series per column
     weights : list
         The weights for smoothing. The first element is how much
         yesterday's temperature will be, the 2nd element is 2 days ago, etc.
 
     """
-    assert isinstance(temperature, pd.Series)
+    assert isinstance(temperature, (pd.Series, pd.DataFrame))  # note: modified to smooth many series at once
     lag = temperature.copy()
     smooth = temperature.copy()
 
     # Run through each weight in turn going one time-step backwards each time
     for w in weights:
         # Create a time series of temperatures the day before
-        lag = lag.shift(1, fill_value=lag.iloc[0])  # note: modified by Gefei lag[0] -> lag.iloc[0]
+        # note: modified lag.shift(1, fill_value=lag.iloc[0]) -> shift and fill the first row, for DataFrames
+        first = lag.iloc[0]
+        lag = lag.shift(1)
+        lag.iloc[0] = first
 
         # Add on these lagged temperatures multiplied by this smoothing factor
         if w != 0:
@@ -1,9 +1,18 @@
 import asyncio
 import glob
+import hashlib
 import logging.config
 import os
+import re
+import shutil
+import tempfile
 import time
+import uuid
 import zipfile
+from datetime import datetime, timedelta, timezone
+from functools import cached_property
+from pathlib import Path
+from typing import Collection, Optional
 
 import numpy as np
 import shapely
@@ -13,23 +22,233 @@ from ecmwf.datastores import Client, Remote
 from requests.exceptions import HTTPError
 
 from heating_emissions.components.temporal_downscale.temporal_utils import VARIABLES_NAMES, era5_data_preprocess
+from heating_emissions.components.utils import get_germany_boundaries
 
 log = logging.getLogger(__name__)
 
+ERA5_RESOLUTION = 0.25  # ERA5 grid resolution in degrees
+# Months requested from the CDS at once, more concurrent requests get deprioritized
+ERA5_MAX_CONCURRENT_MONTHS = 4
+# Preliminary ERA5 data (ERA5T) is replaced by the final data within about three months, only months that ended
+# longer ago are kept in the ERA5 cache
+ERA5_CACHE_MIN_AGE = timedelta(days=90)
+# Chunks of the ERA5 store: a week of hours and blocks of 8 x 8 grid points
+ERA5_STORE_CHUNKS = {'valid_time': 168, 'latitude': 8, 'longitude': 8}
+ERA5_CACHE_FILE_PATTERN = re.compile(r'era5_(\d+)_(\d+)_N(-?\d+)_W(-?\d+)_S(-?\d+)_E(-?\d+)_([0-9a-f]+)\.zip')
 
-def open_era5_data(file_path: str) -> xarray.Dataset:
+
+class Era5Cache:
+    """A persistent cache of the downloaded ERA5 data shared by all computations.
+
+    Each download is stored as the zip file of one month, keyed by the year, the month, the area snapped to the ERA5
+    lattice and a hash of the variable set. A cached month of any area that contains the requested area is reused, the
+    data is sliced to the requested area when it is opened. Files are written atomically, and the least recently used
+    files are evicted once the cache grows beyond `max_size` bytes.
     """
-    Open ERA5 data from a NetCDF file using xarray.
+
+    def __init__(self, cache_dir: Path, max_size: int):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def variables_key(variables: list[str]) -> str:
+        return hashlib.sha1(','.join(sorted(variables)).encode()).hexdigest()[:12]
+
+    def file_path(self, year: int, month: int, area: list[float], variables: list[str]) -> Path:
+        north, west, south, east = np.rint(np.asarray(area) / ERA5_RESOLUTION).astype(np.int64)
+        key = self.variables_key(variables)
+        return self.cache_dir / f'era5_{year}_{month}_N{north}_W{west}_S{south}_E{east}_{key}.zip'
+
+    def find(self, year: int, month: int, area: list[float], variables: list[str]) -> Optional[Path]:
+        """Find the smallest cached file of the month whose area contains the requested area."""
+        north, west, south, east = np.rint(np.asarray(area) / ERA5_RESOLUTION).astype(np.int64)
+        key = self.variables_key(variables)
+        candidates = []
+        for path in self.cache_dir.glob(f'era5_{year}_{month}_*_{key}.zip'):
+            match = ERA5_CACHE_FILE_PATTERN.fullmatch(path.name)
+            if match is None:
+                continue
+            cached_north, cached_west, cached_south, cached_east = (int(value) for value in match.groups()[2:6])
+            if cached_north >= north and cached_west <= west and cached_south <= south and cached_east >= east:
+                candidates.append(((cached_north - cached_south) * (cached_east - cached_west), path))
+        return min(candidates)[1] if candidates else None
+
+    def fetch(self, year: int, month: int, area: list[float], variables: list[str], target: Path) -> bool:
+        """Hard link (or copy) a cached file containing the requested area to `target` and mark it as recently used.
+
+        :return: whether the month was found in the cache
+        """
+        path = self.find(year, month, area, variables)
+        if path is None:
+            return False
+        try:
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copyfile(path, target)
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by a concurrent computation
+            return False
+        log.debug(f'Using cached ERA5 data {path.name} for {year}-{month:02d}')
+        return True
+
+    def store(self, year: int, month: int, area: list[float], variables: list[str], source: Path) -> None:
+        """Copy a downloaded file to the cache, atomically so concurrent computations never read a partial file.
+
+        Months that may still hold preliminary data are not cached.
+        """
+        month_end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+        if datetime.now(timezone.utc) - month_end < ERA5_CACHE_MIN_AGE:
+            log.debug(f'Not caching the ERA5 data of {year}-{month:02d}, it may still be preliminary')
+            return
+        path = self.file_path(year, month, area, variables)
+        tmp_path = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+
+    def evict(self) -> None:
+        """Delete the least recently used files beyond `max_size`."""
+        cached_files = []
+        for path in self.cache_dir.glob('era5_*.zip'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            cached_files.append((stat.st_mtime, stat.st_size, path))
+
+        cache_size = sum(size for _, size, _ in cached_files)
+        for _, size, path in sorted(cached_files):
+            if cache_size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            cache_size -= size
+        log.debug(f'ERA5 cache holds {cache_size} bytes')
+
+
+class Era5Store:
+    """A local store of the ERA5 data covering the whole of Germany, filled ahead of time by `fill`.
+
+    Each month is stored as a NetCDF4 file chunked by time and small spatial blocks, so opening an AOI lazily reads
+    only the chunks of its window and computations need no download for the stored months.
     """
-    import xarray as xr
 
-    log.debug(f'Loading ERA5 data from {file_path}...')
+    def __init__(self, store_dir: Path):
+        self.store_dir = store_dir
+
+    @cached_property
+    def area(self) -> list[float]:
+        """The area [North, West, South, East] of the store, covering the buffered boundaries of Germany."""
+        germany = get_germany_boundaries().to_crs('EPSG:4326')
+        return get_era5_area(germany.union_all())
+
+    def month_path(self, year: int, month: int) -> Path:
+        return self.store_dir / f'era5_germany_{year}_{month:02d}.nc'
+
+    def covers(self, year: int, month: int, area: list[float]) -> bool:
+        """Check whether the month is stored and the store contains the requested area."""
+        north, west, south, east = area
+        store_north, store_west, store_south, store_east = self.area
+        return (
+            store_north >= north
+            and store_west <= west
+            and store_south <= south
+            and store_east >= east
+            and self.month_path(year, month).exists()
+        )
+
+    def open(self, year: int, month: int, area: list[float]) -> xarray.Dataset:
+        """Read and preprocess the stored data of a month within the area [North, West, South, East]."""
+        north, west, south, east = area
+        # ERA5 latitudes are descending
+        with xarray.open_dataset(self.month_path(year, month), engine='netcdf4') as dataset:
+            dataset = dataset.sel(latitude=slice(north, south), longitude=slice(west, east)).load()
+        return era5_data_preprocess(dataset)
+
+    def write_month(self, year: int, month: int, dataset: xarray.Dataset) -> None:
+        """Write the raw ERA5 data of a month, atomically so computations never read a partial file."""
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        encoding = {
+            variable: {
+                'zlib': True,
+                'complevel': 4,
+                'chunksizes': tuple(
+                    min(ERA5_STORE_CHUNKS.get(dim, size), size) for dim, size in dataset[variable].sizes.items()
+                ),
+            }
+            for variable in dataset.data_vars
+            if dataset[variable].ndim > 0
+        }
+        path = self.month_path(year, month)
+        tmp_path = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+        dataset.to_netcdf(tmp_path, engine='netcdf4', encoding=encoding)
+        os.replace(tmp_path, path)
+
+    def fill(
+        self, cdsapi_client: Client, years: range, refresh: bool = False, runtime_limit: float = 12 * 60 * 60
+    ) -> list[tuple[int, int]]:
+        """Download the months of the given years that are missing in the store, or all of them if `refresh` is set.
+
+        Months that may still hold preliminary data are left out.
+
+        :return: the (year, month) written to the store
+        """
+        now = datetime.now(timezone.utc)
+        written = []
+        for year in years:
+            months = [
+                month
+                for month in range(1, 13)
+                if now - datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc) >= ERA5_CACHE_MIN_AGE
+                and (refresh or not self.month_path(year, month).exists())
+            ]
+            with tempfile.TemporaryDirectory() as download_dir:
+                for first_month in range(0, len(months), ERA5_MAX_CONCURRENT_MONTHS):
+                    group = months[first_month : first_month + ERA5_MAX_CONCURRENT_MONTHS]
+                    log.info(f'Downloading the ERA5 data of Germany for {year}, months {group}')
+                    asyncio.run(
+                        async_get_yearly_era5_data(
+                            cdsapi_client,
+                            year,
+                            'germany',
+                            self.area,
+                            download_dir,
+                            estimate_months=[group[0], group[-1]],
+                            time_timeout=time.time() + runtime_limit,
+                            skip_months=set(range(group[0], group[-1] + 1)) - set(group),
+                        )
+                    )
+                    for month in group:
+                        download = os.path.join(download_dir, f'era5_data_germany_{year}_{month}.zip')
+                        self.write_month(year, month, read_era5_zip(download))
+                        written.append((year, month))
+        return written
+
+
+def read_era5_zip(file_path: str) -> xarray.Dataset:
+    """Read the raw ERA5 data of a downloaded zip file, merging the NetCDF files of all its streams."""
     with zipfile.ZipFile(file_path) as zip_ds:
         zip_ds.extractall(os.path.join(file_path.split('.zip')[0]))
         extracted_files = glob.glob(os.path.join(file_path.split('.zip')[0], '*.nc'))
 
-    dataset = [xr.open_dataset(extracted_file) for extracted_file in extracted_files]
-    dataset = xr.merge(dataset, compat='no_conflicts')
+    return xarray.merge(
+        [xarray.open_dataset(extracted_file) for extracted_file in extracted_files], compat='no_conflicts'
+    )
+
+
+def open_era5_data(file_path: str, area: Optional[list[float]] = None) -> xarray.Dataset:
+    """
+    Open ERA5 data from a NetCDF file using xarray.
+
+    :param area: [North, West, South, East] to slice the data to, e.g. if the file holds a larger cached area
+    """
+    log.debug(f'Loading ERA5 data from {file_path}...')
+    dataset = read_era5_zip(file_path)
+    if area is not None:
+        # ERA5 latitudes are descending
+        north, west, south, east = area
+        dataset = dataset.sel(latitude=slice(north, south), longitude=slice(west, east))
 
     dataset = era5_data_preprocess(dataset)
 
@@ -40,7 +259,7 @@ def open_era5_data(file_path: str) -> xarray.Dataset:
 
 def snap_to_era5_grid(north: float, west: float, south: float, east: float) -> list[float]:
     """Expand bbox to nearest ERA5 grid boundaries."""
-    resolution = 0.25  # ERA5 grid resolution in degrees
+    resolution = ERA5_RESOLUTION
     north_snapped = np.ceil(north / resolution) * resolution
     west_snapped = np.floor(west / resolution) * resolution
     south_snapped = np.floor(south / resolution) * resolution
@@ -55,6 +274,17 @@ def snap_to_era5_grid(north: float, west: float, south: float, east: float) -> l
     return [north_snapped, west_snapped, south_snapped, east_snapped]
 
 
+def snap_to_era5_points(longitudes: np.ndarray, latitudes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Snap coordinates to the nearest ERA5 grid points.
+
+    :return: the column and row of the grid points on the ERA5 lattice, i.e. their longitude and latitude divided by
+             the ERA5 resolution
+    """
+    columns = np.rint(np.asarray(longitudes, dtype=np.float64) / ERA5_RESOLUTION).astype(np.int64)
+    rows = np.rint(np.asarray(latitudes, dtype=np.float64) / ERA5_RESOLUTION).astype(np.int64)
+    return columns, rows
+
+
 # async def download_era5_data(
 def submit_era5_request(
     cdsapi_client: Client, year: int, month: int, variables: list[str], area: list, output_file: str
@@ -159,12 +389,16 @@ async def async_get_yearly_era5_data(
     savedir: str,
     estimate_months: list,
     time_timeout: float,
+    skip_months: Collection[int] = (),
 ):
     tasks = []
 
     for month in range(estimate_months[0], estimate_months[1] + 1):
         output_file = os.path.join(savedir, f'era5_data_{aoiname.lower()}_{year}_{month}.zip')
-        if os.path.exists(output_file):  # if already downloaded, skip download and directly return file path
+        if month in skip_months:
+            log.debug(f'{year}-{month:02d} is taken from the ERA5 store, skipping.')
+            continue
+        elif os.path.exists(output_file):  # if already downloaded, skip download and directly return file path
             log.debug(f'{output_file} already exists, skipping.')
             continue
         else:
@@ -179,6 +413,12 @@ async def async_get_yearly_era5_data(
     return await asyncio.gather(*tasks)
 
 
+def get_era5_area(aoi: shapely.MultiPolygon) -> list[float]:
+    """Get the area [North, West, South, East] of the ERA5 data covering the AOI."""
+    minx, miny, maxx, maxy = aoi.buffer(0.000001).bounds  # do a small buffer to avoid issues with degenerate boxes
+    return snap_to_era5_grid(maxy, minx, miny, maxx)
+
+
 def get_era5_data_4_energy_estimation(
     cdsapi_client: Client,
     year: int,
@@ -187,13 +427,31 @@ def get_era5_data_4_energy_estimation(
     savedir: str,
     estimate_months: list = [1, 12],
     runtime_limit: float = 120 * 60,  # seconds
+    era5_cache: Optional[Era5Cache] = None,
+    era5_store: Optional[Era5Store] = None,
 ):
     # Define output directory
     os.makedirs(savedir, exist_ok=True)
 
     # Define area from AOI bounding box
-    minx, miny, maxx, maxy = aoi.buffer(0.000001).bounds  # do a small buffer to avoid issues with degenerate boxes
-    area = snap_to_era5_grid(maxy, minx, miny, maxx)  # North, West, South, East
+    area = get_era5_area(aoi)  # North, West, South, East
+
+    # Months in the ERA5 store are read from there, months available in the cache are taken from there
+    months = range(estimate_months[0], estimate_months[1] + 1)
+    stored_months = set()
+    if era5_store is not None:
+        stored_months = {month for month in months if era5_store.covers(year, month, area)}
+        if len(stored_months) == len(months):
+            log.info('Using the ERA5 data from the ERA5 store')
+            return
+
+    variables = list(VARIABLES_NAMES.keys())
+    downloaded_months = []
+    if era5_cache is not None:
+        for month in sorted(set(months) - stored_months):
+            output_file = Path(savedir) / f'era5_data_{aoiname.lower()}_{year}_{month}.zip'
+            if not output_file.exists() and not era5_cache.fetch(year, month, area, variables, output_file):
+                downloaded_months.append(month)
 
     ###############
     # Download ERA5 Data
@@ -201,7 +459,7 @@ def get_era5_data_4_energy_estimation(
     log.info(
         'Downloading era5 data. If data download does not complete within the time limit, the computation will be aborted.'
     )
-    max_num_month = 4
+    max_num_month = ERA5_MAX_CONCURRENT_MONTHS
     # if the request monthes too many, split it into several sub-tasks to avoid depriority
     # and raise error when out time limitation
     sub_estimate_months = np.arange(estimate_months[0], estimate_months[1], max_num_month)
@@ -220,6 +478,7 @@ def get_era5_data_4_energy_estimation(
                     savedir,
                     estimate_months=sub_estimate_month,
                     time_timeout=time_timeout,
+                    skip_months=stored_months,
                 )
             )
     except asyncio.TimeoutError:
@@ -238,3 +497,10 @@ def get_era5_data_4_energy_estimation(
     except Exception as e:
         log.error(e)
         raise ClimatoologyUserError('There was an error downloading Era5 data. Please try again later.')
+
+    if era5_cache is not None and downloaded_months:
+        for month in downloaded_months:
+            era5_cache.store(
+                year, month, area, variables, Path(savedir) / f'era5_data_{aoiname.lower()}_{year}_{month}.zip'
+            )
+        era5_cache.evict()
@@ -1,14 +1,24 @@
 import logging
 import os
+from typing import Optional
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import shapely
 import xarray
 from ecmwf.datastores import Client
 
+from heating_emissions.components.profiling import profile_stage
 from heating_emissions.components.temporal_downscale import demand_ninja
-from heating_emissions.components.temporal_downscale.era5_data import get_era5_data_4_energy_estimation, open_era5_data
+from heating_emissions.components.temporal_downscale.era5_data import (
+    Era5Cache,
+    Era5Store,
+    get_era5_area,
+    get_era5_data_4_energy_estimation,
+    open_era5_data,
+    snap_to_era5_points,
+)
 from heating_emissions.components.temporal_downscale.temporal_utils import (
     DEMAND_NINJA_THRESHOLD,
     VARIABLES_demand_ninja,
@@ -21,28 +31,58 @@ def estimate_hourly_energy_demand(weather_dataset: xarray.Dataset) -> pd.DataFra
     """
     Estimate temporal heating energy demand using DemandNinja: https://doi.org/10.1038/s41560-023-01341-5
 
+    The demand of all ERA5 grid points is estimated at once by `demand_ninja.demand_grid`. Grid points with missing
+    weather data on some day are estimated one by one by `demand_ninja.demand`.
+
     return:
         ds_w_hourly_demand: building-level energy deman
             energy demand unit: should be kWh based on DemandNinja's paper & website (https://www.renewables.ninja/)
                                 where the unit of heating power threshold is kW/Celsius.
     """
-    # Convert xarray Dataset variable to pandas DataFrame for demand_ninja calculation.
-    #   # whose `inputs` has to be a pandas.DataFrame with four columns,
-    #   # humidity, radiation_global_horizontal, temperature, and wind_speed_2m
-    weather_data = weather_dataset.to_dataframe().reset_index().reset_index()
-
-    ds_w_hourly_demand = weather_data[['index', 'valid_time', 'latitude', 'longitude']].set_index('index')
-    ds_w_hourly_demand['heating_demand'] = 0.0
-    for grpi, (grp_idx, weather_grid) in enumerate(weather_data.groupby(by=['latitude', 'longitude'])):
-        weather_grid = weather_grid.set_index('valid_time').sort_index()
-        demand_ninja_input_grid = weather_grid[VARIABLES_demand_ninja.keys()]
-        demand_ninja_input_grid.rename(columns=VARIABLES_demand_ninja, inplace=True)
-        hourly_demand = demand_ninja.demand(demand_ninja_input_grid.copy(), raw=True, **DEMAND_NINJA_THRESHOLD)
-        hourly_demand['index'] = weather_grid['index']
-        hourly_demand = hourly_demand.reset_index().set_index('index')
-        ds_w_hourly_demand.loc[hourly_demand.index, 'heating_demand'] = hourly_demand['heating_demand']
+    weather_grid = weather_dataset[list(VARIABLES_demand_ninja)].sortby('valid_time')
+    n_times, n_latitudes, n_longitudes = (weather_grid.sizes[dim] for dim in ('valid_time', 'latitude', 'longitude'))
 
-    return ds_w_hourly_demand
+    # demand_ninja takes the hourly humidity, radiation_global_horizontal, temperature, and wind_speed_2m as
+    # (variable, location) columns, the grid points are numbered row by row
+    hourly_inputs = pd.concat(
+        {
+            name: pd.DataFrame(
+                weather_grid[variable]
+                .transpose('valid_time', 'latitude', 'longitude')
+                .to_numpy()
+                .reshape(n_times, n_latitudes * n_longitudes),
+                index=weather_grid.indexes['valid_time'],
+            )
+            for variable, name in VARIABLES_demand_ninja.items()
+        },
+        axis='columns',
+        names=['variable', 'location'],
+    )
+    complete = hourly_inputs.resample('1D').mean().notna().all(axis='index').groupby(level='location').all()
+    complete_locations = complete.index[complete]
+
+    heating_demand = np.full((n_times, n_latitudes * n_longitudes), np.nan)
+    if len(complete_locations) > 0:
+        complete_inputs = hourly_inputs.loc[
+            :, hourly_inputs.columns.get_level_values('location').isin(complete_locations)
+        ]
+        hourly_demand = demand_ninja.demand_grid(complete_inputs, **DEMAND_NINJA_THRESHOLD)
+        heating_demand[:, complete_locations] = hourly_demand['heating_demand'].to_numpy()
+    for location in complete.index[~complete]:
+        location_inputs = hourly_inputs.xs(location, axis='columns', level='location')
+        hourly_demand = demand_ninja.demand(location_inputs.copy(), raw=True, **DEMAND_NINJA_THRESHOLD)
+        heating_demand[:, location] = hourly_demand['heating_demand'].to_numpy()
+
+    heating_demand = xarray.DataArray(
+        heating_demand.reshape(n_times, n_latitudes, n_longitudes),
+        coords={dim: weather_grid[dim].to_numpy() for dim in ('valid_time', 'latitude', 'longitude')},
+        dims=('valid_time', 'latitude', 'longitude'),
+        name='heating_demand',
+    ).reindex(valid_time=weather_dataset['valid_time'].to_numpy())
+
+    ds_w_hourly_demand = heating_demand.to_dataframe(dim_order=list(weather_dataset[list(VARIABLES_demand_ninja)].dims))
+    ds_w_hourly_demand = ds_w_hourly_demand.reset_index().rename_axis('index')
+    return ds_w_hourly_demand[['valid_time', 'latitude', 'longitude', 'heating_demand']]
 
 
 def collect_building_hourly_energy_demand_permonth(
@@ -50,11 +90,20 @@ def collect_building_hourly_energy_demand_permonth(
     month: int,
     aoiname: str,
     savedir: str,
+    area: Optional[list[float]] = None,
+    era5_store: Optional[Era5Store] = None,
 ) -> pd.DataFrame:
-    """Collect monthly energy demand results."""
-    # Open & preprocess the downloaded ERA5 data
-    era5_file = os.path.join(savedir, f'era5_data_{aoiname.lower()}_{year}_{month}.zip')
-    dataset = open_era5_data(era5_file)
+    """Collect monthly energy demand results.
+
+    :param area: [North, West, South, East] of the AOI's ERA5 data, if the downloaded file may cover a larger area
+    :param era5_store: read the ERA5 data of the area from the store if it holds the month
+    """
+    # Open & preprocess the stored or downloaded ERA5 data
+    if era5_store is not None and area is not None and era5_store.covers(year, month, area):
+        dataset = era5_store.open(year, month, area)
+    else:
+        era5_file = os.path.join(savedir, f'era5_data_{aoiname.lower()}_{year}_{month}.zip')
+        dataset = open_era5_data(era5_file, area=area)
 
     # Estimate energy demand using DemandNinja
     ds_w_hourly_demand = estimate_hourly_energy_demand(dataset)  # valid_time, latitude, longitude, heating_demand
@@ -62,69 +111,94 @@ def collect_building_hourly_energy_demand_permonth(
     return ds_w_hourly_demand
 
 
+def map_census_to_era5(census_data: gpd.GeoDataFrame) -> pd.DataFrame:
+    """Snap each census cell to its nearest point on the ERA5 lattice.
+
+    The mapping only depends on the census cells and can be shared by the calculations of all months.
+
+    :return: the `era5_column` and `era5_row` of the lattice point of each cell, indexed like `census_data`
+    """
+    cell_points = census_data.geometry.to_crs(epsg=4326)
+    era5_columns, era5_rows = snap_to_era5_points(cell_points.x.to_numpy(), cell_points.y.to_numpy())
+    return pd.DataFrame({'era5_column': era5_columns, 'era5_row': era5_rows}, index=census_data.index)
+
+
+def find_era5_positions(
+    era5_points: pd.DataFrame, census_data: gpd.GeoDataFrame, era5_mapping: pd.DataFrame
+) -> np.ndarray:
+    """Find the position of the ERA5 grid point of each census cell among the given grid points.
+
+    Cells whose lattice point is not among the grid points are assigned the nearest grid point in projected CRS.
+    """
+    point_columns, point_rows = snap_to_era5_points(era5_points['longitude'], era5_points['latitude'])
+    era5_positions = pd.MultiIndex.from_arrays([point_rows, point_columns]).get_indexer(
+        pd.MultiIndex.from_arrays([era5_mapping['era5_row'], era5_mapping['era5_column']])
+    )
+
+    unmatched = era5_positions < 0
+    if unmatched.any():
+        log.debug(f'{unmatched.sum()} census cells are not on a given ERA5 grid point, using the nearest point')
+        utm_crs = census_data.estimate_utm_crs()
+        era5_geometry = gpd.GeoSeries(
+            gpd.points_from_xy(era5_points['longitude'], era5_points['latitude']), crs='EPSG:4326'
+        ).to_crs(utm_crs)
+        cell_geometry = census_data.geometry[unmatched].to_crs(utm_crs)
+        cell_positions, nearest_positions = era5_geometry.sindex.nearest(cell_geometry, return_all=False)
+        era5_positions[np.flatnonzero(unmatched)[cell_positions]] = nearest_positions
+    return era5_positions
+
+
 def calculate_hourly_emissions_permonth(
     hourly_demand_era5: pd.DataFrame,
     census_data: gpd.GeoDataFrame,
+    era5_mapping: Optional[pd.DataFrame] = None,
 ) -> tuple[gpd.GeoDataFrame, pd.DataFrame]:
     """
     Calculate hourly emissions based on energy demand and emission factor.
+
+    Each census cell is assigned its ERA5 grid point by the `era5_mapping`. The monthly emissions of a cell are the
+    summed hourly demand of its grid point times its population and emission factor, the regional hourly emissions
+    are the product of the (hours x grid points) demand matrix with the population-weighted emission factors summed
+    per grid point.
+
     :param hourly_demand: DataFrame with columns ['valid_time', 'latitude', 'longitude', 'heating_demand']
-    :param census_data: GeoDataFrame with columns
-                            ['fid', 'raster_id_100m', 'x_mp_100m', 'y_mp_100m',
+    :param census_data: GeoDataFrame indexed by the census cells with columns
+                            ['x_mp_100m', 'y_mp_100m',
                              'population', 'average_sqm_per_person', 'heat_consumption', 'direct', 'life_cycle']
+    :param era5_mapping: the census cells snapped to the ERA5 lattice by `map_census_to_era5`, computed if not given
     :return
         census_data: return census data with 'monthly_emissions' estimates
         emission_hourly_regional: return ['valid_time', 'regional_hourly_emissions']
     """
-    census_data = census_data.reset_index()  # keep raster_id_100m as a column for later join
-
-    # spatial join hourly demand with census data
-    gdf_hourly_demand = gpd.GeoDataFrame(
-        hourly_demand_era5,
-        geometry=gpd.points_from_xy(hourly_demand_era5.longitude, hourly_demand_era5.latitude),
-        crs='EPSG:4326',
+    # (hours x grid points) demand matrix, missing hours of a grid point are NaN
+    hourly_demand = hourly_demand_era5.pivot(
+        index='valid_time', columns=['latitude', 'longitude'], values='heating_demand'
     )
+    era5_points = hourly_demand.columns.to_frame(index=False)
 
-    ## convert to projected CRS for spatial join
-    census_data = census_data.to_crs(census_data.estimate_utm_crs())
-    gdf_hourly_demand = gdf_hourly_demand.to_crs(census_data.estimate_utm_crs())
+    if era5_mapping is None:
+        era5_mapping = map_census_to_era5(census_data)
+    cell_era5_positions = find_era5_positions(era5_points, census_data, era5_mapping)
 
-    nearest = census_data.sjoin_nearest(
-        gdf_hourly_demand.drop_duplicates(subset=['longitude', 'latitude'])[['longitude', 'latitude', 'geometry']],
-        how='left',
-    )
-    census_data[['lon_era5', 'lat_era5']] = nearest[['longitude', 'latitude']]
-    del nearest
-
-    # calculate hourly emissions for each grid cell in census data
-    census_data['monthly_emissions'] = 0.0
-    census_monthly_emission = census_data[['raster_id_100m', 'monthly_emissions']].set_index('raster_id_100m')
-    hourly_emission_regional = []
-    for hr, hr_demand in gdf_hourly_demand.groupby('valid_time'):
-        hr_demand = hr_demand[['latitude', 'longitude', 'heating_demand']]
-        census_data_w_hourly_demand = pd.merge(
-            census_data[['raster_id_100m', 'lon_era5', 'lat_era5', 'direct', 'population', 'geometry']],
-            hr_demand,
-            left_on=['lat_era5', 'lon_era5'],
-            right_on=['latitude', 'longitude'],
-            how='left',
-        )
-
-        census_data_w_hourly_demand['hourly_emissions'] = (
-            census_data_w_hourly_demand['heating_demand']
-            * census_data_w_hourly_demand['population']
-            * census_data_w_hourly_demand['direct']
-        )
-        census_data_w_hourly_demand.set_index('raster_id_100m', inplace=True)
-
-        census_monthly_emission['monthly_emissions'] += census_data_w_hourly_demand['hourly_emissions']
-        hourly_emission_regional.append([hr, census_data_w_hourly_demand['hourly_emissions'].sum()])
+    census_data = census_data.to_crs(epsg=4326)
+    census_data['lon_era5'] = era5_points['longitude'].to_numpy()[cell_era5_positions]
+    census_data['lat_era5'] = era5_points['latitude'].to_numpy()[cell_era5_positions]
 
-    census_data = census_data.set_index('raster_id_100m').to_crs(epsg=4326)
-    census_data['monthly_emissions'] = census_monthly_emission['monthly_emissions']
+    # monthly emissions for each grid cell in census data
+    demand_matrix = hourly_demand.to_numpy()
+    cell_weights = (census_data['population'] * census_data['direct']).to_numpy()
+    census_data['monthly_emissions'] = demand_matrix.sum(axis=0)[cell_era5_positions] * cell_weights
 
+    # regional hourly emissions, cells with a missing population or emission factor or hourly demand are left out
+    valid_weights = ~np.isnan(cell_weights)
+    era5_weights = np.bincount(
+        cell_era5_positions[valid_weights], weights=cell_weights[valid_weights], minlength=len(era5_points)
+    )
     emission_hourly_regional = pd.DataFrame(
-        hourly_emission_regional, columns=['valid_time', 'regional_hourly_emissions']
+        {
+            'valid_time': hourly_demand.index.to_numpy(),
+            'regional_hourly_emissions': np.nan_to_num(demand_matrix) @ era5_weights,
+        }
     )
 
     return census_data, emission_hourly_regional
@@ -138,6 +212,8 @@ def calculate_time_downscale_emissions(
     census_data: gpd.GeoDataFrame,
     savedir: str,
     estimate_months: list = [1, 12],
+    era5_cache: Optional[Era5Cache] = None,
+    era5_store: Optional[Era5Store] = None,
 ) -> tuple[gpd.GeoDataFrame, pd.DataFrame]:
     """Calculate daily emissions for a year based on hourly energy demand estimation.
     return:
@@ -145,9 +221,19 @@ def calculate_time_downscale_emissions(
         2. the daily emissions for plot
     """
     # download yearly era5 data
-    get_era5_data_4_energy_estimation(
-        cdsapi_client, year, city_name, aoi, savedir, estimate_months, runtime_limit=120 * 60
-    )
+    with profile_stage('era5_download'):
+        get_era5_data_4_energy_estimation(
+            cdsapi_client,
+            year,
+            city_name,
+            aoi,
+            savedir,
+            estimate_months,
+            runtime_limit=120 * 60,
+            era5_cache=era5_cache,
+            era5_store=era5_store,
+        )
+    area = get_era5_area(aoi)
 
     # data pre-processing: fillna in census data
     # todo: support temporal downscaling by both mode ['direct', 'life_cycle'] or selected mode.
@@ -157,10 +243,19 @@ def calculate_time_downscale_emissions(
     region_hourly_emissions = []
     census_yearly_emission = census_data[['x_mp_100m', 'y_mp_100m']]
     census_yearly_emission['yearly_emissions'] = 0.0
+    era5_mapping = map_census_to_era5(census_data)
     for month in range(estimate_months[0], estimate_months[1] + 1):
         log.info(f'Calculating emissions for month: {year}-{month} ...')
-        hourly_demand = collect_building_hourly_energy_demand_permonth(year, month, city_name, savedir)
-        census_monthly_emi, region_hourly_emi = calculate_hourly_emissions_permonth(hourly_demand, census_data)
+        with profile_stage(f'demand_estimation:{month}') as stage:
+            hourly_demand = collect_building_hourly_energy_demand_permonth(
+                year, month, city_name, savedir, area, era5_store
+            )
+            stage.rows = len(hourly_demand)
+        with profile_stage(f'hourly_emission_join:{month}') as stage:
+            census_monthly_emi, region_hourly_emi = calculate_hourly_emissions_permonth(
+                hourly_demand, census_data, era5_mapping
+            )
+            stage.rows = len(census_monthly_emi)
 
         census_yearly_emission['yearly_emissions'] += census_monthly_emi['monthly_emissions']
 
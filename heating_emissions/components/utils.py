@@ -1,11 +1,19 @@
 import logging
+from dataclasses import dataclass
 from enum import StrEnum
+from functools import cache
+from pathlib import Path
 
 import geopandas as gpd
+import pandas as pd
 from climatoology.base.i18n import N_
 
 log = logging.getLogger(__name__)
 
+# The resources directory at the project root, independent of the working directory
+RESOURCES_DIR = Path(__file__).parents[2] / 'resources'
+GERMANY_BOUNDARIES = RESOURCES_DIR / 'germany_buffered_boundaries.geojson'
+
 # Define dictionary with emission factors
 EMISSION_FACTORS_DIRECT = {  # in kg of CO2 per kWh of heating
     'gas': 0.20029,
@@ -74,31 +82,79 @@ class Topics(StrEnum):
     TEMPORAL = N_('temporally flexible simulation')
 
 
+@cache
+def get_germany_boundaries() -> gpd.GeoSeries:
+    """Read the boundaries of Germany, buffered by another 3 km, in EPSG:32632."""
+    return gpd.read_file(GERMANY_BOUNDARIES).buffer(3000)
+
+
 def get_aoi_area(aoi_as_geoseries: gpd.GeoSeries) -> float:
     reprojected_aoi_df = aoi_as_geoseries.to_crs(aoi_as_geoseries.estimate_utm_crs())
     area_km2 = round(reprojected_aoi_df.geometry.area.sum() / 1e6, 2)
     return area_km2
 
 
+@dataclass
+class HeatingEmissions:
+    """The gap-filled inputs and the resulting emissions per cell, with one column per set of emission factors."""
+
+    average_sqm_per_person: pd.Series
+    heat_consumption: pd.Series | pd.DataFrame
+    emission_factor: pd.DataFrame
+    heated_area: pd.Series
+    co2_emissions: pd.DataFrame
+    co2_emissions_per_capita: pd.DataFrame
+
+
+def calculate_co2_emissions(
+    population: pd.Series,
+    average_sqm_per_person: pd.Series,
+    heat_consumption: pd.Series | pd.DataFrame,
+    emission_factor: pd.DataFrame,
+) -> HeatingEmissions:
+    """Calculate the heating emissions per cell for each column of the `emission_factor` matrix.
+
+    Gaps in the living space, heat consumption and emission factors are filled with their mean over all cells.
+    `heat_consumption` is either shared by all columns or has the same columns as `emission_factor`.
+    """
+    average_sqm_per_person = average_sqm_per_person.fillna(average_sqm_per_person.mean())
+    heat_consumption = heat_consumption.fillna(heat_consumption.mean())
+    emission_factor = emission_factor.fillna(emission_factor.mean())
+
+    heated_area = population * average_sqm_per_person
+    co2_emissions = emission_factor.mul(
+        heat_consumption.mul(heated_area, axis='index'), axis='index'
+    ).round()  # result in kg of CO2 per year
+    co2_emissions_per_capita = emission_factor.mul(
+        heat_consumption.mul(average_sqm_per_person, axis='index'), axis='index'
+    ).round()  # result in kg of CO2 per year
+
+    return HeatingEmissions(
+        average_sqm_per_person=average_sqm_per_person,
+        heat_consumption=heat_consumption,
+        emission_factor=emission_factor,
+        heated_area=heated_area,
+        co2_emissions=co2_emissions,
+        co2_emissions_per_capita=co2_emissions_per_capita,
+    )
+
+
 def calculate_heating_emissions(census_data: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-    census_data['average_sqm_per_person'] = census_data['average_sqm_per_person'].fillna(
-        census_data['average_sqm_per_person'].mean()
+    modes = ['direct', 'life_cycle']
+    emissions = calculate_co2_emissions(
+        population=census_data['population'],
+        average_sqm_per_person=census_data['average_sqm_per_person'],
+        heat_consumption=census_data['heat_consumption'],
+        emission_factor=census_data[modes],
     )
-    census_data['heat_consumption'] = census_data['heat_consumption'].fillna(census_data['heat_consumption'].mean())
-    for mode in ['direct', 'life_cycle']:
-        census_data[f'{mode}_emission_factor'] = census_data[mode].fillna(census_data[mode].mean())
-
-        census_data[f'{mode}_heated_area'] = census_data['population'] * census_data['average_sqm_per_person']
-        census_data[f'{mode}_co2_emissions'] = (
-            census_data[f'{mode}_heated_area']
-            * census_data['heat_consumption']
-            * census_data[f'{mode}_emission_factor']
-        ).round()  # result in kg of CO2 per year
-        census_data[f'{mode}_co2_emissions_per_capita'] = (
-            census_data['average_sqm_per_person']
-            * census_data['heat_consumption']
-            * census_data[f'{mode}_emission_factor']
-        ).round()  # result in kg of CO2 per year
+
+    census_data['average_sqm_per_person'] = emissions.average_sqm_per_person
+    census_data['heat_consumption'] = emissions.heat_consumption
+    for mode in modes:
+        census_data[f'{mode}_emission_factor'] = emissions.emission_factor[mode]
+        census_data[f'{mode}_heated_area'] = emissions.heated_area
+        census_data[f'{mode}_co2_emissions'] = emissions.co2_emissions[mode]
+        census_data[f'{mode}_co2_emissions_per_capita'] = emissions.co2_emissions_per_capita[mode]
 
     return census_data
 
@@ -0,0 +1,46 @@
+import contextvars
+import logging
+from concurrent.futures import Executor, ThreadPoolExecutor
+from enum import StrEnum
+from typing import Callable, Optional
+
+from climatoology.base.artifact import Artifact
+
+log = logging.getLogger(__name__)
+
+
+class ArtifactExecutorMode(StrEnum):
+    sequential = 'sequential'  # build the artifacts one after another
+    thread = 'thread'  # build the artifacts in a pool of threads
+
+
+class ArtifactExecutor:
+    """Build independent artifacts of a computation concurrently.
+
+    The pool is created for each computation. Threads run each task in a copy of the computation's context variables,
+    e.g. its translation context.
+    """
+
+    def __init__(self, mode: ArtifactExecutorMode = ArtifactExecutorMode.sequential, max_workers: Optional[int] = None):
+        self.mode = mode
+        self.max_workers = max_workers
+
+    def run(self, tasks: list[Callable[[], Artifact]]) -> list[Artifact]:
+        """Run the tasks and return their artifacts in the order of the tasks.
+
+        The first failed task raises its exception once all tasks have finished.
+        """
+        if self.mode == ArtifactExecutorMode.sequential or len(tasks) < 2:
+            return [task() for task in tasks]
+
+        log.debug(f'Building {len(tasks)} artifacts in a {self.mode} pool')
+        with self.create_pool() as pool:
+            futures = [pool.submit(contextvars.copy_context().run, task) for task in tasks]
+            return [future.result() for future in futures]
+
+    def create_pool(self) -> Executor:
+        match self.mode:
+            case ArtifactExecutorMode.thread:
+                return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='artifacts')
+            case _:
+                raise ValueError(f'No pool for the artifact executor mode {self.mode}')
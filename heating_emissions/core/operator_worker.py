@@ -1,7 +1,8 @@
 # You may ask yourself why this file has such a strange name.
 # Well ... python imports: https://discuss.python.org/t/warning-when-importing-a-local-module-with-the-same-name-as-a-2nd-or-3rd-party-module/27799
 import logging
-from typing import List, Optional
+from functools import partial
+from typing import Callable, List, Optional
 
 import geopandas as gpd
 import shapely
@@ -10,20 +11,36 @@ from climatoology.base.exception import ClimatoologyUserError
 from climatoology.base.i18n import tr
 from climatoology.base.plugin_info import PluginInfo
 from ecmwf.datastores import Client
-
-# import is required for table reflection: https://geoalchemy-2.readthedocs.io/en/latest/core_tutorial.html#reflecting-tables
-from geoalchemy2 import Geometry  # noqa: F401
 from pydantic_extra_types.language_code import LanguageAlpha2
-from sqlalchemy import MetaData, NullPool, create_engine
+from sqlalchemy import NullPool, create_engine
 
-from heating_emissions.components.census_data import DatabaseConnection, collect_census_data
+from heating_emissions.components.cell_aggregation import aggregate_cells, get_aggregation_level
+from heating_emissions.components.census_data import (
+    CensusFetchMode,
+    CensusSnapshot,
+    CensusTileCache,
+    DatabaseConnection,
+    collect_census_data,
+    declare_census_tables,
+    verify_census_tables,
+)
+from heating_emissions.components.census_grid import CELL_SIZE
 from heating_emissions.components.gridded_emissions_artifact import (
+    GRIDDED_LAYERS,
+    CellGeometryCache,
+    ClassdataOutput,
+    GriddedOutputMode,
+    build_combined_gridded_artifact,
+    build_combined_styling_artifact,
     build_gridded_artifact,
     build_gridded_artifact_classdata,
+    build_gridded_raster_artifact,
+    build_gridded_raster_artifact_classdata,
 )
 from heating_emissions.components.histogram_artifacts import (
     build_direct_emission_factor_histogram_artifact,
     build_energy_histogram_artifact,
+    build_histogram_artifact,
     build_life_cycle_emission_factor_histogram_artifact,
     build_per_capita_direct_co2_histogram_artifact,
     build_per_capita_life_cycle_co2_histogram_artifact,
@@ -32,16 +49,21 @@ from heating_emissions.components.histogram_artifacts import (
     plot_life_cycle_emission_factor_histogram,
     plot_per_capita_direct_co2_histogram,
     plot_per_capita_life_cycle_co2_histogram,
+    summarize_histogram_metrics,
 )
 from heating_emissions.components.line_artifacts import (
     build_daily_emission_lineplot_artifact,
     plot_daily_emission_lineplot,
 )
+from heating_emissions.components.profiling import PROFILE_FILE_NAME, profile_computation, profile_stage, profiled
+from heating_emissions.components.temporal_downscale.era5_data import Era5Cache, Era5Store
 from heating_emissions.components.temporal_downscale.temporal_estimation import calculate_time_downscale_emissions
 from heating_emissions.components.utils import (
     calculate_heating_emissions,
     get_aoi_area,
+    get_germany_boundaries,
 )
+from heating_emissions.core.executor import ArtifactExecutor
 from heating_emissions.core.info import get_info
 from heating_emissions.core.input import ComputeInput
 
@@ -49,13 +71,43 @@ log = logging.getLogger(__name__)
 
 
 class Operator(BaseOperator[ComputeInput]):
-    def __init__(self, ca_database_url: str, cdsapi_client: Optional[Client]):
+    def __init__(
+        self,
+        ca_database_url: str,
+        cdsapi_client: Optional[Client],
+        census_fetch_mode: CensusFetchMode = CensusFetchMode.per_table,
+        census_bulk_transfer: bool = False,
+        engine_options: Optional[dict] = None,
+        verify_census_schema: bool = False,
+        census_tile_cache: Optional[CensusTileCache] = None,
+        census_snapshot: Optional[CensusSnapshot] = None,
+        era5_cache: Optional[Era5Cache] = None,
+        era5_store: Optional[Era5Store] = None,
+        gridded_output_mode: GriddedOutputMode = GriddedOutputMode.vector,
+        artifact_executor: Optional[ArtifactExecutor] = None,
+        profile_trace_memory: bool = False,
+        profile_json: bool = False,
+    ):
         super().__init__()
         log.info('Initialising operator')
-        engine = create_engine(ca_database_url, echo=False, plugins=['geoalchemy2'], poolclass=NullPool)
-        metadata = MetaData(schema='census_de')
-        metadata.reflect(bind=engine)
-        self.ca_database_connection = DatabaseConnection(engine=engine, metadata=metadata)
+        if engine_options is None:
+            engine_options = {'poolclass': NullPool}
+        engine = create_engine(ca_database_url, echo=False, plugins=['geoalchemy2'], **engine_options)
+        metadata = declare_census_tables()
+        if verify_census_schema:
+            verify_census_tables(engine=engine, metadata=metadata)
+        self.ca_database_connection = DatabaseConnection(
+            engine=engine, metadata=metadata, bulk_transfer=census_bulk_transfer
+        )
+        self.census_fetch_mode = census_fetch_mode
+        self.census_tile_cache = census_tile_cache
+        self.census_snapshot = census_snapshot
+        self.era5_cache = era5_cache
+        self.era5_store = era5_store
+        self.gridded_output_mode = gridded_output_mode
+        self.artifact_executor = artifact_executor or ArtifactExecutor()
+        self.profile_trace_memory = profile_trace_memory
+        self.profile_json = profile_json
         self.cdsapi_client = cdsapi_client
         log.debug('Operator initialised')
 
@@ -70,97 +122,130 @@ class Operator(BaseOperator[ComputeInput]):
         params: ComputeInput,
         language: LanguageAlpha2,
         **kwargs,
+    ) -> List[Artifact]:
+        with profile_computation(trace_memory=self.profile_trace_memory) as profile:
+            artifacts = self.compute_artifacts(resources, aoi, aoi_properties, params)
+        if self.profile_json:
+            profile.write(resources.computation_dir / PROFILE_FILE_NAME)
+        return artifacts
+
+    def compute_artifacts(
+        self,
+        resources: ComputationResources,
+        aoi: shapely.MultiPolygon,
+        aoi_properties: AoiProperties,
+        params: ComputeInput,
     ) -> List[Artifact]:
         # Check we are within bounds of census data coverage
         self.check_aoi(aoi, aoi_properties)
 
-        census_data, uncalculated_census_data = collect_census_data(db_connection=self.ca_database_connection, aoi=aoi)
-        result = calculate_heating_emissions(census_data)
-
-        # Gridded artifacts
-        result.index.names = ['index']
-        heating_per_capita_direct_emissions_artifact = build_gridded_artifact(
-            result=result, resources=resources, output='direct_co2_emissions'
-        )
-        heating_per_capita_life_cycle_emissions_artifact = build_gridded_artifact(
-            result=result, resources=resources, output='life_cycle_co2_emissions'
-        )
-        heating_absolute_direct_emissions_artifact = build_gridded_artifact(
-            result=result, resources=resources, output='direct_co2_emissions', is_per_capita=False
-        )
-        heating_absolute_life_cycle_emissions_artifact = build_gridded_artifact(
-            result=result, resources=resources, output='life_cycle_co2_emissions', is_per_capita=False
-        )
-        energy_consumption_artifact = build_gridded_artifact(
-            result=result, resources=resources, output='heat_consumption'
-        )
-        living_space_artifact = build_gridded_artifact(
-            result=result, resources=resources, output='average_sqm_per_person'
-        )
-        direct_emission_factor_artifact = build_gridded_artifact(
-            result=result, resources=resources, output='direct_emission_factor'
-        )
-        life_cycle_emission_factor_artifact = build_gridded_artifact(
-            result=result, resources=resources, output='life_cycle_emission_factor'
+        census_data, uncalculated_census_data = collect_census_data(
+            db_connection=self.ca_database_connection,
+            aoi=aoi,
+            fetch_mode=self.census_fetch_mode,
+            tile_cache=self.census_tile_cache,
+            snapshot=self.census_snapshot,
         )
+        with profile_stage('emission_calculation') as stage:
+            result = calculate_heating_emissions(census_data)
+            stage.rows = len(result)
 
-        # Gridded artifacts -- original (uncalculated) census data
-        uncalculated_census_data.index.names = ['index']
-        building_age_artifact = build_gridded_artifact_classdata(
-            uncalculated_census_data=uncalculated_census_data, resources=resources, output='dominant_age'
-        )
-        building_energy_source_artifact = build_gridded_artifact_classdata(
-            uncalculated_census_data=uncalculated_census_data, resources=resources, output='dominant_energy'
-        )
-
-        # Histograms
-        direct_per_capita_histogram = plot_per_capita_direct_co2_histogram(census_data=census_data)
-        direct_per_capita_histogram_artifact = build_per_capita_direct_co2_histogram_artifact(
-            aoi_aggregate=direct_per_capita_histogram, resources=resources
-        )
-        life_cycle_per_capita_histogram = plot_per_capita_life_cycle_co2_histogram(census_data=census_data)
-        life_cycle_per_capita_histogram_artifact = build_per_capita_life_cycle_co2_histogram_artifact(
-            aoi_aggregate=life_cycle_per_capita_histogram, resources=resources
-        )
-        energy_histogram = plot_energy_consumption_histogram(census_data=census_data)
-        energy_consumption_histogram_artifact = build_energy_histogram_artifact(
-            aoi_aggregate=energy_histogram, resources=resources
-        )
-
-        direct_emission_factor_histogram = plot_direct_emission_factor_histogram(census_data=census_data)
-        direct_emission_factor_histogram_artifact = build_direct_emission_factor_histogram_artifact(
-            aoi_aggregate=direct_emission_factor_histogram, resources=resources
-        )
-        life_cycle_emission_factor_histogram = plot_life_cycle_emission_factor_histogram(census_data=census_data)
-        life_cycle_emission_factor_histogram_artifact = build_life_cycle_emission_factor_histogram_artifact(
-            aoi_aggregate=life_cycle_emission_factor_histogram, resources=resources
-        )
+        # Gridded artifacts, handed out by the raster ids of the census cells, or of coarser cells for large AOIs in the
+        # aggregated output mode
+        with profile_stage('cell_aggregation') as stage:
+            aggregation_level = 0
+            if self.gridded_output_mode == GriddedOutputMode.aggregated:
+                aggregation_level = get_aggregation_level(result)
+            artifact_result = aggregate_cells(result, aggregation_level)
+            artifact_uncalculated_census_data = aggregate_cells(uncalculated_census_data, aggregation_level)
+            stage.rows = len(artifact_result)
+        build_layer, build_class_layer = self.get_gridded_artifact_builders(cell_size=CELL_SIZE * 2**aggregation_level)
+        if self.gridded_output_mode == GriddedOutputMode.combined:
+            emission_layer_tasks = [
+                partial(
+                    profiled('gridded_artifact:combined', build_combined_gridded_artifact),
+                    result=artifact_result,
+                    uncalculated_census_data=artifact_uncalculated_census_data,
+                    resources=resources,
+                )
+            ]
+            other_layer_tasks = [
+                partial(
+                    profiled('gridded_artifact:combined_styling', build_combined_styling_artifact), resources=resources
+                )
+            ]
+        else:
+            # The per capita emission layers are handed out before the histograms, the other layers after them
+            gridded_layer_tasks = [
+                partial(
+                    profiled(f'gridded_artifact:{output}:{"per_capita" if is_per_capita else "absolute"}', build_layer),
+                    result=artifact_result,
+                    resources=resources,
+                    output=output,
+                    is_per_capita=is_per_capita,
+                )
+                for output, is_per_capita in GRIDDED_LAYERS
+            ]
+            classdata_layer_tasks = [
+                partial(
+                    profiled(f'classdata_artifact:{output}', build_class_layer),
+                    uncalculated_census_data=artifact_uncalculated_census_data,
+                    resources=resources,
+                    output=output,
+                )
+                for output in ClassdataOutput
+            ]
+            emission_layer_tasks = gridded_layer_tasks[:2]
+            other_layer_tasks = gridded_layer_tasks[2:] + classdata_layer_tasks
 
-        return_artifacts = [
-            heating_per_capita_direct_emissions_artifact,
-            heating_per_capita_life_cycle_emissions_artifact,
-            direct_per_capita_histogram_artifact,
-            life_cycle_per_capita_histogram_artifact,
-            energy_consumption_histogram_artifact,
-            direct_emission_factor_histogram_artifact,
-            life_cycle_emission_factor_histogram_artifact,
-            heating_absolute_direct_emissions_artifact,
-            heating_absolute_life_cycle_emissions_artifact,
-            energy_consumption_artifact,
-            living_space_artifact,
-            direct_emission_factor_artifact,
-            life_cycle_emission_factor_artifact,
-            building_age_artifact,
-            building_energy_source_artifact,
+        # Histograms, the statistics of all metrics are computed at once
+        with profile_stage('histogram_statistics') as stage:
+            histogram_statistics = summarize_histogram_metrics(census_data)
+            stage.rows = len(census_data)
+        histogram_tasks = [
+            partial(
+                profiled(f'histogram_artifact:{build_artifact.__name__}', build_histogram_artifact),
+                plot_histogram=plot_histogram,
+                build_artifact=build_artifact,
+                metric=metric,
+                census_data=census_data,
+                statistics=histogram_statistics,
+                resources=resources,
+            )
+            for metric, plot_histogram, build_artifact in [
+                (
+                    'direct_co2_emissions_per_capita',
+                    plot_per_capita_direct_co2_histogram,
+                    build_per_capita_direct_co2_histogram_artifact,
+                ),
+                (
+                    'life_cycle_co2_emissions_per_capita',
+                    plot_per_capita_life_cycle_co2_histogram,
+                    build_per_capita_life_cycle_co2_histogram_artifact,
+                ),
+                ('heat_consumption', plot_energy_consumption_histogram, build_energy_histogram_artifact),
+                (
+                    'direct_emission_factor',
+                    plot_direct_emission_factor_histogram,
+                    build_direct_emission_factor_histogram_artifact,
+                ),
+                (
+                    'life_cycle_emission_factor',
+                    plot_life_cycle_emission_factor_histogram,
+                    build_life_cycle_emission_factor_histogram_artifact,
+                ),
+            ]
         ]
 
+        # The artifacts are independent of each other and may be built concurrently
+        return_artifacts = self.artifact_executor.run(emission_layer_tasks + histogram_tasks + other_layer_tasks)
+
         # temporal downscaling emissions
         if params.temporal_emission_year is not None:
             with self.catch_exceptions(indicator_name=tr('Temporal_emissions'), resources=resources):
                 assert self.cdsapi_client is not None, 'CDS API client must be configured to run temporal downscaling'
 
                 year = params.temporal_emission_year
-                census_data.index.names = ['raster_id_100m']
                 census_yearly_emi_user, region_daily_emissions = calculate_time_downscale_emissions(
                     cdsapi_client=self.cdsapi_client,
                     year=year,
@@ -168,10 +253,12 @@ class Operator(BaseOperator[ComputeInput]):
                     aoi=aoi,
                     census_data=census_data,
                     savedir=resources.computation_dir / 'weather_data',
+                    era5_cache=self.era5_cache,
+                    era5_store=self.era5_store,
                 )
 
-                census_yearly_emi_user.index.names = ['index']
-                yearly_emissions_artifact = build_gridded_artifact(
+                census_yearly_emi_user = aggregate_cells(census_yearly_emi_user, aggregation_level)
+                yearly_emissions_artifact = profiled(f'gridded_artifact:yearly_emissions:{year}', build_layer)(
                     result=census_yearly_emi_user,
                     resources=resources,
                     is_per_capita=False,
@@ -187,10 +274,27 @@ class Operator(BaseOperator[ComputeInput]):
 
         return return_artifacts
 
+    def get_gridded_artifact_builders(
+        self, cell_size: int = CELL_SIZE
+    ) -> tuple[Callable[..., Artifact], Callable[..., Artifact]]:
+        """Get the builders of the gridded artifacts and the gridded class data artifacts for the output mode, the
+        vector layers consist of cells `cell_size` wide.
+        """
+        match self.gridded_output_mode:
+            case GriddedOutputMode.raster:
+                return build_gridded_raster_artifact, build_gridded_raster_artifact_classdata
+            case _:
+                # All vector layers of a computation share the cell polygons
+                cell_geometries = CellGeometryCache(cell_size=cell_size)
+                return (
+                    partial(build_gridded_artifact, cell_geometries=cell_geometries),
+                    partial(build_gridded_artifact_classdata, cell_geometries=cell_geometries),
+                )
+
     def check_aoi(self, aoi: shapely.MultiPolygon, aoi_properties: AoiProperties) -> None:
         aoi_as_series = gpd.GeoSeries(data=[aoi], crs='EPSG:4326').to_crs('EPSG:32632')
 
-        germany = gpd.read_file('resources/germany_buffered_boundaries.geojson').buffer(3000)
+        germany = get_germany_boundaries()
         inside_germany = aoi_as_series.within(germany.geometry)
         if not inside_germany[0]:
             raise ClimatoologyUserError(
@@ -1,4 +1,18 @@
+from enum import StrEnum
+from pathlib import Path
+from typing import Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlalchemy import NullPool
+
+from heating_emissions.components.census_data import CensusFetchMode
+from heating_emissions.components.gridded_emissions_artifact import GriddedOutputMode
+from heating_emissions.core.executor import ArtifactExecutorMode
+
+
+class DatabasePoolMode(StrEnum):
+    null = 'null'  # open a new connection for each query
+    queue = 'queue'  # keep a pool of connections open across computations
 
 
 class Settings(BaseSettings):
@@ -9,6 +23,44 @@ class Settings(BaseSettings):
     data_db_name: str
     data_db_user: str
     data_db_password: str
+    data_db_pool_mode: DatabasePoolMode = DatabasePoolMode.null
+    data_db_pool_size: int = 5
+    data_db_pool_pre_ping: bool = True
+    data_db_pool_recycle: int = 30 * 60  # seconds
+    # Number of executions after which psycopg prepares a query on the server, only applied to the queue pool mode.
+    # `None` keeps the psycopg default. Bulk transfers (`CENSUS_BULK_TRANSFER`) inline their parameters and are never
+    # prepared.
+    data_db_prepare_threshold: Optional[int] = None
+
+    census_fetch_mode: CensusFetchMode = CensusFetchMode.per_table
+    census_bulk_transfer: bool = False
+    # Check the declared census tables against the database on start-up
+    census_verify_schema: bool = False
+    # Tile cache used by the `cached` census fetch mode, tiles of other census versions are discarded
+    census_cache_dir: Path = Path('cache/census')
+    census_cache_max_size: int = 2 * 1024**3  # bytes
+    census_version: str = '2022'
+    # Offline census snapshot used by the `snapshot` census fetch mode and written by `export-census-snapshot`
+    census_snapshot_dir: Path = Path('cache/census_snapshot')
+    # Persistent cache of the downloaded ERA5 data shared by all computations
+    era5_cache: bool = False
+    era5_cache_dir: Path = Path('cache/era5')
+    era5_cache_max_size: int = 5 * 1024**3  # bytes
+    # Local store of the ERA5 data of the whole of Germany, filled by `fill-era5-store`
+    era5_store: bool = False
+    era5_store_dir: Path = Path('cache/era5_store')
+
+    # Hand out the gridded layers as vector layers of the cell polygons, as Cloud-optimized GeoTIFFs, as a single
+    # layer with all per-cell outputs as attributes, or as vector layers of cells aggregated to at most 100,000 cells
+    gridded_output_mode: GriddedOutputMode = GriddedOutputMode.vector
+    # Build the artifacts of a computation one after another, or concurrently in a pool of threads with
+    # `artifact_workers` workers (by default one per CPU)
+    artifact_executor: ArtifactExecutorMode = ArtifactExecutorMode.sequential
+    artifact_workers: Optional[int] = None
+    # The profile of each computation's stages is logged. Tracing the peak memory of each stage slows down the
+    # computation, the profile can additionally be written as JSON to the computation directory
+    profile_trace_memory: bool = False
+    profile_json: bool = False
 
     cdsapi_url: str = 'https://cds.climate.copernicus.eu/api'
     cdsapi_key: str = None
@@ -17,7 +69,24 @@ class Settings(BaseSettings):
 
     @property
     def ca_database_url(self) -> str:
-        return f'postgresql://{self.data_db_user}:{self.data_db_password}@{self.data_db_host}:{self.data_db_port}/{self.data_db_name}'
+        return f'postgresql+psycopg://{self.data_db_user}:{self.data_db_password}@{self.data_db_host}:{self.data_db_port}/{self.data_db_name}'
+
+    @property
+    def ca_database_engine_options(self) -> dict:
+        """Keyword arguments for `sqlalchemy.create_engine` configuring the connection pool."""
+        match self.data_db_pool_mode:
+            case DatabasePoolMode.null:
+                return {'poolclass': NullPool}
+            case DatabasePoolMode.queue:
+                pool_options = {
+                    'pool_size': self.data_db_pool_size,
+                    'pool_pre_ping': self.data_db_pool_pre_ping,
+                    'pool_recycle': self.data_db_pool_recycle,
+                }
+                if self.data_db_prepare_threshold is not None:
+                    # Prepared statements only pay off on connections that are reused across computations
+                    pool_options['connect_args'] = {'prepare_threshold': self.data_db_prepare_threshold}
+                return pool_options
 
 
 class FeatureFlags(BaseSettings):
@@ -1,4 +1,5 @@
 import logging
+from datetime import datetime
 from pathlib import Path
 from typing import NoReturn
 
@@ -9,6 +10,16 @@ from climatoology.base.logging import get_climatoology_logger
 from climatoology.base.plugin_info import DEFAULT_LANGUAGE
 from ecmwf.datastores import Client as cds_Client
 
+from heating_emissions.components.census_data import (
+    SNAPSHOT_PARTITION_SIZE,
+    CensusFetchMode,
+    CensusSnapshot,
+    CensusTileCache,
+    export_census_snapshot,
+)
+from heating_emissions.components.temporal_downscale.era5_data import Era5Cache, Era5Store
+from heating_emissions.components.utils import get_germany_boundaries
+from heating_emissions.core.executor import ArtifactExecutor
 from heating_emissions.core.info import get_info
 from heating_emissions.core.input import ComputeInput
 from heating_emissions.core.operator_worker import Operator
@@ -31,10 +42,46 @@ def plugin(ctx: Context) -> None:
         cdsapi_client = cds_Client(url=settings.cdsapi_url, key=settings.cdsapi_key, retry_after=60, maximum_tries=20)
         cdsapi_client.check_authentication()
 
-    operator = Operator(ca_database_url=settings.ca_database_url, cdsapi_client=cdsapi_client)
+    census_tile_cache = None
+    if settings.census_fetch_mode == CensusFetchMode.cached:
+        census_tile_cache = CensusTileCache(
+            cache_dir=settings.census_cache_dir,
+            census_version=settings.census_version,
+            max_size=settings.census_cache_max_size,
+        )
+
+    census_snapshot = None
+    if settings.census_fetch_mode == CensusFetchMode.snapshot:
+        census_snapshot = CensusSnapshot(snapshot_dir=settings.census_snapshot_dir)
+
+    era5_cache = None
+    if settings.era5_cache:
+        era5_cache = Era5Cache(cache_dir=settings.era5_cache_dir, max_size=settings.era5_cache_max_size)
+
+    era5_store = None
+    if settings.era5_store:
+        era5_store = Era5Store(store_dir=settings.era5_store_dir)
+
+    operator = Operator(
+        ca_database_url=settings.ca_database_url,
+        cdsapi_client=cdsapi_client,
+        census_fetch_mode=settings.census_fetch_mode,
+        census_bulk_transfer=settings.census_bulk_transfer,
+        engine_options=settings.ca_database_engine_options,
+        verify_census_schema=settings.census_verify_schema,
+        census_tile_cache=census_tile_cache,
+        census_snapshot=census_snapshot,
+        era5_cache=era5_cache,
+        era5_store=era5_store,
+        gridded_output_mode=settings.gridded_output_mode,
+        artifact_executor=ArtifactExecutor(mode=settings.artifact_executor, max_workers=settings.artifact_workers),
+        profile_trace_memory=settings.profile_trace_memory,
+        profile_json=settings.profile_json,
+    )
 
     ctx.ensure_object(dict)
     ctx.obj['operator'] = operator
+    ctx.obj['settings'] = settings
 
 
 @plugin.command()
@@ -87,3 +134,47 @@ def compute(  # dead: disable
     )
 
     print(f'Wrote {len(computation_info.artifacts)} artifacts to {computation_info.output_dir.absolute()}')
+
+
+@plugin.command(name='export-census-snapshot')
+@click.option(
+    '--partition-size',
+    default=SNAPSHOT_PARTITION_SIZE,
+    type=int,
+    help='The edge length of the square snapshot partitions in census grid cells',
+)
+@click.pass_context
+def export_snapshot(ctx: Context, partition_size: int) -> None:  # dead: disable
+    settings = ctx.obj['settings']
+    log.info(f'Exporting the census data to a snapshot in {settings.census_snapshot_dir}')
+
+    germany = get_germany_boundaries().to_crs('EPSG:3035')
+    export_census_snapshot(
+        db_connection=ctx.obj['operator'].ca_database_connection,
+        area=germany.union_all(),
+        snapshot_dir=settings.census_snapshot_dir,
+        census_version=settings.census_version,
+        partition_size=partition_size,
+    )
+
+    print(f'Wrote the census snapshot to {settings.census_snapshot_dir.absolute()}')
+
+
+@plugin.command(name='fill-era5-store')
+@click.option('--first-year', default=2017, type=int, help='The first year to fill the ERA5 store with')
+@click.option(
+    '--last-year', default=datetime.now().year - 1, type=int, help='The last year to fill the ERA5 store with'
+)
+@click.option('--refresh', is_flag=True, help='Download the months that are already in the store again')
+@click.pass_context
+def fill_era5_store(ctx: Context, first_year: int, last_year: int, refresh: bool) -> None:  # dead: disable
+    settings = ctx.obj['settings']
+    cdsapi_client = ctx.obj['operator'].cdsapi_client
+    if cdsapi_client is None:
+        raise click.UsageError('The CDS API key (CDSAPI_KEY) must be configured to fill the ERA5 store')
+
+    log.info(f'Filling the ERA5 store in {settings.era5_store_dir} for {first_year} to {last_year}')
+    era5_store = Era5Store(store_dir=settings.era5_store_dir)
+    written = era5_store.fill(cdsapi_client=cdsapi_client, years=range(first_year, last_year + 1), refresh=refresh)
+
+    print(f'Wrote {len(written)} months to the ERA5 store in {settings.era5_store_dir.absolute()}')
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from heating_emissions.components.cell_aggregation import aggregate_cells, get_aggregation_level
+from heating_emissions.components.census_grid import index_by_cell_key
+
+
+@pytest.fixture
+def cells() -> pd.DataFrame:
+    # Three cells within the same 200-m cell and one cell in the 200-m cell east of it
+    cells = pd.DataFrame(
+        {
+            'x_mp_100m': [4224050, 4224150, 4224050, 4224250],
+            'y_mp_100m': [2923050, 2923050, 2923150, 2923050],
+            'population': [10.0, 30.0, 0.0, 0.0],
+            'direct_co2_emissions': [1000.0, 3000.0, 0.0, 500.0],
+            'heat_consumption': [100.0, 140.0, 200.0, 80.0],
+            'dominant_age': ['pre_1919', '1949_1978', '1949_1978', 'unknown'],
+        }
+    )
+    return index_by_cell_key(cells)
+
+
+def test_aggregate_cells(cells):
+    aggregated = aggregate_cells(cells, level=1)
+
+    assert aggregated.index.tolist() == ['CRS3035RES200mN2923000E4224000', 'CRS3035RES200mN2923000E4224200']
+    assert aggregated['x_mp_100m'].tolist() == [4224100, 4224300]
+    assert aggregated['y_mp_100m'].tolist() == [2923100, 2923100]
+    assert aggregated['direct_co2_emissions'].tolist() == [1000.0, 125.0]
+    assert aggregated['heat_consumption'].tolist() == [130.0, 80.0]
+    assert aggregated['dominant_age'].tolist() == ['1949_1978', 'unknown']
+
+
+def test_aggregate_cells_keeps_census_cells(cells):
+    aggregated = aggregate_cells(cells, level=0)
+
+    assert aggregated.index[0] == 'CRS3035RES100mN2923000E4224000'
+    np.testing.assert_array_equal(aggregated.to_numpy(), cells.to_numpy())
+
+
+def test_get_aggregation_level(cells):
+    assert get_aggregation_level(cells, max_cells=4) == 0
+    assert get_aggregation_level(cells, max_cells=2) == 1
+    assert get_aggregation_level(cells, max_cells=1) == 2
@@ -1,27 +1,53 @@
+import io
+import os
+from dataclasses import replace
+from unittest.mock import Mock, patch
+
 import geopandas as gpd
 import numpy as np
 import pandas as pd
 import pytest
 import shapely
 from climatoology.base.exception import ClimatoologyUserError
-from pandas._testing import assert_series_equal
+from pandas._testing import assert_frame_equal, assert_series_equal
+from sqlalchemy import Column, Float
 
 from heating_emissions.components.census_data import (
+    CensusFetchMode,
+    CensusSnapshot,
+    CensusTileCache,
+    CopyStream,
     clean_building_age_data,
+    clean_census_tables,
+    collect_census_data,
+    collect_census_tables,
+    declare_census_tables,
+    export_census_snapshot,
     extract_dominant_characteristics,
-    get_census_tables_from_db,
     get_clipped_census_grid,
+    query_joined_census_tables,
+    verify_census_tables,
 )
+from heating_emissions.components.census_grid import raster_ids_to_cell_keys
 
 
-def test_get_census_tables_from_db(operator):
-    with operator.ca_database_connection.engine.connect() as connection:
-        raster_grid = gpd.read_postgis(
-            'select * from census_de.raster_grid_100m', con=connection, geom_col='geometry', index_col='raster_id_100m'
-        )
-    census_data, uncalc_census_data = get_census_tables_from_db(
-        db_connection=operator.ca_database_connection, raster_grid=raster_grid
+def test_verify_census_tables(operator):
+    verify_census_tables(operator.ca_database_connection.engine, declare_census_tables())
+
+
+def test_verify_census_tables_missing_column(operator):
+    metadata = declare_census_tables()
+    metadata.tables['census_de.population'].append_column(Column('unknown_column', Float))
+
+    with pytest.raises(ValueError, match='missing the columns'):
+        verify_census_tables(operator.ca_database_connection.engine, metadata)
+
+
+def test_collect_census_tables_per_table(default_german_aoi, operator):
+    raster_grid, census_tables = collect_census_tables(
+        db_connection=operator.ca_database_connection, aoi=default_german_aoi, fetch_mode=CensusFetchMode.per_table
     )
+    census_data, uncalc_census_data = clean_census_tables(raster_grid, census_tables)
 
     expected_columns = ['population', 'average_sqm_per_person', 'heat_consumption', 'direct', 'life_cycle']
     expected_columns_uncalc = ['dominant_age', 'dominant_energy']
@@ -49,6 +75,140 @@ def test_get_clipped_census_grid(default_german_aoi, operator):
     assert not any([index in result_gdf.index for index in outside_aoi])
 
 
+def test_query_joined_census_tables(default_german_aoi, operator):
+    raster_grid, census_tables = query_joined_census_tables(operator.ca_database_connection, default_german_aoi)
+
+    expected_raster_grid = get_clipped_census_grid(operator.ca_database_connection, default_german_aoi)
+
+    assert isinstance(raster_grid, gpd.GeoDataFrame)
+    assert set(raster_grid.index) == set(raster_ids_to_cell_keys(expected_raster_grid.index))
+    assert set(census_tables['census_de.population'].columns) == {'population'}
+
+
+def test_collect_census_data_fetch_modes_agree(default_german_aoi, operator):
+    per_table = collect_census_data(
+        operator.ca_database_connection, default_german_aoi, fetch_mode=CensusFetchMode.per_table
+    )
+    joined = collect_census_data(operator.ca_database_connection, default_german_aoi, fetch_mode=CensusFetchMode.joined)
+
+    for expected, received in zip(per_table, joined):
+        assert_frame_equal(
+            left=pd.DataFrame(expected).sort_index(),
+            right=pd.DataFrame(received)[expected.columns].sort_index(),
+            check_dtype=False,
+        )
+
+
+def test_collect_census_data_grid_fetch_mode(default_german_aoi, operator):
+    expected = collect_census_data(operator.ca_database_connection, default_german_aoi)
+    received = collect_census_data(operator.ca_database_connection, default_german_aoi, fetch_mode=CensusFetchMode.grid)
+
+    for expected_data, received_data in zip(expected, received):
+        assert_frame_equal(
+            left=pd.DataFrame(expected_data).sort_index(),
+            right=pd.DataFrame(received_data)[expected_data.columns].sort_index(),
+            check_dtype=False,
+        )
+
+
+@pytest.mark.parametrize('fetch_mode', [CensusFetchMode.per_table, CensusFetchMode.joined])
+def test_collect_census_data_bulk_transfer(default_german_aoi, operator, fetch_mode):
+    bulk_connection = replace(operator.ca_database_connection, bulk_transfer=True)
+
+    expected = collect_census_data(operator.ca_database_connection, default_german_aoi, fetch_mode=fetch_mode)
+    received = collect_census_data(bulk_connection, default_german_aoi, fetch_mode=fetch_mode)
+
+    for expected_data, received_data in zip(expected, received):
+        assert_frame_equal(
+            left=pd.DataFrame(expected_data).sort_index(),
+            right=pd.DataFrame(received_data)[expected_data.columns].sort_index(),
+            check_dtype=False,
+            check_index_type=False,
+        )
+
+
+def test_copy_stream():
+    copy = Mock()
+    copy.read.side_effect = [b'raster_id_100m,population\nA,', b'1.0\nB,2.0\n', b'']
+
+    assert io.BufferedReader(CopyStream(copy), buffer_size=4).read() == b'raster_id_100m,population\nA,1.0\nB,2.0\n'
+
+
+def test_collect_census_data_cached_fetch_mode(default_german_aoi, operator, tmp_path):
+    tile_cache = CensusTileCache(cache_dir=tmp_path, census_version='test', max_size=1024**3)
+
+    expected = collect_census_data(operator.ca_database_connection, default_german_aoi)
+    received = collect_census_data(
+        operator.ca_database_connection, default_german_aoi, fetch_mode=CensusFetchMode.cached, tile_cache=tile_cache
+    )
+
+    for expected_data, received_data in zip(expected, received):
+        assert_frame_equal(
+            left=pd.DataFrame(expected_data).sort_index(),
+            right=pd.DataFrame(received_data)[expected_data.columns].sort_index(),
+            check_dtype=False,
+        )
+    assert list((tmp_path / 'test').glob('*.feather'))
+
+
+def test_collect_census_data_cached_fetch_mode_reuses_tiles(default_german_aoi, operator, tmp_path):
+    tile_cache = CensusTileCache(cache_dir=tmp_path, census_version='test', max_size=1024**3)
+    expected = collect_census_data(
+        operator.ca_database_connection, default_german_aoi, fetch_mode=CensusFetchMode.cached, tile_cache=tile_cache
+    )
+
+    with patch('heating_emissions.components.census_data.query_census_tiles') as query_census_tiles:
+        received = collect_census_data(
+            operator.ca_database_connection,
+            default_german_aoi,
+            fetch_mode=CensusFetchMode.cached,
+            tile_cache=tile_cache,
+        )
+
+    query_census_tiles.assert_not_called()
+    assert_frame_equal(pd.DataFrame(expected[0]), pd.DataFrame(received[0]))
+
+
+def test_census_tile_cache_evicts_least_recently_used_tiles(tmp_path):
+    tile_cache = CensusTileCache(cache_dir=tmp_path, census_version='test', max_size=0)
+    tile_data = pd.DataFrame({'x_mp_100m': [4224150], 'y_mp_100m': [2923050]})
+    for age, tile in enumerate([(0, 0), (0, 1), (0, 2)]):
+        tile_cache.write_tile(tile, tile_data)
+        os.utime(tile_cache.tile_path(tile), (age, age))
+    (tmp_path / 'outdated').mkdir()
+    tile_cache.write_tile((0, 3), tile_data)
+    os.replace(tile_cache.tile_path((0, 3)), tmp_path / 'outdated' / '0_3.feather')
+
+    tile_cache.max_size = 2 * tile_cache.tile_path((0, 0)).stat().st_size
+    tile_cache.evict()
+
+    assert sorted(path.name for path in tmp_path.rglob('*.feather')) == ['0_1.feather', '0_2.feather']
+    assert_frame_equal(tile_cache.read_tile((0, 1)), tile_data)
+    assert tile_cache.read_tile((0, 0)) is None
+
+
+def test_collect_census_data_snapshot_fetch_mode(default_german_aoi, operator, tmp_path):
+    area = gpd.GeoSeries([default_german_aoi], crs='EPSG:4326').to_crs('EPSG:3035').iloc[0]
+    export_census_snapshot(
+        operator.ca_database_connection, area=area, snapshot_dir=tmp_path, census_version='test', partition_size=100
+    )
+
+    expected = collect_census_data(operator.ca_database_connection, default_german_aoi)
+    received = collect_census_data(
+        operator.ca_database_connection,
+        default_german_aoi,
+        fetch_mode=CensusFetchMode.snapshot,
+        snapshot=CensusSnapshot(snapshot_dir=tmp_path),
+    )
+
+    for expected_data, received_data in zip(expected, received):
+        assert_frame_equal(
+            left=pd.DataFrame(expected_data).sort_index(),
+            right=pd.DataFrame(received_data)[expected_data.columns].sort_index(),
+            check_dtype=False,
+        )
+
+
 def test_get_clipped_census_grid_no_data(operator):
     empty_aoi = shapely.MultiPolygon(
         polygons=[
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import shapely
+
+from heating_emissions.components.census_grid import (
+    cell_keys_from_coordinates,
+    cell_keys_to_raster_ids,
+    cell_keys_to_tiles,
+    format_raster_ids,
+    get_cell_id_ranges,
+    get_tile_cell_id_ranges,
+    get_tiles_intersecting,
+    index_by_raster_id,
+    raster_ids_to_cell_keys,
+    rasterize_aoi,
+    rasterize_cells,
+)
+
+
+def test_format_raster_ids():
+    raster_ids = format_raster_ids(np.array([2923000, 2923100]), np.array([4224200, 4224300]))
+
+    assert raster_ids.tolist() == ['CRS3035RES100mN2923000E4224200', 'CRS3035RES100mN2923100E4224300']
+
+
+def test_cell_keys_round_trip():
+    raster_ids = pd.Index(['CRS3035RES100mN2923000E4224200', 'CRS3035RES100mN2923100E4224300'])
+
+    cell_keys = raster_ids_to_cell_keys(raster_ids)
+
+    assert cell_keys.dtype == np.int64
+    assert cell_keys.tolist() == cell_keys_from_coordinates([4224250, 4224350], [2923050, 2923150]).tolist()
+    assert cell_keys_to_raster_ids(cell_keys).tolist() == raster_ids.tolist()
+
+
+def test_index_by_raster_id():
+    data = pd.DataFrame({'population': [41]}, index=pd.Index([2923042242], name='cell_key'))
+
+    received = index_by_raster_id(data, name='index')
+
+    assert received.index.tolist() == ['CRS3035RES100mN2923000E4224200']
+    assert received.index.name == 'index'
+
+
+def test_rasterize_aoi(default_german_aoi):
+    x_mp_100m, y_mp_100m = rasterize_aoi(default_german_aoi)
+    raster_ids = format_raster_ids(y_mp_100m - 50, x_mp_100m - 50)
+
+    inside_aoi = [
+        'CRS3035RES100mN2923000E4224200',
+        'CRS3035RES100mN2923000E4224300',
+        'CRS3035RES100mN2923000E4224400',
+        'CRS3035RES100mN2923100E4224100',
+        'CRS3035RES100mN2923100E4224200',
+        'CRS3035RES100mN2923100E4224300',
+    ]
+    outside_aoi = ['CRS3035RES100mN2922800E4223800', 'CRS3035RES100mN2922800E4223900']
+
+    assert all([raster_id in raster_ids for raster_id in inside_aoi])
+    assert not any([raster_id in raster_ids for raster_id in outside_aoi])
+
+
+def test_rasterize_aoi_outside_grid_cell_centres():
+    aoi = shapely.MultiPolygon(polygons=[shapely.box(8.6640, 49.4100, 8.6641, 49.4101)])
+
+    x_mp_100m, y_mp_100m = rasterize_aoi(aoi)
+
+    assert len(x_mp_100m) == len(y_mp_100m) == 0
+
+
+def test_get_cell_id_ranges():
+    x_mp_100m = np.array([4224150, 4224250, 4224450, 4224150])
+    y_mp_100m = np.array([2923050, 2923050, 2923050, 2923150])
+
+    cell_id_ranges = get_cell_id_ranges(x_mp_100m, y_mp_100m)
+
+    assert cell_id_ranges.to_dict(orient='records') == [
+        {'first_id': 'CRS3035RES100mN2923000E4224100', 'last_id': 'CRS3035RES100mN2923000E4224200'},
+        {'first_id': 'CRS3035RES100mN2923000E4224400', 'last_id': 'CRS3035RES100mN2923000E4224400'},
+        {'first_id': 'CRS3035RES100mN2923100E4224100', 'last_id': 'CRS3035RES100mN2923100E4224100'},
+    ]
+
+
+def test_cell_keys_to_tiles():
+    cell_keys = cell_keys_from_coordinates(np.array([4224150, 4239950]), np.array([2923050, 2923050]))
+
+    tile_rows, tile_columns = cell_keys_to_tiles(cell_keys, tile_size=100)
+
+    assert tile_rows.tolist() == [292, 292]
+    assert tile_columns.tolist() == [422, 423]
+
+
+def test_get_tile_cell_id_ranges():
+    cell_id_ranges = get_tile_cell_id_ranges([(292, 422)], tile_size=2)
+
+    assert cell_id_ranges.to_dict(orient='records') == [
+        {'first_id': 'CRS3035RES100mN58400E84400', 'last_id': 'CRS3035RES100mN58400E84500'},
+        {'first_id': 'CRS3035RES100mN58500E84400', 'last_id': 'CRS3035RES100mN58500E84500'},
+    ]
+
+
+def test_get_tiles_intersecting():
+    area = shapely.box(4224150, 2923050, 4235000, 2923150)
+
+    tiles = get_tiles_intersecting(area, tile_size=100)
+
+    assert tiles == [(292, 422), (292, 423)]
+
+
+def test_rasterize_cells():
+    x_mp_100m = np.array([4224150, 4224350, 4224150])
+    y_mp_100m = np.array([2923050, 2923050, 2923150])
+
+    raster, transform = rasterize_cells(x_mp_100m, y_mp_100m, values=np.array([1, 2, 3], dtype=np.uint8), nodata=255)
+
+    np.testing.assert_array_equal(raster, [[3, 255, 255], [1, 255, 2]])
+    assert transform * (0, 0) == (4224100, 2923200)
+    assert transform * (3, 2) == (4224400, 2923000)
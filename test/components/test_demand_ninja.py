@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from heating_emissions.components.temporal_downscale import demand_ninja
+from heating_emissions.components.temporal_downscale.temporal_utils import DEMAND_NINJA_THRESHOLD
+
+
+@pytest.fixture(params=[np.float64, np.float32])
+def hourly_inputs(request) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    times = pd.date_range('2022-01-01', periods=31 * 24, freq='h')
+    locations = range(5)
+    variables = {
+        'humidity': rng.uniform(2, 8, (len(times), len(locations))),
+        'radiation_global_horizontal': rng.uniform(0, 300, (len(times), len(locations))),
+        'temperature': rng.normal(2, 6, (len(times), len(locations))),
+        'wind_speed_2m': rng.uniform(0, 10, (len(times), len(locations))),
+    }
+    return pd.concat(
+        {
+            variable: pd.DataFrame(values.astype(request.param), index=times, columns=locations)
+            for variable, values in variables.items()
+        },
+        axis='columns',
+        names=['variable', 'location'],
+    )
+
+
+@pytest.mark.parametrize('parameters', [{}, DEMAND_NINJA_THRESHOLD, {'use_diurnal_profile': False}])
+def test_demand_grid_is_identical_to_demand(hourly_inputs, parameters):
+    received = demand_ninja.demand_grid(hourly_inputs, **parameters)
+
+    for location in hourly_inputs.columns.unique(level='location'):
+        location_inputs = hourly_inputs.xs(location, axis='columns', level='location')
+        expected = demand_ninja.demand(location_inputs.copy(), **parameters)
+        for output in ['total_demand', 'heating_demand', 'cooling_demand']:
+            np.testing.assert_array_equal(received[output][location].to_numpy(), expected[output].to_numpy())
+
+
+def test_demand_grid_rejects_missing_days(hourly_inputs):
+    hourly_inputs.iloc[24:48, 0] = np.nan
+
+    with pytest.raises(AssertionError):
+        demand_ninja.demand_grid(hourly_inputs)
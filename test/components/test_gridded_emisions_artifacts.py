@@ -1,12 +1,32 @@
+import json
 from pathlib import Path
+from unittest.mock import patch
 
 import geopandas as gpd
+import matplotlib
+import numpy as np
+import pandas as pd
 import pytest
 from climatoology.base.artifact import ArtifactModality
+from matplotlib.colors import Normalize, to_hex
+from pydantic_extra_types.color import Color
 
 from heating_emissions.components.gridded_emissions_artifact import (
+    GRIDDED_LAYERS,
+    CellGeometryCache,
+    ClassdataOutput,
+    build_cell_polygons,
+    build_combined_gridded_artifact,
+    build_combined_styling_artifact,
     build_gridded_artifact,
     build_gridded_artifact_classdata,
+    build_gridded_raster_artifact_classdata,
+    describe_classdata_layer,
+    describe_combined_styling,
+    describe_gridded_layer,
+    get_color_lut,
+    lookup_category_colors,
+    lookup_colors,
 )
 
 ROOT_DIR = Path(__file__).parent.parent.parent
@@ -66,3 +86,134 @@ def test_build_gridded_artifact_classdata(compute_resources, output, expected_na
     artifact = build_gridded_artifact_classdata(test_df, compute_resources, output=output)
     assert artifact.name == expected_name
     assert artifact.modality == ArtifactModality.VECTOR_MAP_LAYER
+
+
+@pytest.mark.filterwarnings('error')
+def test_build_gridded_raster_artifact_classdata_unknown_category(compute_resources):
+    test_df = pd.DataFrame(
+        {
+            'x_mp_100m': [4500050, 4500150],
+            'y_mp_100m': [3500050, 3500050],
+            'dominant_energy': ['Gas', 'Peat'],
+        }
+    )
+
+    with patch('heating_emissions.components.gridded_emissions_artifact.create_raster_artifact') as create_artifact:
+        build_gridded_raster_artifact_classdata(test_df, compute_resources, output=ClassdataOutput.dominant_energy)
+
+    raster_info = create_artifact.call_args.kwargs['data']
+    gas_code = list(describe_classdata_layer(ClassdataOutput.dominant_energy)[1]).index('Gas')
+    assert raster_info.data.tolist() == [[gas_code, raster_info.nodata]]
+
+
+def test_build_combined_gridded_artifact(compute_resources):
+    test_df = gpd.GeoDataFrame(
+        {
+            'x_mp_100m': [4500050, 4500150, 4500250],
+            'y_mp_100m': [3500050, 3500150, 3500250],
+            'direct_co2_emissions_per_capita': [100.0, 200.0, 250.0],
+            'life_cycle_co2_emissions_per_capita': [300.0, 400.0, 450.0],
+            'direct_co2_emissions': [1000.0, 2000.0, 2500.0],
+            'life_cycle_co2_emissions': [2000.0, 4000.0, 5500.0],
+            'heat_consumption': [80.0, 90.0, 100.0],
+            'average_sqm_per_person': [20.0, 30.0, 40.0],
+            'direct_emission_factor': [0.1, 0.2, 0.25],
+            'life_cycle_emission_factor': [0.4, 0.2, 0.25],
+        },
+        index=pd.Index(['a', 'b', 'c'], name='index'),
+    )
+    classdata_df = pd.DataFrame(
+        {
+            'dominant_age': ['1949-1978', '1979-1990', 'Unknown'],
+            'dominant_energy': ['Gas', 'District heating', 'Unknown'],
+        },
+        index=test_df.index,
+    )
+
+    artifact = build_combined_gridded_artifact(test_df, classdata_df, compute_resources)
+
+    assert artifact.name == 'Heating emissions and parameters (all layers)'
+    assert artifact.modality == ArtifactModality.VECTOR_MAP_LAYER
+
+
+def test_build_combined_styling_artifact(compute_resources):
+    artifact = build_combined_styling_artifact(compute_resources)
+
+    assert artifact.name == 'Styling of the heating emissions and parameters (all layers)'
+    assert artifact.modality == ArtifactModality.TABLE
+
+
+def test_describe_combined_styling():
+    layers = [describe_gridded_layer(output, is_per_capita) for output, is_per_capita in GRIDDED_LAYERS]
+    classdata_layers = {output: describe_classdata_layer(output) for output in ClassdataOutput}
+
+    styling = describe_combined_styling(layers, classdata_layers)
+
+    assert styling.index.tolist() == [
+        'direct_co2_emissions_per_capita',
+        'life_cycle_co2_emissions_per_capita',
+        'direct_co2_emissions',
+        'life_cycle_co2_emissions',
+        'heat_consumption',
+        'average_sqm_per_person',
+        'direct_emission_factor',
+        'life_cycle_emission_factor',
+        'dominant_age',
+        'dominant_energy',
+    ]
+    assert styling.loc['direct_co2_emissions', 'vmax'] == 150000
+    assert json.loads(styling.loc['dominant_energy', 'colors'])['Gas'].startswith('#')
+
+
+def test_cell_geometry_cache():
+    cells = pd.DataFrame({'x_mp_100m': [4500050, 4500150], 'y_mp_100m': [3500050, 3500150]}, index=['a', 'b'])
+    cell_geometries = CellGeometryCache()
+
+    cell_polygons = cell_geometries.get_cell_polygons(cells)
+
+    assert cell_polygons.crs == 'EPSG:4326'
+    assert cell_polygons.index.tolist() == ['a', 'b']
+    assert cell_polygons.to_crs('EPSG:3035').iloc[0].bounds == pytest.approx((4500000, 3500000, 4500100, 3500100))
+    assert cell_geometries.get_cell_polygons(cells.copy()) is cell_polygons
+    assert cell_geometries.get_cell_polygons(cells.iloc[:1]) is not cell_polygons
+
+
+def test_build_cell_polygons_matches_buffered_centres():
+    cells = pd.DataFrame({'x_mp_100m': [4224150, 4500050], 'y_mp_100m': [2923050, 3500150]})
+    grid_cell_centroids = gpd.GeoSeries(gpd.points_from_xy(cells['x_mp_100m'], cells['y_mp_100m']), crs='EPSG:3035')
+    expected = grid_cell_centroids.buffer(50, cap_style=3).to_crs('EPSG:4326')
+
+    cell_polygons = build_cell_polygons(cells)
+
+    assert cell_polygons.crs == 'EPSG:4326'
+    assert cell_polygons.geom_equals_exact(expected, tolerance=1e-9).all()
+
+
+def test_build_cell_polygons_of_aggregated_cells():
+    cells = pd.DataFrame({'x_mp_100m': [4500100], 'y_mp_100m': [3500100]})
+
+    cell_polygons = build_cell_polygons(cells, cell_size=200)
+
+    assert cell_polygons.to_crs('EPSG:3035').iloc[0].bounds == pytest.approx((4500000, 3500000, 4500200, 3500200))
+
+
+def test_lookup_colors_matches_colormap():
+    values = pd.Series([-1.0, 0.0, 0.1, 1499.9, 1500.0, 2999.99, 3000.0, 3000.1, np.nan])
+    norm = Normalize(vmin=0, vmax=3000)
+    cmap = matplotlib.colormaps.get('YlOrRd')
+    cmap.set_under('#808080')
+    expected = [Color(to_hex(cmap(norm(value)))) for value in values]
+
+    colors = lookup_colors(values, vmin=0, vmax=3000, color_lut=get_color_lut('YlOrRd', under_color='#808080'))
+
+    assert colors.tolist() == expected
+
+
+@pytest.mark.filterwarnings('error')
+def test_lookup_category_colors():
+    color_map = {'Gas': Color('#ff0000'), 'Unknown': Color('#808080')}
+
+    colors = lookup_category_colors(pd.Series(['Unknown', 'Gas', 'Wood']), color_map)
+
+    assert colors[:2].tolist() == [Color('#808080'), Color('#ff0000')]
+    assert pd.isna(colors[2])
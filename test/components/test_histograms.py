@@ -1,12 +1,18 @@
 import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
 from plotly.graph_objects import Figure
 
 from heating_emissions.components.histogram_artifacts import (
+    bin_metric,
+    format_summary,
     plot_direct_emission_factor_histogram,
     plot_energy_consumption_histogram,
     plot_life_cycle_emission_factor_histogram,
     plot_per_capita_direct_co2_histogram,
     plot_per_capita_life_cycle_co2_histogram,
+    summarize_histogram_metrics,
 )
 from heating_emissions.components.utils import calculate_heating_emissions
 
@@ -25,12 +31,13 @@ def test_plot_histograms():
     )
 
     result = calculate_heating_emissions(default_census_data)
+    statistics = summarize_histogram_metrics(result)
 
-    direct_per_capita_histogram = plot_per_capita_direct_co2_histogram(result)
-    life_cycle_per_capita_histogram = plot_per_capita_life_cycle_co2_histogram(result)
-    energy_consumption_histogram = plot_energy_consumption_histogram(result)
-    direct_emission_factor_histogram = plot_direct_emission_factor_histogram(result)
-    life_cycle_emission_factor_histogram = plot_life_cycle_emission_factor_histogram(result)
+    direct_per_capita_histogram = plot_per_capita_direct_co2_histogram(result, statistics)
+    life_cycle_per_capita_histogram = plot_per_capita_life_cycle_co2_histogram(result, statistics)
+    energy_consumption_histogram = plot_energy_consumption_histogram(result, statistics)
+    direct_emission_factor_histogram = plot_direct_emission_factor_histogram(result, statistics)
+    life_cycle_emission_factor_histogram = plot_life_cycle_emission_factor_histogram(result, statistics)
 
     assert isinstance(direct_per_capita_histogram, Figure)
     assert isinstance(life_cycle_per_capita_histogram, Figure)
@@ -38,8 +45,49 @@ def test_plot_histograms():
     assert isinstance(direct_emission_factor_histogram, Figure)
     assert isinstance(life_cycle_emission_factor_histogram, Figure)
 
-    assert direct_per_capita_histogram['data'][0]['x'][0] == 0.52
-    assert life_cycle_per_capita_histogram['data'][0]['x'][0] == 1.04
-    assert energy_consumption_histogram['data'][0]['x'][0] == 65
-    assert direct_emission_factor_histogram['data'][0]['x'][0] == 0.2
-    assert life_cycle_emission_factor_histogram['data'][0]['x'][0] == 0.4
+    assert statistics.loc['direct_co2_emissions_per_capita', 'min'] == 0.52
+    assert statistics.loc['life_cycle_co2_emissions_per_capita', 'min'] == 1.04
+    assert statistics.loc['heat_consumption', 'min'] == 65
+    assert statistics.loc['direct_emission_factor', 'min'] == 0.15
+    assert statistics.loc['life_cycle_emission_factor', 'min'] == 0.15
+    assert sum(direct_per_capita_histogram['data'][0]['y']) == pytest.approx(100)
+
+
+def test_summarize_histogram_metrics():
+    census_data = pd.DataFrame(
+        {
+            'population': [10.0, 30.0, 0.0, 20.0],
+            'direct_co2_emissions_per_capita': [1000.0, 2000.0, 4000.0, np.nan],
+            'life_cycle_co2_emissions_per_capita': [1000.0, 2000.0, 4000.0, 3000.0],
+            'heat_consumption': [100.0, 100.0, 100.0, 100.0],
+            'direct_emission_factor': [0.1, 0.2, 0.3, 0.4],
+            'life_cycle_emission_factor': [np.nan] * 4,
+        }
+    )
+
+    statistics = summarize_histogram_metrics(census_data)
+
+    direct_statistics = statistics.loc['direct_co2_emissions_per_capita']
+    assert direct_statistics['count'] == 3
+    assert direct_statistics[['mean', 'min', 'max', 'median']].tolist() == [pytest.approx(7 / 3), 1, 4, 2]
+    assert direct_statistics['population_weighted_mean'] == 1.75
+    assert statistics.loc['life_cycle_co2_emissions_per_capita', 'population_weighted_mean'] == pytest.approx(13 / 6)
+    assert statistics.loc['life_cycle_emission_factor', 'count'] == 0
+
+
+def test_bin_histogram():
+    census_data = pd.DataFrame({'direct_emission_factor': [0.15, 0.2, 0.3, np.nan]})
+
+    bins = bin_metric(census_data, 'direct_emission_factor')
+
+    np.testing.assert_allclose(bins.edges, [0.15, 0.2, 0.25, 0.3, 0.35])
+    np.testing.assert_allclose(bins.percentages, [100 / 3, 100 / 3, 0, 100 / 3])
+
+
+def test_format_summary():
+    census_data = pd.DataFrame({'heat_consumption': [65, 125.3, 145.2]})
+    statistics = summarize_histogram_metrics(census_data, metrics=['heat_consumption'])
+
+    summary = format_summary('{mean_data} from {min_data} to {max_data}', statistics.loc['heat_consumption'])
+
+    assert summary == '111.83 from 65.0 to 145.2'
@@ -0,0 +1,42 @@
+from functools import partial
+
+import numpy as np
+
+from heating_emissions.components.profiling import profile_computation, profile_stage, profiled
+from heating_emissions.core.executor import ArtifactExecutor, ArtifactExecutorMode
+
+
+def test_profile_stage_records_stages():
+    with profile_computation(trace_memory=True) as profile:
+        with profile_stage('allocation') as stage:
+            values = np.ones(1_000_000)
+            stage.rows = len(values)
+
+    assert [record.stage for record in profile.stages] == ['allocation']
+    record = profile.stages[0]
+    assert record.rows == 1_000_000
+    assert record.wall_time > 0
+    assert record.peak_memory >= values.nbytes
+    assert record.process_peak_rss >= values.nbytes
+    assert profile.wall_time >= record.wall_time
+
+
+def test_profile_stage_outside_computation():
+    with profile_computation() as profile:
+        pass
+
+    with profile_stage('unprofiled') as stage:
+        stage.rows = 1
+
+    assert profile.stages == []
+
+
+def test_profiled_tasks_in_thread_executor():
+    executor = ArtifactExecutor(mode=ArtifactExecutorMode.thread, max_workers=2)
+    tasks = [partial(profiled(f'task:{index}', divmod), index, 2) for index in range(4)]
+
+    with profile_computation() as profile:
+        received = executor.run(tasks)
+
+    assert received == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    assert sorted(record.stage for record in profile.stages) == ['task:0', 'task:1', 'task:2', 'task:3']
@@ -0,0 +1,84 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from pandas._testing import assert_series_equal
+
+from heating_emissions.components.census_data import CENSUS_TABLE_COLUMNS, clean_census_tables
+from heating_emissions.components.scenarios import EmissionScenario, evaluate_scenarios
+from heating_emissions.components.utils import (
+    EMISSION_FACTORS_DIRECT,
+    EMISSION_FACTORS_LIFE_CYCLE,
+    calculate_heating_emissions,
+)
+
+
+@pytest.fixture
+def census_grid_and_tables() -> tuple[gpd.GeoDataFrame, dict[str, pd.DataFrame]]:
+    cell_keys = pd.Index([1, 2, 3, 4], name='cell_key')
+    raster_grid = gpd.GeoDataFrame(
+        {'x_mp_100m': [4224150, 4224250, 4224350, 4224450], 'y_mp_100m': [2923050] * 4},
+        geometry=gpd.points_from_xy([8.664, 8.665, 8.666, 8.667], [49.41] * 4),
+        index=cell_keys,
+        crs='4326',
+    )
+    census_tables = {
+        'census_de.population': pd.DataFrame({'population': [10.0, 4.0, np.nan]}, index=cell_keys[:3]),
+        'census_de.residential_living_space': pd.DataFrame(
+            {'average_sqm_per_person': [40.0, np.nan]}, index=cell_keys[:2]
+        ),
+        'census_de.residential_buildings_by_year': pd.DataFrame(
+            {'pre_1919': [2.0, np.nan, 0.0], '2001_2010': [1.0, 3.0, 0.0]}, index=cell_keys[:3]
+        ).reindex(columns=CENSUS_TABLE_COLUMNS['census_de.residential_buildings_by_year']),
+        'census_de.residential_heating_sources': pd.DataFrame(
+            {'gas': [3.0, 0.0, np.nan], 'wood': [1.0, 0.0, 2.0], 'electricity': [np.nan, 0.0, 1.0]}, index=cell_keys[:3]
+        ).reindex(columns=CENSUS_TABLE_COLUMNS['census_de.residential_heating_sources']),
+    }
+    return raster_grid, census_tables
+
+
+def test_evaluate_scenarios_reproduces_heating_emissions(census_grid_and_tables):
+    raster_grid, census_tables = census_grid_and_tables
+    census_data, _ = clean_census_tables(raster_grid, census_tables)
+    expected = calculate_heating_emissions(census_data)
+
+    received = evaluate_scenarios(
+        raster_grid,
+        census_tables,
+        scenarios=[
+            EmissionScenario(name='direct', emission_factors=EMISSION_FACTORS_DIRECT),
+            EmissionScenario(name='life_cycle', emission_factors=EMISSION_FACTORS_LIFE_CYCLE),
+        ],
+    )
+
+    for mode in ['direct', 'life_cycle']:
+        assert_series_equal(received.co2_emissions[mode], expected[f'{mode}_co2_emissions'], check_names=False)
+        assert_series_equal(
+            received.co2_emissions_per_capita[mode], expected[f'{mode}_co2_emissions_per_capita'], check_names=False
+        )
+    assert received.summary.loc['direct', 'co2_emissions'] == expected['direct_co2_emissions'].sum()
+
+
+def test_evaluate_scenarios_without_emissions(census_grid_and_tables):
+    raster_grid, census_tables = census_grid_and_tables
+
+    received = evaluate_scenarios(
+        raster_grid,
+        census_tables,
+        scenarios=[
+            EmissionScenario(name='current', emission_factors=EMISSION_FACTORS_DIRECT),
+            EmissionScenario(name='heat_pumps_only', emission_factors={'solar_geothermal_heat_pumps': 0.0}),
+        ],
+    )
+
+    assert list(received.co2_emissions.columns) == ['current', 'heat_pumps_only']
+    assert received.summary.loc['current', 'co2_emissions'] > 0
+    assert received.summary.loc['heat_pumps_only', 'co2_emissions'] == 0
+
+
+def test_evaluate_scenarios_duplicate_names(census_grid_and_tables):
+    raster_grid, census_tables = census_grid_and_tables
+    scenarios = [EmissionScenario(name='direct', emission_factors=EMISSION_FACTORS_DIRECT)] * 2
+
+    with pytest.raises(ValueError, match='Scenario names must be unique'):
+        evaluate_scenarios(raster_grid, census_tables, scenarios=scenarios)
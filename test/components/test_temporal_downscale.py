@@ -1,13 +1,24 @@
+import os
+from datetime import date
 from pathlib import Path
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import xarray
 
-from heating_emissions.components.temporal_downscale.era5_data import open_era5_data
+from heating_emissions.components.temporal_downscale.era5_data import (
+    ERA5_RESOLUTION,
+    Era5Cache,
+    Era5Store,
+    open_era5_data,
+)
 from heating_emissions.components.temporal_downscale.temporal_estimation import (
     calculate_hourly_emissions_permonth,
     collect_building_hourly_energy_demand_permonth,
+    map_census_to_era5,
 )
+from heating_emissions.components.temporal_downscale.temporal_utils import VARIABLES_NAMES
 
 
 def test_open_era5_data(default_era5_data_dir: Path):
@@ -54,3 +65,112 @@ def test_calculate_hourly_emissions_permonth():
     assert emission_map.index.names == expected_index_map
     assert all([c in emission_map.columns for c in expected_columns_map])
     assert all([c in emission_hourly_regional.columns for c in expected_columns_hourly_line])
+
+
+def test_calculate_hourly_emissions_permonth_values():
+    hourly_demand = pd.DataFrame(
+        {
+            'valid_time': pd.to_datetime(
+                ['2022-01-01 00:00', '2022-01-01 00:00', '2022-01-01 01:00', '2022-01-01 01:00']
+            ),
+            'latitude': [49.0, 49.0, 49.0, 49.0],
+            'longitude': [8.0, 8.25, 8.0, 8.25],
+            'heating_demand': [1.0, 2.0, 3.0, 4.0],
+        }
+    )
+    census_data = gpd.GeoDataFrame(
+        {'population': [10.0, 20.0, None], 'direct': [0.5, 0.25, 0.5]},
+        geometry=gpd.points_from_xy([8.01, 8.24, 8.02], [49.01, 49.0, 49.0]),
+        index=pd.Index(['a', 'b', 'c'], name='raster_id_100m'),
+        crs='EPSG:4326',
+    )
+
+    emission_map, emission_hourly_regional = calculate_hourly_emissions_permonth(hourly_demand, census_data)
+
+    assert emission_map['lon_era5'].tolist() == [8.0, 8.25, 8.0]
+    assert emission_map['monthly_emissions'].tolist()[:2] == [20.0, 30.0]
+    assert pd.isna(emission_map.loc['c', 'monthly_emissions'])
+    assert emission_hourly_regional['regional_hourly_emissions'].tolist() == [15.0, 35.0]
+
+
+def test_map_census_to_era5():
+    census_data = gpd.GeoDataFrame(
+        geometry=gpd.points_from_xy([8.01, 8.13, 8.37], [49.12, 49.13, 48.9]),
+        index=pd.Index(['a', 'b', 'c'], name='raster_id_100m'),
+        crs='EPSG:4326',
+    )
+
+    era5_mapping = map_census_to_era5(census_data)
+
+    assert era5_mapping.index.equals(census_data.index)
+    assert (era5_mapping['era5_column'] * ERA5_RESOLUTION).tolist() == [8.0, 8.25, 8.25]
+    assert (era5_mapping['era5_row'] * ERA5_RESOLUTION).tolist() == [49.0, 49.25, 49.0]
+
+
+def test_era5_cache_reuses_larger_areas(tmp_path):
+    era5_cache = Era5Cache(cache_dir=tmp_path / 'cache', max_size=1024)
+    download = tmp_path / 'download.zip'
+    download.write_bytes(b'era5')
+    variables = list(VARIABLES_NAMES.keys())
+
+    era5_cache.store(2022, 1, [50.0, 8.0, 49.0, 9.0], variables, download)
+
+    assert era5_cache.fetch(2022, 1, [49.75, 8.5, 49.25, 8.75], variables, tmp_path / 'inside.zip')
+    assert (tmp_path / 'inside.zip').read_bytes() == b'era5'
+    assert not era5_cache.fetch(2022, 1, [50.25, 8.5, 49.25, 8.75], variables, tmp_path / 'outside.zip')
+    assert not era5_cache.fetch(2022, 2, [49.75, 8.5, 49.25, 8.75], variables, tmp_path / 'other_month.zip')
+    assert not era5_cache.fetch(2022, 1, [49.75, 8.5, 49.25, 8.75], variables[:2], tmp_path / 'other_variables.zip')
+
+
+def test_era5_cache_skips_preliminary_months(tmp_path):
+    era5_cache = Era5Cache(cache_dir=tmp_path / 'cache', max_size=1024)
+    download = tmp_path / 'download.zip'
+    download.write_bytes(b'era5')
+    today = date.today()
+
+    era5_cache.store(today.year, today.month, [50.0, 8.0, 49.0, 9.0], ['2m_temperature'], download)
+
+    assert list((tmp_path / 'cache').iterdir()) == []
+
+
+def test_era5_cache_evicts_least_recently_used(tmp_path):
+    era5_cache = Era5Cache(cache_dir=tmp_path / 'cache', max_size=10)
+    download = tmp_path / 'download.zip'
+    download.write_bytes(b'era5')
+    area = [50.0, 8.0, 49.0, 9.0]
+    for month in [1, 2, 3]:
+        era5_cache.store(2022, month, area, ['2m_temperature'], download)
+        path = era5_cache.file_path(2022, month, area, ['2m_temperature'])
+        os.utime(path, (month, month))
+
+    era5_cache.evict()
+
+    assert sorted(path.name for path in (tmp_path / 'cache').iterdir()) == sorted(
+        era5_cache.file_path(2022, month, area, ['2m_temperature']).name for month in [2, 3]
+    )
+
+
+def test_era5_store_reads_the_area_window(tmp_path):
+    era5_store = Era5Store(store_dir=tmp_path)
+    times = pd.date_range('2022-01-01', periods=48, freq='h')
+    latitudes = np.arange(50.0, 48.75, -0.25)
+    longitudes = np.arange(8.0, 9.25, 0.25)
+    shape = (len(times), len(latitudes), len(longitudes))
+    dims = ('valid_time', 'latitude', 'longitude')
+    raw_data = xarray.Dataset(
+        {variable: (dims, np.full(shape, 280.0)) for variable in ['t2m', 'd2m']}
+        | {variable: (dims, np.ones(shape)) for variable in ['u10', 'v10', 'ssrd']}
+        | {'sp': (dims, np.full(shape, 1e5))},
+        coords={'valid_time': times, 'latitude': latitudes, 'longitude': longitudes},
+    )
+    area = [49.5, 8.5, 49.25, 8.75]
+
+    era5_store.write_month(2022, 1, raw_data)
+
+    assert era5_store.covers(2022, 1, area)
+    assert not era5_store.covers(2022, 2, area)
+    assert not era5_store.covers(2022, 1, [60.0, 8.5, 59.75, 8.75])
+    dataset = era5_store.open(2022, 1, area)
+    assert dataset['latitude'].values.tolist() == [49.5, 49.25]
+    assert dataset['longitude'].values.tolist() == [8.5, 8.75]
+    assert all(variable in dataset for variable in ['t2m', 'q2m', 'ssrd', 'wind2m'])
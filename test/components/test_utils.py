@@ -6,6 +6,7 @@ from shapely import box
 from heating_emissions.components.utils import (
     calculate_heating_emissions,
     get_aoi_area,
+    get_germany_boundaries,
     postprocess_uncalculated_census_data,
 )
 
@@ -87,6 +88,18 @@ def test_get_aoi_area():
     assert area == 1.0
 
 
+def test_get_germany_boundaries_outside_project_root(tmp_path, monkeypatch):
+    get_germany_boundaries.cache_clear()
+    monkeypatch.chdir(tmp_path)
+
+    germany = get_germany_boundaries()
+
+    assert germany.crs == 'EPSG:32632'
+    assert germany.union_all().contains(
+        gpd.GeoSeries([box(8.6, 49.3, 8.8, 49.5)], crs='EPSG:4326').to_crs(germany.crs)[0]
+    )
+
+
 def test_postprocess_uncalculate_census_data():
     df = gpd.GeoDataFrame(
         {
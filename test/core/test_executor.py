@@ -0,0 +1,76 @@
+import contextvars
+import re
+from functools import partial
+from pathlib import Path
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from heating_emissions.components.gridded_emissions_artifact import ClassdataOutput, build_gridded_artifact_classdata
+from heating_emissions.core.executor import ArtifactExecutor, ArtifactExecutorMode
+
+GERMAN_MESSAGES = Path(__file__).parent.parent.parent / 'resources/locales/de/LC_MESSAGES/messages.po'
+
+language = contextvars.ContextVar('language', default='en')
+# The translations of the running computation, like the translation context of a computation in German
+translations = contextvars.ContextVar('translations', default={})
+
+
+def get_language(suffix: str) -> str:
+    return f'{language.get()}_{suffix}'
+
+
+@pytest.mark.parametrize('mode', list(ArtifactExecutorMode))
+def test_artifact_executor_keeps_order_and_context(mode):
+    executor = ArtifactExecutor(mode=mode, max_workers=2)
+    tasks = [partial(get_language, suffix=str(index)) for index in range(4)]
+
+    token = language.set('de')
+    try:
+        received = executor.run(tasks)
+    finally:
+        language.reset(token)
+
+    assert received == ['de_0', 'de_1', 'de_2', 'de_3']
+
+
+def read_messages(catalogue: Path) -> dict[str, str]:
+    """Read the single-line messages of a gettext catalogue."""
+    return dict(re.findall(r'^msgid "(.+)"\nmsgstr "(.+)"$', catalogue.read_text(), flags=re.MULTILINE))
+
+
+def translate(message: str) -> str:
+    return translations.get().get(message, message)
+
+
+def test_artifact_executor_translates_artifacts_in_threads(compute_resources):
+    executor = ArtifactExecutor(mode=ArtifactExecutorMode.thread, max_workers=2)
+    census_data = pd.DataFrame(
+        {
+            'x_mp_100m': [4500050, 4500150],
+            'y_mp_100m': [3500050, 3500050],
+            'dominant_age': ['1949-1978', 'Unknown'],
+            'dominant_energy': ['Gas', 'Unknown'],
+        }
+    )
+    tasks = [
+        partial(build_gridded_artifact_classdata, census_data, compute_resources, output=output)
+        for output in ClassdataOutput
+    ]
+
+    token = translations.set(read_messages(GERMAN_MESSAGES))
+    try:
+        with patch('heating_emissions.components.gridded_emissions_artifact.tr', translate):
+            artifacts = executor.run(tasks)
+    finally:
+        translations.reset(token)
+
+    assert [artifact.name for artifact in artifacts] == ['Vorherrschendes Baujahr', 'Vorherrschender Energieträger']
+
+
+def test_artifact_executor_raises_task_errors():
+    executor = ArtifactExecutor(mode=ArtifactExecutorMode.thread, max_workers=2)
+
+    with pytest.raises(ZeroDivisionError):
+        executor.run([partial(get_language, suffix='0'), partial(divmod, 1, 0)])
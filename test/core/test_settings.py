@@ -0,0 +1,43 @@
+from sqlalchemy import NullPool
+
+from heating_emissions.core.settings import DatabasePoolMode, Settings
+
+DATABASE_SETTINGS = dict(
+    data_db_host='localhost',
+    data_db_port=5432,
+    data_db_name='db',
+    data_db_user='user',
+    data_db_password='password',
+    cdsapi_key='key',
+)
+
+
+def test_ca_database_engine_options_null_pool():
+    settings = Settings(**DATABASE_SETTINGS, data_db_pool_mode=DatabasePoolMode.null)
+
+    assert settings.ca_database_engine_options == {'poolclass': NullPool}
+
+
+def test_ca_database_engine_options_null_pool_ignores_prepare_threshold():
+    settings = Settings(**DATABASE_SETTINGS, data_db_pool_mode=DatabasePoolMode.null, data_db_prepare_threshold=0)
+
+    assert 'connect_args' not in settings.ca_database_engine_options
+
+
+def test_ca_database_engine_options_queue_pool():
+    settings = Settings(
+        **DATABASE_SETTINGS, data_db_pool_mode=DatabasePoolMode.queue, data_db_pool_size=3, data_db_prepare_threshold=0
+    )
+
+    assert settings.ca_database_engine_options == {
+        'pool_size': 3,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+        'connect_args': {'prepare_threshold': 0},
+    }
+
+
+def test_ca_database_engine_options_queue_pool_default_prepare_threshold():
+    settings = Settings(**DATABASE_SETTINGS, data_db_pool_mode=DatabasePoolMode.queue)
+
+    assert 'connect_args' not in settings.ca_database_engine_options